@@ -1,17 +1,20 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 """
-alarm.py – Email-Alarmierung für das Brunnen-Web-System.
+alarm.py – Alarmierung für das Brunnen-Web-System.
 
 Wird von wasserstand_logger.py (Sensoralarme) und
-webapp.py (Output-Alarme) verwendet.
+webapp.py (Output-Alarme) verwendet. Meldungen werden über die
+Outbox (outbox.py) per Email, Webhook und MQTT zugestellt.
 """
 
-import smtplib, ssl, time, socket
+import smtplib, ssl, time, socket, ast, logging
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 
 _ALARM_COOLDOWN_SECONDS = 3600  # max. 1 Email pro Alarm-Typ pro Stunde
+SENSOR_FAIL_THRESHOLD = 3       # Fehler in Folge bis zum Sensorausfall-Alarm
+DEFAULT_HOLD_S = 120.0          # Grenzwertregeln: Zustandswechsel erst nach 2 min (gegen Flattern)
 
 
 def send_alarm_email(cfg: dict, subject: str, body: str) -> tuple:
@@ -72,62 +75,367 @@ def smtp_configured(cfg: dict) -> bool:
     return bool(cfg.get("SMTP_HOST") and cfg.get("SMTP_TO"))
 
 
-def check_and_send(cfg: dict, channel: str, value: float,
-                   sensor_name: str, unit: str,
-                   last_sent: dict) -> dict:
+def notification_channels(cfg: dict) -> list:
+    """Gibt die aktuell konfigurierten Zustellkanäle zurück."""
+    channels = []
+    if smtp_configured(cfg):
+        channels.append("email")
+    if cfg.get("NOTIFY_WEBHOOK_EN") and str(cfg.get("NOTIFY_WEBHOOK_URL", "")).strip():
+        channels.append("webhook")
+    if cfg.get("NOTIFY_MQTT_EN") and cfg.get("MQTT_ENABLED"):
+        channels.append("mqtt")
+    return channels
+
+
+def deliver_email(cfg: dict, message: dict) -> tuple:
+    """Outbox-Kanal "email"."""
+    return send_alarm_email(cfg, message["subject"], message["body"])
+
+
+def deliver_webhook(cfg: dict, message: dict) -> tuple:
+    """Outbox-Kanal "webhook": POST der Meldung als JSON an NOTIFY_WEBHOOK_URL."""
+    import requests
+    url = str(cfg.get("NOTIFY_WEBHOOK_URL", "")).strip()
+    if not url:
+        return False, "Webhook-URL nicht konfiguriert."
+    headers = {}
+    token = str(cfg.get("NOTIFY_WEBHOOK_TOKEN", "")).strip()
+    if token:
+        headers["Authorization"] = f"Bearer {token}"
+    payload = {
+        "device_id": cfg.get("DEVICE_ID", socket.gethostname()),
+        "location": cfg.get("LOCATION", ""),
+        "subject": message["subject"],
+        "body": message["body"],
+        **message.get("meta", {}),
+    }
+    try:
+        r = requests.post(url, json=payload, headers=headers, timeout=10)
+    except requests.exceptions.RequestException as e:
+        return False, str(e)
+    if 200 <= r.status_code < 300:
+        return True, ""
+    return False, f"HTTP {r.status_code}"
+
+
+def dispatch(cfg: dict, subject: str, body: str, meta: dict = None, outbox=None) -> bool:
+    """
+    Stellt eine Alarmmeldung zu. Mit Outbox wird die Meldung dauerhaft für
+    alle konfigurierten Kanäle abgelegt, ohne Outbox direkt per Email versendet.
     """
-    Prüft Schwellwerte für einen Kanal und sendet bei Bedarf eine Alarm-Email.
+    if outbox is not None:
+        meta = dict(meta or {}, timestamp=time.time())
+        return outbox.enqueue(notification_channels(cfg), subject, body, meta) > 0
+    if not smtp_configured(cfg):
+        return False
+    ok, err = send_alarm_email(cfg, subject, body)
+    if not ok:
+        logging.warning(f"Alarm-Email fehlgeschlagen: {err}")
+    return ok
+
+
+# ============================================================
+# 🧮 ALARM-REGEL-ENGINE
+# ============================================================
+# Die Alarmdefinitionen werden einmal pro Config-Reload in kompakte
+# Evaluatoren übersetzt. Pro Messzyklus fällt je Regel nur konstante
+# Arbeit an (ein Vergleich, ggf. eine Steigung), kein Config-Lookup.
+
+ALARM_CHANNELS = ("A0", "A1", "A2", "A3")
+
+# Namen, die in Ausdrucksregeln (alarm_rules.json) verwendet werden dürfen
+_EXPR_FUNCS = {"abs": abs, "min": min, "max": max}
+_EXPR_GLOBALS = {"__builtins__": _EXPR_FUNCS}
+_EXPR_NODES = (
+    ast.Expression, ast.BoolOp, ast.And, ast.Or, ast.UnaryOp, ast.Not, ast.USub, ast.UAdd,
+    ast.BinOp, ast.Add, ast.Sub, ast.Mult, ast.Div, ast.Compare, ast.Lt, ast.LtE,
+    ast.Gt, ast.GtE, ast.Eq, ast.NotEq, ast.Name, ast.Load, ast.Constant, ast.Call,
+)
 
-    channel:    z.B. "A0"
-    value:      aktueller Messwert
-    sensor_name: Anzeigename des Sensors
-    unit:       Einheit
-    last_sent:  Dict {alarm_key: timestamp} für Rate-Limiting (wird in-place aktualisiert)
 
-    Gibt das aktualisierte last_sent-Dict zurück.
+class ThresholdCondition:
+    """Grenzwert mit Hysterese-Band auf einem Kanal (Min- oder Max-Alarm)."""
+    __slots__ = ("channel", "below", "limit", "release")
+
+    def __init__(self, channel: str, limit: float, below: bool, hysteresis: float = 0.0):
+        self.channel = channel
+        self.below = below
+        self.limit = limit
+        hyst = abs(hysteresis)
+        # Aktiver Alarm fällt erst jenseits des Hysterese-Bands wieder ab
+        self.release = limit + hyst if below else limit - hyst
+
+    def check(self, values: dict, now: float, active: bool):
+        value = values.get(self.channel)
+        if value is None:
+            return None, None
+        bound = self.release if active else self.limit
+        return (value < bound if self.below else value > bound), value
+
+
+class RateCondition:
     """
-    now = time.time()
-    ch = channel.upper()
+    Änderungsrate eines Kanals in Einheit pro Stunde.
+    limit < 0: Alarm wenn der Wert schneller fällt, limit > 0: wenn er schneller steigt.
+    Die Steigung wird über ein festes Zeitfenster gebildet (Referenzpunkt, O(1)).
+    """
+    __slots__ = ("channel", "limit", "release", "window_s", "_t_ref", "_v_ref", "_rate")
 
-    if not smtp_configured(cfg):
-        return last_sent
-
-    # Min-Alarm
-    if cfg.get(f"ALARM_{ch}_MIN_EN"):
-        threshold = float(cfg.get(f"ALARM_{ch}_MIN", 0.0))
-        key = f"{ch}_min"
-        if value < threshold:
-            last_time = last_sent.get(key, 0)
-            if now - last_time >= _ALARM_COOLDOWN_SECONDS:
-                subject = f"[BrunnenWeb] ⚠️ {sensor_name}: Wert unter Minimum"
-                body = (f"Sensor: {sensor_name} ({ch})\n"
-                        f"Aktueller Wert: {value:.3f} {unit}\n"
-                        f"Minimum-Grenze: {threshold:.3f} {unit}")
-                ok, _ = send_alarm_email(cfg, subject, body)
-                if ok:
-                    last_sent[key] = now
-
-    # Max-Alarm
-    if cfg.get(f"ALARM_{ch}_MAX_EN"):
-        threshold = float(cfg.get(f"ALARM_{ch}_MAX", 0.0))
-        key = f"{ch}_max"
-        if value > threshold:
-            last_time = last_sent.get(key, 0)
-            if now - last_time >= _ALARM_COOLDOWN_SECONDS:
-                subject = f"[BrunnenWeb] ⚠️ {sensor_name}: Wert über Maximum"
-                body = (f"Sensor: {sensor_name} ({ch})\n"
-                        f"Aktueller Wert: {value:.3f} {unit}\n"
-                        f"Maximum-Grenze: {threshold:.3f} {unit}")
-                ok, _ = send_alarm_email(cfg, subject, body)
-                if ok:
-                    last_sent[key] = now
-
-    return last_sent
+    def __init__(self, channel: str, limit_per_h: float, window_s: float = 600.0,
+                 hysteresis: float = 0.0):
+        self.channel = channel
+        self.limit = limit_per_h
+        hyst = abs(hysteresis)
+        self.release = limit_per_h + hyst if limit_per_h < 0 else limit_per_h - hyst
+        self.window_s = max(1.0, float(window_s))
+        self._t_ref = None
+        self._v_ref = None
+        self._rate = None
+
+    def check(self, values: dict, now: float, active: bool):
+        value = values.get(self.channel)
+        if value is None:
+            return None, None
+        if self._t_ref is None:
+            self._t_ref, self._v_ref = now, value
+            return None, None
+        dt = now - self._t_ref
+        if dt >= self.window_s:
+            self._rate = (value - self._v_ref) / dt * 3600.0
+            self._t_ref, self._v_ref = now, value
+        if self._rate is None:
+            return None, None
+        bound = self.release if active else self.limit
+        return (self._rate < bound if self.limit < 0 else self._rate > bound), self._rate
+
+    def take_state(self, other):
+        """Übernimmt den Steigungs-Referenzpunkt einer Vorgänger-Regel."""
+        if isinstance(other, RateCondition) and other.channel == self.channel:
+            self._t_ref, self._v_ref, self._rate = other._t_ref, other._v_ref, other._rate
+
+
+class ExpressionCondition:
+    """
+    Kanalübergreifender Ausdruck, z. B. "A0 - A3 > 2.0".
+    Optionaler clear-Ausdruck bildet die Hysterese (z. B. "A0 - A3 < 1.5").
+    """
+    __slots__ = ("names", "_code", "_clear_code")
+
+    def __init__(self, expr: str, clear: str = ""):
+        names = set()
+        self._code = _compile_expression(expr, names)
+        self._clear_code = _compile_expression(clear, names) if clear else None
+        self.names = tuple(sorted(names))
+
+    def check(self, values: dict, now: float, active: bool):
+        for name in self.names:
+            if values.get(name) is None:
+                return None, None
+        try:
+            if active and self._clear_code is not None:
+                return not eval(self._clear_code, _EXPR_GLOBALS, values), None
+            return bool(eval(self._code, _EXPR_GLOBALS, values)), None
+        except (ArithmeticError, TypeError, ValueError):
+            return None, None
+
+
+def _compile_expression(expr: str, names: set):
+    """Prüft einen Regelausdruck gegen eine Whitelist und kompiliert ihn."""
+    tree = ast.parse(str(expr).strip(), mode="eval")
+    for node in ast.walk(tree):
+        if not isinstance(node, _EXPR_NODES):
+            raise ValueError(f"Nicht erlaubter Ausdruck: {type(node).__name__}")
+        if isinstance(node, ast.Call):
+            if not isinstance(node.func, ast.Name) or node.func.id not in _EXPR_FUNCS:
+                raise ValueError("Nur abs(), min() und max() sind erlaubt.")
+        elif isinstance(node, ast.Name) and node.id not in _EXPR_FUNCS:
+            names.add(node.id)
+    return compile(tree, "<alarm_rule>", "eval")
+
+
+class AlarmRule:
+    """Eine kompilierte Alarmregel inklusive Zustand (aktiv, Haltezeit, letzter Versand)."""
+    __slots__ = ("key", "name", "unit", "kind", "limit", "condition", "hold_s",
+                 "active", "raised_at", "last_value", "last_sent", "last_clear_sent", "_pending_since")
+
+    def __init__(self, key: str, name: str, condition, kind: str,
+                 limit=None, unit: str = "", hold_s: float = 0.0):
+        self.key = key
+        self.name = name
+        self.unit = unit
+        self.kind = kind            # "min", "max", "rate" oder "expr"
+        self.limit = limit
+        self.condition = condition
+        self.hold_s = max(0.0, float(hold_s))
+        self.active = False
+        self.raised_at = 0.0        # Beginn der aktuellen (bzw. letzten) Alarm-Episode
+        self.last_value = None
+        self.last_sent = 0.0
+        self.last_clear_sent = 0.0
+        self._pending_since = None
+
+    def evaluate(self, values: dict, now: float):
+        """Gibt "raised", "cleared" oder None zurück."""
+        tripped, value = self.condition.check(values, now, self.active)
+        if tripped is None:
+            return None
+        if value is not None:
+            self.last_value = value
+        if tripped == self.active:
+            self._pending_since = None
+            return None
+        # Zustandswechsel erst nach Ablauf der Haltezeit übernehmen
+        if self._pending_since is None:
+            self._pending_since = now
+        if now - self._pending_since < self.hold_s:
+            return None
+        self._pending_since = None
+        self.active = tripped
+        if tripped:
+            self.raised_at = now
+        return "raised" if tripped else "cleared"
+
+    def message(self, event: str) -> tuple:
+        """Erzeugt (Betreff, Text) für ein Alarm-Ereignis."""
+        unit = f" {self.unit}" if self.unit else ""
+        value = "–" if self.last_value is None else f"{self.last_value:.3f}"
+        titles = {
+            "min": "Wert unter Minimum",
+            "max": "Wert über Maximum",
+            "rate": "Änderungsrate überschritten",
+            "expr": "Regel ausgelöst",
+        }
+        if event == "cleared":
+            subject = f"[BrunnenWeb] ✅ {self.name}: Alarm aufgehoben"
+        else:
+            subject = f"[BrunnenWeb] ⚠️ {self.name}: {titles.get(self.kind, 'Alarm')}"
+
+        if self.kind == "rate":
+            body = (f"Sensor: {self.name}\n"
+                    f"Aktuelle Änderung: {value}{unit}/h\n"
+                    f"Grenze: {self.limit:.3f}{unit}/h")
+        elif self.kind == "expr":
+            body = f"Regel: {self.name}\nBedingung: {self.limit}"
+        else:
+            label = "Minimum-Grenze" if self.kind == "min" else "Maximum-Grenze"
+            body = (f"Sensor: {self.name}\n"
+                    f"Aktueller Wert: {value}{unit}\n"
+                    f"{label}: {self.limit:.3f}{unit}")
+        if event == "cleared":
+            body += "\nDer Alarmzustand ist nicht mehr aktiv."
+        return subject, body
+
+
+def compile_rules(cfg: dict, extra_rules: list = None) -> list:
+    """
+    Übersetzt die ALARM_*-Parameter (und optionale Ausdrucksregeln aus
+    alarm_rules.json) in eine Liste von AlarmRule-Objekten.
+    """
+    rules = []
+    window_s = float(cfg.get("ALARM_RATE_WINDOW_S", 600) or 600)
+
+    for ch in ALARM_CHANNELS:
+        name = f"{cfg.get(f'NAME_{ch}', ch)} ({ch})"
+        unit = str(cfg.get(f"SENSOR_EINHEIT_{ch}", "")).strip()
+        hyst = float(cfg.get(f"ALARM_{ch}_HYST", 0.0) or 0.0)
+        hold = float(cfg.get(f"ALARM_{ch}_HOLD_S", DEFAULT_HOLD_S) or 0.0)
+
+        for kind, below in (("min", True), ("max", False)):
+            if not cfg.get(f"ALARM_{ch}_{kind.upper()}_EN"):
+                continue
+            limit = float(cfg.get(f"ALARM_{ch}_{kind.upper()}", 0.0))
+            rules.append(AlarmRule(f"{ch}_{kind}", name,
+                                   ThresholdCondition(ch, limit, below, hyst),
+                                   kind, limit, unit, hold))
+
+        if cfg.get(f"ALARM_{ch}_RATE_EN"):
+            limit = float(cfg.get(f"ALARM_{ch}_RATE", 0.0) or 0.0)
+            if limit:
+                rules.append(AlarmRule(f"{ch}_rate", name,
+                                       RateCondition(ch, limit, window_s),
+                                       "rate", limit, unit, hold))
+
+    for i, item in enumerate(extra_rules or []):
+        if not isinstance(item, dict) or not item.get("enabled", True):
+            continue
+        key = str(item.get("key") or f"expr_{i + 1}")
+        try:
+            cond = ExpressionCondition(item["expr"], item.get("clear", ""))
+        except (KeyError, SyntaxError, ValueError) as e:
+            logging.error(f"Alarmregel '{key}' ungültig: {e}")
+            continue
+        rules.append(AlarmRule(f"expr:{key}", item.get("name", key), cond, "expr",
+                               item["expr"], "", item.get("hold_s", 0.0)))
+    return rules
+
+
+class AlarmEngine:
+    """Hält die kompilierten Regeln und wertet sie einmal pro Messzyklus aus."""
+
+    def __init__(self, rules: list = None):
+        self.rules = []
+        self.replace_rules(rules or [])
+
+    def replace_rules(self, rules: list):
+        """Tauscht die Regeln nach einem Config-Reload, Zustand bleibt pro Key erhalten."""
+        previous = {r.key: r for r in self.rules}
+        for rule in rules:
+            old = previous.get(rule.key)
+            if old is None:
+                continue
+            rule.active = old.active
+            rule.raised_at = old.raised_at
+            rule.last_sent = old.last_sent
+            rule.last_clear_sent = old.last_clear_sent
+            rule.last_value = old.last_value
+            if isinstance(rule.condition, RateCondition):
+                rule.condition.take_state(old.condition)
+        self.rules = rules
+
+    def evaluate(self, values: dict, now: float = None) -> list:
+        """Gibt eine Liste von (rule, event) für alle Zustandswechsel zurück."""
+        now = time.time() if now is None else now
+        events = []
+        for rule in self.rules:
+            event = rule.evaluate(values, now)
+            if event:
+                events.append((rule, event))
+        return events
+
+
+def notify_rule_event(cfg: dict, rule: AlarmRule, event: str,
+                      now: float = None, outbox=None) -> bool:
+    """
+    Meldet ein Regel-Ereignis über dispatch().
+    Ein erneutes Auslösen innerhalb von _ALARM_COOLDOWN_SECONDS wird unterdrückt.
+    Aufhebungen werden nur gemeldet, wenn ALARM_CLEAR_NOTIFY_EN aktiv ist, das
+    Auslösen derselben Episode gemeldet wurde und die letzte Aufhebungsmeldung
+    länger als _ALARM_COOLDOWN_SECONDS zurückliegt – ein flatternder Sensor
+    erzeugt so höchstens ein Paar Meldungen pro Stunde.
+    """
+    now = time.time() if now is None else now
+    if event == "raised" and now - rule.last_sent < _ALARM_COOLDOWN_SECONDS:
+        return False
+    if event == "cleared":
+        if not cfg.get("ALARM_CLEAR_NOTIFY_EN", True):
+            return False
+        if not rule.last_sent or rule.last_sent < rule.raised_at:
+            return False        # Auslösen dieser Episode wurde nicht gemeldet
+        if now - rule.last_clear_sent < _ALARM_COOLDOWN_SECONDS:
+            return False
+    subject, body = rule.message(event)
+    meta = {"alarm": rule.key, "event": event, "value": rule.last_value}
+    ok = dispatch(cfg, subject, body, meta, outbox)
+    if ok and event == "raised":
+        rule.last_sent = now
+    elif ok:
+        rule.last_clear_sent = now
+    return ok
 
 
 def check_sensor_fail(cfg: dict, channel: str, sensor_name: str,
                       fail_counts: dict, last_sent: dict,
-                      fail_threshold: int = 3) -> tuple:
+                      fail_threshold: int = SENSOR_FAIL_THRESHOLD, outbox=None) -> tuple:
     """
     Zählt aufeinanderfolgende Sensor-Fehler. Sendet Alarm nach fail_threshold Fehlern.
     Gibt (fail_counts, last_sent) zurück.
@@ -136,7 +444,7 @@ def check_sensor_fail(cfg: dict, channel: str, sensor_name: str,
     ch = channel.upper()
     fail_counts[ch] = fail_counts.get(ch, 0) + 1
 
-    if not cfg.get("ALARM_SENSOR_FAIL_EN") or not smtp_configured(cfg):
+    if not cfg.get("ALARM_SENSOR_FAIL_EN") or not notification_channels(cfg):
         return fail_counts, last_sent
 
     if fail_counts[ch] >= fail_threshold:
@@ -146,8 +454,7 @@ def check_sensor_fail(cfg: dict, channel: str, sensor_name: str,
             subject = f"[BrunnenWeb] ❌ Sensorausfall: {sensor_name}"
             body = (f"Sensor: {sensor_name} ({ch})\n"
                     f"Fehler bei {fail_counts[ch]} aufeinanderfolgenden Messungen.")
-            ok, _ = send_alarm_email(cfg, subject, body)
-            if ok:
+            if dispatch(cfg, subject, body, {"alarm": key, "event": "raised"}, outbox):
                 last_sent[key] = now
 
     return fail_counts, last_sent
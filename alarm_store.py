@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+alarm_store.py – Persistenter Alarmzustand (SQLite).
+
+Speichert pro Alarm-Key den Zustand (aktiv/aufgehoben, quittiert),
+den Zeitpunkt der letzten Email und die Sensor-Fehlerzähler, damit ein
+Neustart des Loggers weder die Cooldown-Zeit zurücksetzt noch alle
+aktiven Alarme erneut auslöst. Zusätzlich wird ein Ereignisprotokoll
+(raised / acknowledged / cleared) geführt.
+
+Wird von wasserstand_logger.py (schreibend) und webapp.py
+(/api/alarms, Quittierung) verwendet.
+"""
+
+import sqlite3
+import threading
+import time
+
+_MAX_EVENTS = 1000   # Ereignisprotokoll auf die letzten N Einträge begrenzen
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS alarm_state (
+    key          TEXT PRIMARY KEY,
+    name         TEXT NOT NULL DEFAULT '',
+    active       INTEGER NOT NULL DEFAULT 0,
+    acknowledged INTEGER NOT NULL DEFAULT 0,
+    since        REAL,
+    last_value   REAL,
+    last_sent    REAL NOT NULL DEFAULT 0,
+    fail_count   INTEGER NOT NULL DEFAULT 0,
+    updated      REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_alarm_state_active ON alarm_state(active);
+CREATE TABLE IF NOT EXISTS alarm_events (
+    id      INTEGER PRIMARY KEY AUTOINCREMENT,
+    ts      REAL NOT NULL,
+    key     TEXT NOT NULL,
+    event   TEXT NOT NULL,
+    value   REAL,
+    message TEXT NOT NULL DEFAULT ''
+);
+"""
+
+
+class AlarmStore:
+    """Kleiner transaktionaler Speicher für Alarmzustände und -ereignisse."""
+
+    def __init__(self, db_path: str):
+        self._conn = sqlite3.connect(db_path, timeout=5, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.executescript(_SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    # ---------------------------------------------------------- Schreiben
+    def _upsert(self, key: str, now: float, **fields):
+        cols = ["key", "updated"] + list(fields)
+        vals = [key, now] + list(fields.values())
+        updates = ", ".join(f"{c}=excluded.{c}" for c in cols[1:])
+        self._conn.execute(
+            f"INSERT INTO alarm_state ({', '.join(cols)}) VALUES ({', '.join('?' * len(cols))}) "
+            f"ON CONFLICT(key) DO UPDATE SET {updates}",
+            vals,
+        )
+
+    def _log_event(self, key: str, event: str, now: float, value=None, message: str = ""):
+        cur = self._conn.execute(
+            "INSERT INTO alarm_events (ts, key, event, value, message) VALUES (?, ?, ?, ?, ?)",
+            (now, key, event, value, message),
+        )
+        # Protokoll gelegentlich kürzen statt bei jedem Insert
+        if cur.lastrowid % 100 == 0:
+            self._conn.execute("DELETE FROM alarm_events WHERE id <= ?",
+                               (cur.lastrowid - _MAX_EVENTS,))
+
+    def record_event(self, key: str, event: str, name: str = "",
+                     value=None, message: str = "", now: float = None):
+        """Speichert einen Zustandswechsel ("raised" oder "cleared") atomar."""
+        now = time.time() if now is None else now
+        active = 1 if event == "raised" else 0
+        with self._lock, self._conn:
+            fields = {"active": active, "acknowledged": 0, "last_value": value}
+            if name:
+                fields["name"] = name
+            if active:
+                fields["since"] = now
+            self._upsert(key, now, **fields)
+            self._log_event(key, event, now, value, message)
+
+    def set_last_sent(self, key: str, ts: float):
+        with self._lock, self._conn:
+            self._upsert(key, time.time(), last_sent=ts)
+
+    def set_fail_count(self, channel: str, count: int):
+        with self._lock, self._conn:
+            self._upsert(f"{channel.upper()}_fail", time.time(), fail_count=int(count))
+
+    def acknowledge(self, key: str, now: float = None) -> bool:
+        """Quittiert einen aktiven Alarm. Gibt False zurück, wenn er nicht aktiv ist."""
+        now = time.time() if now is None else now
+        with self._lock, self._conn:
+            cur = self._conn.execute(
+                "UPDATE alarm_state SET acknowledged=1, updated=? "
+                "WHERE key=? AND active=1 AND acknowledged=0",
+                (now, key),
+            )
+            if cur.rowcount == 0:
+                return False
+            self._log_event(key, "acknowledged", now)
+        return True
+
+    def clear_missing(self, keys, now: float = None):
+        """Hebt aktive Regel-Alarme auf, deren Regel nicht mehr konfiguriert ist."""
+        now = time.time() if now is None else now
+        keys = set(keys)
+        with self._lock, self._conn:
+            rows = self._conn.execute(
+                "SELECT key FROM alarm_state WHERE active=1 AND key NOT LIKE '%\\_fail' ESCAPE '\\'"
+            ).fetchall()
+            for row in rows:
+                if row["key"] not in keys:
+                    self._upsert(row["key"], now, active=0)
+                    self._log_event(row["key"], "cleared", now, message="Regel entfernt")
+
+    # ------------------------------------------------------------- Lesen
+    def load(self) -> dict:
+        """Gibt alle gespeicherten Zustände als {key: dict} zurück."""
+        with self._lock:
+            rows = self._conn.execute("SELECT * FROM alarm_state").fetchall()
+        return {row["key"]: dict(row) for row in rows}
+
+    def restore_rules(self, rules):
+        """Setzt active/raised_at/last_sent/last_value der kompilierten Regeln aus dem Speicher."""
+        states = self.load()
+        for rule in rules:
+            st = states.get(rule.key)
+            if st:
+                rule.active = bool(st["active"])
+                rule.raised_at = float(st["since"] or 0.0)
+                rule.last_sent = float(st["last_sent"] or 0.0)
+                rule.last_value = st["last_value"]
+
+    def last_sent_map(self) -> dict:
+        return {k: float(v["last_sent"]) for k, v in self.load().items() if v["last_sent"]}
+
+    def fail_counts(self) -> dict:
+        return {k[:-len("_fail")]: int(v["fail_count"])
+                for k, v in self.load().items() if k.endswith("_fail") and v["fail_count"]}
+
+    def version(self) -> str:
+        """Ändert sich mit jedem Schreibvorgang (letztes Ereignis, letzte Zustandsänderung)."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT (SELECT MAX(id) FROM alarm_events), (SELECT MAX(updated) FROM alarm_state)"
+            ).fetchone()
+        return f"{row[0]}:{row[1]!r}"
+
+    def list_active(self) -> list:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT key, name, acknowledged, since, last_value, last_sent "
+                "FROM alarm_state WHERE active=1 ORDER BY since ASC"
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def list_states(self) -> list:
+        """Zustand aller bekannten Regeln (eine Zeile pro Regel, für /metrics)."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT key, name, active, acknowledged FROM alarm_state ORDER BY key"
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def list_events(self, limit: int = 100) -> list:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT ts, key, event, value, message FROM alarm_events ORDER BY id DESC LIMIT ?",
+                (int(limit),),
+            ).fetchall()
+        return [dict(row) for row in rows]
@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+backlog_drain.py – Nachsenden des Offline-Rückstands im Hintergrund.
+
+Der Logger schickt die Messpunkte des aktuellen Zyklus sofort (Vorrangspur),
+damit Grafana nach einem Wiederverbinden gleich aktuelle Werte zeigt. Der
+Rückstand – verdichtete Altdaten und alle Queue-Einträge unterhalb von
+live_floor – wird hier parallel in einem eigenen Thread (eigene SQLite-
+Verbindung) vom ältesten Ende her übertragen:
+
+- Blockgröße nach gemessener Schreiblatenz (AIMD): unter der Ziellatenz wächst
+  der Block um 25 %, darüber halbiert er sich.
+- Obergrenze Punkte pro Sekunde (Pause zwischen den Blöcken), damit die oft
+  schmale Uplink-Verbindung für die Live-Daten frei bleibt.
+- Nach einem Fehler exponentielles Backoff (BACKOFF_MIN_S … BACKOFF_MAX_S).
+- Durchsatz über die letzten RATE_WINDOW_S ergibt mit der Tiefe die Restzeit.
+- queue_lock umschließt Lesen → Senden → Löschen eines Blocks. Die Verdichtung
+  im Logger nimmt ihn ebenfalls, damit sie keine Zeilen umschreibt, die gerade
+  unterwegs sind (sonst kämen sie doppelt in InfluxDB an).
+"""
+
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import deque
+
+import queue_retention
+
+CHUNK_MIN = 250
+CHUNK_MAX = 5000
+CHUNK_START = 500
+IDLE_WAIT_S = 5.0
+BACKOFF_MIN_S = 5.0
+BACKOFF_MAX_S = 300.0
+RATE_WINDOW_S = 60.0
+
+
+class BacklogDrainer:
+    """
+    send_fn(entries) -> bool       : schreibt eine Liste von Queue-Einträgen (InfluxDB)
+    settings_fn() -> (enabled, max_pps, target_latency_s)
+    stats                          : cycle_stats.CycleStats (thread-sicher) oder None
+    """
+
+    def __init__(self, db_path: str, send_fn, settings_fn, stats=None):
+        self.db_path = db_path
+        self.send_fn = send_fn
+        self.settings_fn = settings_fn
+        self.stats = stats
+        self.live_floor = None        # ids ab hier gehören der Vorrangspur
+        self.chunk = float(CHUNK_START)
+        self.state = "idle"           # idle / draining / backoff / disabled
+        self.last_latency_s = None
+        self.uplink_ok = False        # letzter Schreibversuch erfolgreich
+        self._backoff_s = 0.0
+        self._retry_at = 0.0
+        self._sent = deque()          # (monotonic, punkte) für die Rate
+        self._drain_started = None
+        self.queue_lock = threading.Lock()   # ein Block in Arbeit (Lesen → Senden → Löschen)
+        self._stop = threading.Event()
+        self._thread = None
+
+    # ------------------------------------------------------------
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True, name="backlog-drain")
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def note_live_result(self, ok: bool):
+        """Ergebnis der Vorrangspur – ein Erfolg beendet ein laufendes Backoff."""
+        self.uplink_ok = ok
+        if ok and self.state == "backoff":
+            self._retry_at = 0.0
+
+    def rate_pps(self) -> float:
+        now = time.monotonic()
+        while self._sent and now - self._sent[0][0] > RATE_WINDOW_S:
+            self._sent.popleft()
+        if not self._sent or self._drain_started is None:
+            return 0.0
+        span = max(1.0, min(RATE_WINDOW_S, now - self._drain_started))
+        return sum(n for _, n in self._sent) / span
+
+    def status(self, backlog_depth: int = None) -> dict:
+        rate = self.rate_pps()
+        eta = None
+        if backlog_depth is not None and rate > 0 and self.state == "draining":
+            eta = round(backlog_depth / rate)
+        return {
+            "state": self.state,
+            "chunk": int(self.chunk),
+            "rate_pps": round(rate, 1),
+            "latency_ms": round(self.last_latency_s * 1000.0, 1) if self.last_latency_s is not None else None,
+            "eta_s": eta,
+        }
+
+    # ------------------------------------------------------------
+    def _incr(self, name: str, n: int = 1):
+        if self.stats:
+            self.stats.incr(name, n)
+
+    def _fetch(self, conn, limit: int):
+        """Älteste Einträge: erst verdichtete Altdaten, dann offline_queue unterhalb live_floor."""
+        for table in queue_retention.TABLES:
+            if table == queue_retention.QUEUE_TABLE and self.live_floor is not None:
+                rows = conn.execute(f"SELECT id, payload FROM {table} WHERE id < ? ORDER BY id ASC LIMIT ?",
+                                    (self.live_floor, limit)).fetchall()
+            else:
+                rows = conn.execute(f"SELECT id, payload FROM {table} ORDER BY id ASC LIMIT ?",
+                                    (limit,)).fetchall()
+            if rows:
+                return table, rows
+        return None, []
+
+    def _delete(self, conn, table: str, ids: list):
+        with conn:
+            conn.execute(f"DELETE FROM {table} WHERE id <= ? AND id >= ?", (max(ids), min(ids)))
+
+    def _adapt(self, ok: bool, n: int, latency_s: float, target_s: float):
+        if not ok:
+            self.chunk = float(CHUNK_MIN)
+            self._backoff_s = min(BACKOFF_MAX_S, max(BACKOFF_MIN_S, self._backoff_s * 2))
+            return
+        self._backoff_s = 0.0
+        if latency_s > target_s:
+            self.chunk = max(CHUNK_MIN, self.chunk / 2)
+        elif n >= int(self.chunk):    # nur wachsen, wenn der Block auch voll war
+            self.chunk = min(CHUNK_MAX, self.chunk * 1.25)
+
+    def _run(self):
+        conn = sqlite3.connect(self.db_path, timeout=5)
+        try:
+            while not self._stop.is_set():
+                pause = self._step(conn)
+                self._stop.wait(pause)
+        finally:
+            conn.close()
+
+    def _step(self, conn) -> float:
+        """Ein Block; gibt die Wartezeit bis zum nächsten zurück."""
+        try:
+            enabled, max_pps, target_s = self.settings_fn()
+        except Exception:
+            enabled, max_pps, target_s = False, 0, 0
+        if not enabled:
+            self.state = "disabled"
+            return IDLE_WAIT_S
+        if self.state == "backoff" and time.monotonic() < self._retry_at:
+            return min(1.0, self._retry_at - time.monotonic())
+        with self.queue_lock:
+            return self._send_block(conn, max_pps, target_s)
+
+    def _send_block(self, conn, max_pps, target_s) -> float:
+        try:
+            table, rows = self._fetch(conn, int(self.chunk))
+        except sqlite3.Error as e:
+            logging.warning(f"Backlog: Queue nicht lesbar: {e}")
+            return IDLE_WAIT_S
+        if not rows:
+            if self.state != "idle" and self._drain_started is not None:
+                logging.info("✅ Offline-Rückstand vollständig nachgesendet.")
+            self.state = "idle"
+            self._drain_started = None
+            return IDLE_WAIT_S
+
+        ids, entries, bad = [], [], 0
+        for rid, payload in rows:
+            ids.append(rid)
+            try:
+                entries.append(json.loads(payload))
+            except ValueError:
+                bad += 1
+        if self.state == "backoff":
+            self._incr("flush_retries")
+
+        t0 = time.monotonic()
+        try:
+            ok = bool(self.send_fn(entries)) if entries else True
+        except Exception as e:
+            logging.error(f"❌ Backlog-Senden fehlgeschlagen: {e}")
+            ok = False
+        latency = time.monotonic() - t0
+        self.last_latency_s = latency
+        self.uplink_ok = ok
+        self._adapt(ok, len(rows), latency, target_s)
+
+        if not ok:
+            self.state = "backoff"
+            self._retry_at = time.monotonic() + self._backoff_s
+            return min(1.0, self._backoff_s)
+
+        try:
+            self._delete(conn, table, ids)
+        except sqlite3.Error as e:
+            logging.warning(f"Backlog: gesendete Einträge nicht löschbar: {e}")
+        if bad:
+            logging.warning(f"Backlog: {bad} korrumpierte Queue-Einträge verworfen")
+            self._incr("points_dropped", bad)
+        self._incr("points_flushed", len(entries))
+        self._incr("backlog_chunks")
+        if self.stats:
+            self.stats.observe("backlog", latency * 1000.0)
+        if self._drain_started is None:
+            self._drain_started = time.monotonic()
+        self.state = "draining"
+        self._sent.append((time.monotonic(), len(rows)))
+
+        # Punkte/s-Grenze: die Latenz zählt zur Pause
+        return max(0.0, len(rows) / max_pps - latency) if max_pps else 0.0
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+cycle_stats.py – Laufzeitmessung der Logger-Zyklen.
+
+Jede Stufe des Messzyklus (ADC, Queue, BMP280, Reed, Snapshot, Flush, MQTT …)
+wird mit time.perf_counter() gemessen. Pro Stufe bleiben die letzten
+WINDOW Messungen für p50/p95/max erhalten, dazu kumulative Histogramm-Buckets
+(für /metrics). Zähler (Punkte gepuffert/gesendet/verworfen, Fehler) und
+Momentwerte (Queue-Tiefe, MQTT verbunden) ergänzen das Bild.
+
+Der Logger schreibt einmal pro Zyklus logger_stats.json (atomar, im
+tmpfs-State-Verzeichnis, siehe state_store.py), die Webapp liest nur diese
+Datei – kein gemeinsamer Zustand, kein Socket.
+"""
+
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+WINDOW = 512                      # Messungen pro Stufe für die Perzentile
+BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+
+class StageTimer:
+    __slots__ = ("samples", "buckets", "count", "sum_ms", "last_ms")
+
+    def __init__(self):
+        self.samples = deque(maxlen=WINDOW)
+        self.buckets = [0] * len(BUCKETS_MS)
+        self.count = 0
+        self.sum_ms = 0.0
+        self.last_ms = 0.0
+
+    def add(self, ms: float):
+        self.samples.append(ms)
+        self.count += 1
+        self.sum_ms += ms
+        self.last_ms = ms
+        for i, bound in enumerate(BUCKETS_MS):
+            if ms <= bound:
+                self.buckets[i] += 1
+                break
+
+    def summary(self) -> dict:
+        ordered = sorted(self.samples)
+        n = len(ordered)
+
+        def pct(p):
+            return round(ordered[min(n - 1, int(p * n))], 2) if n else 0.0
+
+        # Buckets kumulativ (Prometheus-Semantik: Anzahl <= Grenze)
+        cumulative, total = [], 0
+        for c in self.buckets:
+            total += c
+            cumulative.append(total)
+        return {
+            "count": self.count,
+            "sum_ms": round(self.sum_ms, 2),
+            "last_ms": round(self.last_ms, 2),
+            "p50_ms": pct(0.50),
+            "p95_ms": pct(0.95),
+            "max_ms": round(ordered[-1], 2) if n else 0.0,
+            "buckets": cumulative,
+        }
+
+
+class CycleStats:
+    def __init__(self, path: str):
+        self.path = path
+        self.started = time.time()
+        self.cycles = 0
+        self.stages = {}
+        self.counters = {}
+        self.gauges = {}
+        self._lap_t0 = None
+        self._lock = threading.Lock()    # observe/incr/gauge auch aus dem Backlog-Thread
+
+    def lap(self, name: str = None):
+        """Zeit seit dem letzten lap() als Stufe name verbuchen (None = nur Startpunkt setzen)."""
+        now = time.perf_counter()
+        if name is not None and self._lap_t0 is not None:
+            self.observe(name, (now - self._lap_t0) * 1000.0)
+        self._lap_t0 = now
+
+    @contextmanager
+    def stage(self, name: str):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, (time.perf_counter() - t0) * 1000.0)
+
+    def observe(self, name: str, ms: float):
+        with self._lock:
+            timer = self.stages.get(name)
+            if timer is None:
+                timer = self.stages[name] = StageTimer()
+            timer.add(ms)
+
+    def incr(self, name: str, n: int = 1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def update_counters(self, values: dict):
+        """Absolute Zählerstände übernehmen (z.B. aus state_store.flash_stats())."""
+        with self._lock:
+            self.counters.update(values)
+
+    def gauge(self, name: str, value):
+        with self._lock:
+            self.gauges[name] = value
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "updated": time.time(),
+                "started": self.started,
+                "pid": os.getpid(),
+                "cycles": self.cycles,
+                "bucket_bounds_ms": list(BUCKETS_MS),
+                "stages": {name: t.summary() for name, t in self.stages.items()},
+                "counters": dict(self.counters),
+                "gauges": dict(self.gauges),
+            }
+
+    def end_cycle(self):
+        """Zyklus abschließen und Snapshot atomar schreiben."""
+        self.cycles += 1
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.snapshot(), f)
+        os.replace(tmp, self.path)
+
+
+def load(path: str) -> dict:
+    """Liest einen Snapshot; {} wenn (noch) keiner existiert."""
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
@@ -0,0 +1,340 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+db_backup.py – Schnappschuss von offline_cache.db nach Nextcloud/WebDAV.
+
+Die Datenbank enthält alles, was lokal noch nicht (oder nur hier) liegt:
+Offline-Queue, MQTT-Puffer, Alarmzustand, Outbox und Ereignisprotokoll der
+Ausgänge. Stirbt die SD-Karte während eines Influx-Ausfalls, sind diese Daten
+mit dem Schnappschuss nicht verloren.
+
+Ablauf (jeder Schritt mit flachem Speicherbedarf):
+1. SQLite-Online-Backup (Connection.backup) in data/backup_tmp/. Die Quelle
+   läuft im WAL-Modus: das Backup ist eine Lese-Transaktion, der Logger
+   schreibt währenddessen weiter. Ein Backup in Häppchen würde bei jedem
+   Logger-Write von vorn beginnen – deshalb ein einziger Schritt.
+2. PRAGMA quick_check auf der Kopie, dann gzip in Blöcken (deterministisch,
+   mtime=0) und Löschen der unkomprimierten Kopie.
+3. Upload in Teilen von CHUNK_BYTES über die Nextcloud-Chunking-API
+   (remote.php/dav/uploads/…, danach MOVE an das Ziel). Der Stand liegt in
+   data/db_backup_state.json; ein abgebrochener Upload wird beim nächsten
+   Lauf fortgesetzt – vorhandene Teile fragt PROPFIND ab; passen Größe oder
+   SHA-256 der lokalen .gz nicht mehr, gibt es einen neuen Schnappschuss. Ohne Chunking
+   (anderer WebDAV-Server) geht die Datei als ein gestreamter PUT hinaus.
+
+Auf dem Server bleiben DB_BACKUP_KEEP Schnappschüsse pro Gerät
+(<DEVICE_ID>_db_<zeit>.sqlite.gz).
+
+Aufruf ohne Webapp (z.B. per cron):
+    python3 db_backup.py
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import socket
+import sqlite3
+import sys
+import time
+import uuid
+from xml.etree import ElementTree as ET
+
+import requests
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DB_PATH = os.path.join(BASE_DIR, "data", "offline_cache.db")
+CONFIG_PATH = os.path.join(BASE_DIR, "config", "config.json")
+WORK_DIR = os.path.join(BASE_DIR, "data", "backup_tmp")
+STATE_FILE = os.path.join(BASE_DIR, "data", "db_backup_state.json")
+
+CHUNK_BYTES = 10 * 1024 * 1024     # Nextcloud verlangt ≥ 5 MB pro Teil (außer dem letzten)
+READ_BLOCK = 1024 * 1024
+MAX_RESUME_AGE_S = 20 * 3600       # Nextcloud räumt unfertige Uploads nach 24 h ab
+CHUNK_RETRIES = 3
+
+
+class BackupError(Exception):
+    pass
+
+
+def _prefix(cfg) -> str:
+    device_id = cfg.get("DEVICE_ID", socket.gethostname()).strip() or "brunnen"
+    return "".join(c if c.isalnum() or c in "-_." else "_" for c in device_id)
+
+
+def _dav_root(cfg) -> str:
+    return f"{cfg.get('NEXTCLOUD_URL', '').rstrip('/')}/remote.php/dav"
+
+
+def _target_folder(cfg) -> str:
+    path = cfg.get("NEXTCLOUD_PATH", "Brunnen/Backups").strip("/")
+    return f"{_dav_root(cfg)}/files/{cfg.get('NEXTCLOUD_USER', '')}/{path}"
+
+
+def _load_state() -> dict:
+    try:
+        with open(STATE_FILE) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_state(state: dict):
+    tmp = STATE_FILE + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp, STATE_FILE)
+
+
+def _clear_state(state: dict):
+    try:
+        os.remove(state.get("path", ""))
+    except OSError:
+        pass
+    try:
+        os.remove(STATE_FILE)
+    except OSError:
+        pass
+
+
+# ============================================================
+# 📸 SCHNAPPSCHUSS
+# ============================================================
+class _HashingWriter:
+    """Schreibt in eine Datei und bildet dabei SHA-256 über die geschriebenen Bytes."""
+
+    def __init__(self, f):
+        self._f = f
+        self.digest = hashlib.sha256()
+
+    def write(self, data):
+        self.digest.update(data)
+        return self._f.write(data)
+
+    def flush(self):
+        self._f.flush()
+
+
+def _file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(READ_BLOCK), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def make_snapshot(cfg, db_path: str = DB_PATH, progress=None) -> dict:
+    """Online-Backup → quick_check → gzip. Gibt den Upload-Zustand zurück."""
+    os.makedirs(WORK_DIR, exist_ok=True)
+    ts = time.strftime("%Y-%m-%d_%H-%M-%S")
+    raw_path = os.path.join(WORK_DIR, "offline_cache.snapshot.db")
+    gz_path = os.path.join(WORK_DIR, f"{_prefix(cfg)}_db_{ts}.sqlite.gz")
+    if os.path.exists(raw_path):
+        os.remove(raw_path)
+
+    if progress:
+        progress(5, "Schnappschuss der Datenbank …")
+    src = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True, timeout=10)
+    dst = sqlite3.connect(raw_path)
+    try:
+        src.backup(dst)                # ein Schritt = eine Lese-Transaktion (WAL: Logger schreibt weiter)
+        check = dst.execute("PRAGMA quick_check").fetchone()[0]
+    finally:
+        dst.close()
+        src.close()
+    if check != "ok":
+        os.remove(raw_path)
+        raise BackupError(f"Schnappschuss fehlerhaft: {check}")
+
+    if progress:
+        progress(25, "Komprimiere …")
+    with open(raw_path, "rb") as fin, open(gz_path, "wb") as fout:
+        out = _HashingWriter(fout)
+        with gzip.GzipFile(fileobj=out, mode="wb", compresslevel=6, mtime=0) as gz:
+            while True:
+                block = fin.read(READ_BLOCK)
+                if not block:
+                    break
+                gz.write(block)
+    os.remove(raw_path)
+
+    state = {"path": gz_path, "name": os.path.basename(gz_path), "size": os.path.getsize(gz_path),
+             "sha256": out.digest.hexdigest(), "created": time.time(), "upload_id": None}
+    _save_state(state)
+    return state
+
+
+# ============================================================
+# ☁️ UPLOAD
+# ============================================================
+class _FileSlice:
+    """Ausschnitt einer Datei als Stream mit Länge – requests sendet ihn blockweise."""
+
+    def __init__(self, path: str, offset: int, length: int):
+        self._f = open(path, "rb")
+        self._f.seek(offset)
+        self._left = length
+        self._length = length
+
+    def __len__(self):
+        return self._length
+
+    def read(self, size=-1):
+        if self._left <= 0:
+            return b""
+        size = self._left if size is None or size < 0 else min(size, self._left)
+        data = self._f.read(min(size, READ_BLOCK))
+        self._left -= len(data)
+        return data
+
+    def close(self):
+        self._f.close()
+
+
+def _ensure_folders(session, cfg, auth):
+    parts = cfg.get("NEXTCLOUD_PATH", "Brunnen/Backups").strip("/").split("/")
+    for i in range(1, len(parts) + 1):
+        url = f"{_dav_root(cfg)}/files/{cfg.get('NEXTCLOUD_USER', '')}/{'/'.join(parts[:i])}"
+        r = session.request("MKCOL", url, auth=auth, timeout=15)
+        if r.status_code not in (201, 405):
+            raise BackupError(f"Ordner '{'/'.join(parts[:i])}' konnte nicht angelegt werden (HTTP {r.status_code})")
+
+
+def _propfind(session, url, auth) -> list:
+    """[(name, größe)] der Einträge eines Ordners; None, wenn es den Ordner nicht gibt."""
+    body = ('<?xml version="1.0"?><d:propfind xmlns:d="DAV:"><d:prop><d:getcontentlength/>'
+            '</d:prop></d:propfind>')
+    r = session.request("PROPFIND", url + "/", auth=auth, data=body, timeout=30,
+                        headers={"Depth": "1", "Content-Type": "application/xml"})
+    if r.status_code == 404:
+        return None
+    if r.status_code != 207:
+        raise BackupError(f"PROPFIND fehlgeschlagen (HTTP {r.status_code})")
+    ns = {"d": "DAV:"}
+    entries = []
+    for resp in ET.fromstring(r.content).findall("d:response", ns):
+        name = (resp.findtext("d:href", namespaces=ns) or "").rstrip("/").split("/")[-1]
+        size = resp.findtext(".//d:getcontentlength", namespaces=ns)
+        entries.append((name, int(size) if size and size.isdigit() else None))
+    return entries
+
+
+def _put(session, url, state, offset, length, auth, headers):
+    last = None
+    for attempt in range(CHUNK_RETRIES):
+        body = _FileSlice(state["path"], offset, length)
+        try:
+            r = session.put(url, data=body, auth=auth, headers=headers, timeout=(15, 120))
+            if r.status_code in (200, 201, 204):
+                return
+            last = f"HTTP {r.status_code}"
+            if r.status_code < 500 and r.status_code != 429:
+                break
+        except requests.exceptions.RequestException as e:
+            last = str(e)
+        finally:
+            body.close()
+        time.sleep(2 * (attempt + 1))
+    raise BackupError(last or "Upload fehlgeschlagen")
+
+
+def upload(session, cfg, state: dict, progress=None):
+    """Teil-Upload mit Fortsetzung; Fallback: ein gestreamter PUT."""
+    auth = (cfg.get("NEXTCLOUD_USER", ""), cfg.get("NEXTCLOUD_PASSWORD", ""))
+    _ensure_folders(session, cfg, auth)
+    target = f"{_target_folder(cfg)}/{state['name']}"
+    size = state["size"]
+    common = {"Destination": target, "OC-Total-Length": str(size)}
+
+    if not state.get("upload_id"):
+        state["upload_id"] = f"brunnen-{uuid.uuid4().hex}"
+        _save_state(state)
+    upload_url = f"{_dav_root(cfg)}/uploads/{cfg.get('NEXTCLOUD_USER', '')}/{state['upload_id']}"
+
+    existing = _propfind(session, upload_url, auth)
+    if existing is None:
+        r = session.request("MKCOL", upload_url, auth=auth, headers={"Destination": target}, timeout=15)
+        if r.status_code not in (201, 405):
+            # kein Nextcloud-Chunking → ganze Datei als Stream
+            if progress:
+                progress(50, "Lade hoch (ohne Teilung) …")
+            _put(session, target, state, 0, size, auth, {"Content-Type": "application/gzip"})
+            return
+        existing = []
+    done = {int(name): sz for name, sz in existing if name.isdigit()}
+
+    chunks = max(1, -(-size // CHUNK_BYTES))
+    for n in range(1, chunks + 1):
+        offset = (n - 1) * CHUNK_BYTES
+        length = min(CHUNK_BYTES, size - offset)
+        if done.get(n) == length:
+            continue                   # schon auf dem Server (fortgesetzter Upload)
+        if progress:
+            progress(50 + int(45 * (n - 1) / chunks), f"Lade Teil {n}/{chunks} hoch …")
+        try:
+            _put(session, f"{upload_url}/{n}", state, offset, length, auth, common)
+        except BackupError as e:
+            raise BackupError(f"Upload bei Teil {n}/{chunks} unterbrochen ({e}) – "
+                              "wird beim nächsten Lauf fortgesetzt")
+
+    if progress:
+        progress(96, "Setze Teile zusammen …")
+    r = session.request("MOVE", f"{upload_url}/.file", auth=auth, headers=common, timeout=(15, 600))
+    if r.status_code not in (201, 204):
+        raise BackupError(f"Zusammensetzen fehlgeschlagen (HTTP {r.status_code})")
+
+
+def cleanup(session, cfg, keep: int):
+    """Älteste DB-Schnappschüsse dieses Geräts über keep hinaus löschen."""
+    auth = (cfg.get("NEXTCLOUD_USER", ""), cfg.get("NEXTCLOUD_PASSWORD", ""))
+    entries = _propfind(session, _target_folder(cfg), auth) or []
+    prefix = f"{_prefix(cfg)}_db_"
+    names = sorted((n for n, _ in entries if n.startswith(prefix) and n.endswith(".sqlite.gz")), reverse=True)
+    for name in names[max(1, keep):]:
+        try:
+            session.delete(f"{_target_folder(cfg)}/{name}", auth=auth, timeout=15)
+        except requests.exceptions.RequestException:
+            pass
+
+
+def run(cfg, db_path: str = DB_PATH, session=None, progress=None) -> tuple:
+    """Schnappschuss (oder Fortsetzung des letzten) hochladen. Gibt (ok, message) zurück."""
+    if not (cfg.get("NEXTCLOUD_URL") and cfg.get("NEXTCLOUD_USER") and cfg.get("NEXTCLOUD_PASSWORD")):
+        return False, "Nextcloud nicht konfiguriert."
+    session = session or requests.Session()
+    try:
+        state = _load_state()
+        resumable = (state and os.path.exists(state.get("path", ""))
+                     and time.time() - state.get("created", 0) < MAX_RESUME_AGE_S
+                     and os.path.getsize(state["path"]) == state.get("size")
+                     and _file_sha256(state["path"]) == state.get("sha256"))
+        if not resumable:
+            _clear_state(state)
+            state = make_snapshot(cfg, db_path, progress)
+        elif progress:
+            progress(50, f"Setze Upload von {state['name']} fort …")
+
+        upload(session, cfg, state, progress)
+        _clear_state(state)
+        cleanup(session, cfg, int(cfg.get("DB_BACKUP_KEEP", 7)))
+        mb = state["size"] / 1e6
+        return True, f"{state['name']} ({mb:.1f} MB)"
+    except BackupError as e:
+        return False, str(e)
+    except sqlite3.Error as e:
+        return False, f"Schnappschuss fehlgeschlagen: {e}"
+    except requests.exceptions.RequestException as e:
+        return False, f"Verbindung fehlgeschlagen ({e}) – wird beim nächsten Lauf fortgesetzt"
+
+
+def main():
+    with open(CONFIG_PATH) as f:
+        cfg = json.load(f)
+    ok, msg = run(cfg, progress=lambda pct, message: print(f"[{pct:3d}%] {message}", flush=True))
+    print(("✅ " if ok else "❌ ") + msg)
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
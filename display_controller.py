@@ -6,13 +6,15 @@ from datetime import datetime, timezone
 
 import lgpio
 
+import state_store
+
 from luma.core.interface.serial import i2c
 from luma.oled.device import sh1106
 from luma.core.render import canvas
 from PIL import ImageFont
 
 BASE_DIR = "/opt/brunnen_web"
-LATEST_JSON = os.path.join(BASE_DIR, "data", "latest_measurement.json")
+LATEST_JSON = state_store.volatile_path("latest_measurement.json")
 DB_PATH     = os.path.join(BASE_DIR, "data", "offline_cache.db")
 
 # --- GPIO Button ---
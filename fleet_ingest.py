@@ -0,0 +1,723 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+fleet_ingest.py – Zentraler Ingest-Dienst: MQTT vieler Geräte → InfluxDB.
+
+Statt dass jeder Pi mit eigenem Token einzelne kleine Writes an InfluxDB
+schickt, veröffentlichen die Geräte per MQTT (wasserstand_logger.py,
+Kanal- oder Batch-Modus) und dieser Dienst schreibt gebündelt:
+
+- Abonniert <prefix>/+/sensor/+ und <prefix>/+/batch – mit "share_group" als
+  Shared Subscription ($share/<gruppe>/…), mehrere Instanzen teilen sich dann
+  die Nachrichten (horizontal skalierbar). Die retained Batch-Schemas
+  (<prefix>/+/batch/schema) abonniert jede Instanz vollständig.
+- Prüft jeden Punkt (Gerät im Topic = Gerät im Payload, Kanalname, numerische
+  Werte, Zeitstempel nicht zu alt / nicht in der Zukunft) und verwirft
+  Duplikate (Gerät, Kanal, Sekunde) – das Nachsenden der Geräte ist
+  at-least-once. Über Instanzen hinweg bleibt der Schreibvorgang idempotent:
+  InfluxDB überschreibt einen Punkt mit gleicher Serie und Zeit.
+- Ordnet das Gerät per Muster (fnmatch) einem Mandanten zu (Organisation,
+  Bucket, Token) und sammelt Line Protocol pro Mandant. Geschrieben wird,
+  sobald batch_size Punkte vorliegen oder flush_interval_s vergangen ist –
+  über einen gemeinsamen Thread-Pool mit gemeinsamem HTTP-Verbindungspool,
+  höchstens ein Write pro Mandant gleichzeitig, gzip-komprimiert.
+- Fehler (Netzwerk, 429, 5xx) → Punkte zurück in den Puffer, Backoff pro
+  Mandant; 4xx → verworfen und gezählt. Der Puffer ist begrenzt
+  (max_pending_points), darüber wird gezählt verworfen.
+- /metrics (Prometheus) und /health auf metrics_port.
+
+Die Punkte entsprechen denen, die der Logger direkt schreibt (Measurement,
+Tags, Feldnamen, Sekunden-Präzision) – bestehende Grafana-Abfragen bleiben.
+
+Aufruf:
+    python3 fleet_ingest.py --config config/fleet_ingest.json
+"""
+
+import argparse
+import fnmatch
+import gzip
+import json
+import logging
+import math
+import queue
+import re
+import signal
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import cycle_stats
+import metrics
+import mqtt_codec
+
+try:
+    import paho.mqtt.client as _mqtt
+    _PAHO_AVAILABLE = True
+except ImportError:
+    _PAHO_AVAILABLE = False
+
+try:
+    import requests
+    from requests.adapters import HTTPAdapter
+except ImportError:
+    requests = None
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s [%(levelname)s] %(message)s",
+)
+
+DEFAULT_CONFIG = {
+    "mqtt": {
+        "host": "127.0.0.1",
+        "port": 1883,
+        "user": "",
+        "password": "",
+        "tls": False,
+        "tls_ca_cert": "",
+        "client_id": "",
+        "prefix": "brunnen",
+        "share_group": "fleet_ingest",   # "" = keine Shared Subscription (nur eine Instanz)
+        "qos": 1,
+    },
+    "influx": {
+        "url": "http://127.0.0.1:8086",
+        "pool_size": 8,
+        "batch_size": 5000,
+        "flush_interval_s": 1.0,
+        "max_pending_points": 500000,
+        "timeout_s": 10,
+        "gzip": True,
+    },
+    "tenants": [],                        # [{"name", "devices": [muster], "org", "bucket", "token"[, "url"]}]
+    "dedupe_keys": 500000,
+    "max_age_days": 60,
+    "max_future_s": 300,
+    "inbox_size": 20000,
+    "metrics_host": "127.0.0.1",
+    "metrics_port": 9105,
+}
+
+BACKOFF_MIN_S = 1.0
+BACKOFF_MAX_S = 120.0
+PARK_MAX = 100                            # Batches pro Gerät, die auf ihr Schema warten
+PARK_MAX_AGE_S = 60.0
+SCHEMAS_PER_DEVICE = 8                    # zuletzt gesehene Schemas pro Gerät (Nachsenden alter Batches)
+FLUSH_TICK_S = 0.1
+
+_CHANNEL_RE = re.compile(r"^[A-Za-z0-9_.-]{1,32}$")
+_DEVICE_RE = re.compile(r"^[A-Za-z0-9_.:-]{1,64}$")
+
+
+def load_config(path: str) -> dict:
+    with open(path) as f:
+        user = json.load(f)
+    cfg = json.loads(json.dumps(DEFAULT_CONFIG))
+    for key, value in user.items():
+        if isinstance(value, dict) and isinstance(cfg.get(key), dict):
+            cfg[key].update(value)
+        else:
+            cfg[key] = value
+    return cfg
+
+
+# ============================================================
+# 🧾 LINE PROTOCOL (wie send_to_influx() im Logger)
+# ============================================================
+def _esc_tag(value) -> str:
+    return str(value).replace("\\", "\\\\").replace(",", "\\,").replace("=", "\\=").replace(" ", "\\ ")
+
+
+def _float(value):
+    try:
+        f = float(value)
+    except (TypeError, ValueError):
+        return None
+    return f if math.isfinite(f) else None
+
+
+def to_line(entry: dict, device_id: str, location: str, ts_s: int):
+    """Ein Messpunkt → Line Protocol; None wenn kein gültiges Feld übrig bleibt."""
+    sensor_type = str(entry.get("type") or "LEVEL").upper()
+    value = _float(entry.get("value"))
+    if value is None:
+        value = _float(entry.get("level_m"))
+    if value is None:
+        return None
+
+    fields = []
+
+    def add(name, raw):
+        f = _float(raw)
+        if f is not None:
+            fields.append(f"{name}={f!r}")
+
+    add("Strom_in_mA", entry.get("current_mA"))
+    if sensor_type == "LEVEL":
+        add("Wassertiefe", entry.get("level_m"))
+        add("Startabstich", entry.get("wasser_oberflaeche_m"))
+        add("Messwert_NN", entry.get("messwert_NN"))
+        add("Pegel_Differenz", entry.get("pegel_diff"))
+    elif sensor_type == "TEMP":
+        add("Temperatur", value)
+    elif sensor_type == "FLOW":
+        add("Durchfluss", value)
+    elif sensor_type == "COUNTER":
+        add("Liter_gesamt", value)
+        impulse = _float(entry.get("impulse_total"))
+        if impulse is not None:
+            fields.append(f"Impulse_gesamt={int(impulse)}i")
+    elif sensor_type == "PRESSURE":
+        add("Luftdruck_hPa", value)
+        add("Temperatur", entry.get("temperature_C"))
+    else:
+        add("Messwert", value)
+    if not fields:
+        return None
+
+    measurement = "barometer" if sensor_type == "PRESSURE" else "wasserstand"
+    tags = (("channel", entry.get("channel")), ("device_id", device_id), ("location", location),
+            ("name", entry.get("name")), ("type", sensor_type), ("unit", entry.get("unit")))
+    tag_str = "".join(f",{k}={_esc_tag(v)}" for k, v in tags if v not in (None, ""))
+    return f"{measurement}{tag_str} {','.join(fields)} {ts_s}"
+
+
+def _timestamp_s(value):
+    try:
+        return int(datetime.fromisoformat(str(value)).timestamp())
+    except (TypeError, ValueError):
+        return None
+
+
+# ============================================================
+# 🔁 DUPLIKATE
+# ============================================================
+class Deduper:
+    """LRU über (Gerät, Kanal, Sekunde) – begrenzt auf max_keys Einträge."""
+
+    def __init__(self, max_keys: int):
+        self.max_keys = max(1000, int(max_keys))
+        self._keys = OrderedDict()
+
+    def seen(self, key) -> bool:
+        if key in self._keys:
+            self._keys.move_to_end(key)
+            return True
+        return False
+
+    def add(self, keys):
+        """Erst eintragen, wenn die Punkte wirklich gepuffert sind – verworfene dürfen erneut kommen."""
+        for key in keys:
+            self._keys[key] = None
+            self._keys.move_to_end(key)
+        while len(self._keys) > self.max_keys:
+            self._keys.popitem(last=False)
+
+    def __len__(self):
+        return len(self._keys)
+
+
+# ============================================================
+# 🏢 MANDANTEN
+# ============================================================
+class TenantMap:
+    def __init__(self, tenants: list, default_url: str):
+        self.tenants = []
+        for t in tenants:
+            if not all(t.get(k) for k in ("name", "org", "bucket", "token")):
+                raise ValueError(f"Mandant unvollständig (name/org/bucket/token): {t.get('name')}")
+            self.tenants.append(dict(t, url=(t.get("url") or default_url).rstrip("/"),
+                                     devices=list(t.get("devices") or ["*"])))
+        self._cache = {}
+
+    def resolve(self, device_id: str):
+        tenant = self._cache.get(device_id, False)
+        if tenant is False:
+            tenant = next((t for t in self.tenants
+                           if any(fnmatch.fnmatchcase(device_id, p) for p in t["devices"])), None)
+            if len(self._cache) > 100000:
+                self._cache.clear()
+            self._cache[device_id] = tenant
+        return tenant
+
+
+class TenantBuffer:
+    __slots__ = ("lines", "first_ts", "inflight", "retry_at", "backoff_s")
+
+    def __init__(self):
+        self.lines = deque()
+        self.first_ts = None
+        self.inflight = False
+        self.retry_at = 0.0
+        self.backoff_s = 0.0
+
+
+# ============================================================
+# 🚚 INGEST
+# ============================================================
+class FleetIngest:
+    def __init__(self, cfg: dict):
+        self.cfg = cfg
+        self.mqtt_cfg = cfg["mqtt"]
+        self.influx_cfg = cfg["influx"]
+        self.tenants = TenantMap(cfg.get("tenants", []), self.influx_cfg["url"])
+        self.stats = cycle_stats.CycleStats(None)
+        self.deduper = Deduper(cfg.get("dedupe_keys", 500000))
+        self.inbox = queue.Queue(maxsize=int(cfg.get("inbox_size", 20000)))
+        self.schemas = {}                 # device_id -> OrderedDict[schema_id -> Batch-Schema]
+        self._parked = {}                 # device_id -> deque[(monotonic, payload)]
+        self._buffers = {}                # tenant name -> TenantBuffer
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self.mqtt_connected = False
+        self._client = None
+
+        pool_size = max(1, int(self.influx_cfg.get("pool_size", 8)))
+        self._pool = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix="influx-write")
+        self._session = requests.Session() if requests else None
+        if self._session:
+            adapter = HTTPAdapter(pool_connections=max(1, len(self.tenants.tenants)), pool_maxsize=pool_size)
+            self._session.mount("http://", adapter)
+            self._session.mount("https://", adapter)
+
+    # ------------------------------------------------------------
+    # Zählen
+    # ------------------------------------------------------------
+    def _incr(self, name: str, n: int = 1):
+        if n:
+            self.stats.incr(name, n)
+
+    def _reject(self, reason: str, n: int = 1):
+        self._incr(f"rejected|{reason}", n)
+
+    # ------------------------------------------------------------
+    # MQTT
+    # ------------------------------------------------------------
+    def topics(self) -> list:
+        prefix = self.mqtt_cfg.get("prefix", "brunnen").rstrip("/")
+        qos = int(self.mqtt_cfg.get("qos", 1))
+        group = (self.mqtt_cfg.get("share_group") or "").strip()
+        data = [f"{prefix}/+/sensor/+", f"{prefix}/+/batch"]
+        if group:
+            data = [f"$share/{group}/{t}" for t in data]
+        # Schemas ohne Shared Subscription: jede Instanz braucht alle, retained kommt nur so an
+        return [(t, qos) for t in data] + [(f"{prefix}/+/batch/schema", qos)]
+
+    def start_mqtt(self):
+        if not _PAHO_AVAILABLE:
+            raise RuntimeError("paho-mqtt nicht installiert")
+        m = self.mqtt_cfg
+        client_id = m.get("client_id") or f"fleet-ingest-{int(time.time() * 1000) % 1000000}"
+        if hasattr(_mqtt, "CallbackAPIVersion"):    # paho-mqtt >= 2.0
+            client = _mqtt.Client(_mqtt.CallbackAPIVersion.VERSION1, client_id=client_id, clean_session=True)
+        else:
+            client = _mqtt.Client(client_id=client_id, clean_session=True)
+        if m.get("tls"):
+            client.tls_set(ca_certs=m.get("tls_ca_cert") or None)
+        if m.get("user"):
+            client.username_pw_set(m["user"], m.get("password", ""))
+
+        def _on_connect(c, userdata, flags, rc):
+            if rc == 0:
+                self.mqtt_connected = True
+                c.subscribe(self.topics())
+                logging.info(f"✅ MQTT verbunden: {m['host']}:{m['port']} – {len(self.topics())} Abos")
+            else:
+                logging.warning(f"⚠️  MQTT Verbindungsfehler rc={rc}")
+
+        def _on_disconnect(c, userdata, rc):
+            self.mqtt_connected = False
+            if rc != 0:
+                logging.warning(f"⚠️  MQTT getrennt (rc={rc}) – reconnect läuft…")
+
+        def _on_message(c, userdata, msg):
+            # Blockiert höchstens kurz: ein voller Eingang bremst den Broker (TCP), statt zu verwerfen
+            try:
+                self.inbox.put((msg.topic, msg.payload), timeout=5)
+            except queue.Full:
+                self._reject("inbox_full")
+
+        client.on_connect = _on_connect
+        client.on_disconnect = _on_disconnect
+        client.on_message = _on_message
+        client.reconnect_delay_set(min_delay=1, max_delay=30)
+        client.connect_async(m["host"], int(m["port"]), keepalive=60)
+        client.loop_start()
+        self._client = client
+
+    # ------------------------------------------------------------
+    # Verarbeitung (ein Thread)
+    # ------------------------------------------------------------
+    def _process_loop(self):
+        while not self._stop.is_set() or not self.inbox.empty():
+            try:
+                topic, payload = self.inbox.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            try:
+                self.handle_message(topic, payload)
+            except Exception as e:
+                logging.warning(f"⚠️  Nachricht auf {topic} nicht verarbeitbar: {e}")
+                self._reject("error")
+
+    def handle_message(self, topic: str, payload: bytes):
+        parts = topic.split("/")
+        if len(parts) < 3:
+            self._reject("topic")
+            return
+        device_id = parts[-3] if parts[-1] == "schema" or parts[-2] == "sensor" else parts[-2]
+        if not _DEVICE_RE.match(device_id):
+            self._reject("device_id")
+            return
+        if parts[-2] == "sensor":
+            self._incr("messages|channel")
+            self._handle_channel(device_id, parts[-1], payload)
+        elif parts[-1] == "batch":
+            self._incr("messages|batch")
+            self._handle_batch(device_id, payload)
+        elif parts[-2:] == ["batch", "schema"]:
+            self._incr("messages|schema")
+            self._handle_schema(device_id, payload)
+        else:
+            self._reject("topic")
+
+    def _handle_channel(self, device_id: str, channel: str, payload: bytes):
+        try:
+            entry = json.loads(payload)
+        except ValueError:
+            self._reject("json")
+            return
+        if not isinstance(entry, dict):
+            self._reject("json")
+            return
+        if entry.get("device_id") not in (None, device_id):
+            self._reject("device_mismatch")
+            return
+        if entry.get("channel") not in (None, channel):
+            self._reject("channel_mismatch")
+            return
+        entry.setdefault("channel", channel)
+        self._accept(device_id, entry.get("location", ""), [(entry, _timestamp_s(entry.get("timestamp")))])
+
+    def _handle_schema(self, device_id: str, payload: bytes):
+        if not payload:
+            self.schemas.pop(device_id, None)    # retained gelöscht
+            return
+        try:
+            schema = json.loads(payload)
+            if not isinstance(schema.get("channels"), list) or "id" not in schema or "struct" not in schema:
+                raise ValueError("unvollständig")
+        except (ValueError, AttributeError):
+            self._reject("schema")
+            return
+        if schema.get("device_id") not in (None, "", device_id):
+            self._reject("device_mismatch")
+            return
+        known = self.schemas.setdefault(device_id, OrderedDict())
+        known.pop(schema["id"], None)
+        known[schema["id"]] = schema
+        while len(known) > SCHEMAS_PER_DEVICE:
+            known.popitem(last=False)
+        parked = self._parked.pop(device_id, None)
+        for _, p in parked or ():
+            self._handle_batch(device_id, p, reparked=True)
+
+    def _handle_batch(self, device_id: str, payload: bytes, reparked: bool = False):
+        known = self.schemas.get(device_id)
+        try:
+            entries = mqtt_codec.decode(payload, schemas=known) if known else None
+        except mqtt_codec.SchemaMismatch:
+            entries = None
+        except Exception:
+            self._reject("batch")
+            return
+        if entries is None:
+            # Schema (noch) unbekannt oder veraltet: kurz parken, das Schema-Topic läuft getrennt
+            if reparked:
+                self._reject("schema_unknown")
+                return
+            now = time.monotonic()
+            parked = self._parked.setdefault(device_id, deque())
+            while parked and (len(parked) >= PARK_MAX or now - parked[0][0] > PARK_MAX_AGE_S):
+                parked.popleft()
+                self._reject("schema_unknown")
+            parked.append((now, payload))
+            return
+        location = next(reversed(known.values())).get("location", "")
+        self._accept(device_id, location, [(e, e["timestamp_ms"] // 1000) for e in entries])
+
+    def _accept(self, device_id: str, location: str, items: list):
+        tenant = self.tenants.resolve(device_id)
+        if tenant is None:
+            self._reject("unknown_tenant", len(items))
+            return
+        now = time.time()
+        oldest = now - float(self.cfg.get("max_age_days", 60)) * 86400
+        newest = now + float(self.cfg.get("max_future_s", 300))
+        lines, keys = [], []
+        for entry, ts_s in items:
+            self._incr("points_received")
+            channel = str(entry.get("channel", ""))
+            if not _CHANNEL_RE.match(channel):
+                self._reject("channel")
+                continue
+            if ts_s is None or not oldest <= ts_s <= newest:
+                self._reject("timestamp")
+                continue
+            line = to_line(entry, device_id, location, ts_s)
+            if line is None:
+                self._reject("value")
+                continue
+            key = (device_id, channel, ts_s)
+            if self.deduper.seen(key) or key in keys:
+                self._incr("points_duplicate")
+                continue
+            lines.append(line)
+            keys.append(key)
+        if lines:
+            self.deduper.add(keys[:self._enqueue(tenant, lines)])
+
+    # ------------------------------------------------------------
+    # Schreiben (gemeinsamer Pool)
+    # ------------------------------------------------------------
+    def _enqueue(self, tenant: dict, lines: list) -> int:
+        """Puffert die Zeilen (bei vollem Puffer nur den Anfang) und gibt die Anzahl zurück."""
+        limit = int(self.influx_cfg.get("max_pending_points", 500000))
+        with self._lock:
+            room = max(0, limit - self._pending)
+            if room < len(lines):
+                self._incr(f"dropped|{tenant['name']}|overflow", len(lines) - room)
+                lines = lines[:room]
+            if not lines:
+                return 0
+            buf = self._buffers.get(tenant["name"])
+            if buf is None:
+                buf = self._buffers[tenant["name"]] = TenantBuffer()
+            if buf.first_ts is None:
+                buf.first_ts = time.monotonic()
+            buf.lines.extend(lines)
+            self._pending += len(lines)
+        return len(lines)
+
+    def _flush_loop(self):
+        while not self._stop.wait(FLUSH_TICK_S):
+            self.flush()
+        self.flush(force=True)
+
+    def flush(self, force: bool = False):
+        batch_size = max(1, int(self.influx_cfg.get("batch_size", 5000)))
+        interval = float(self.influx_cfg.get("flush_interval_s", 1.0))
+        now = time.monotonic()
+        jobs = []
+        with self._lock:
+            for t in self.tenants.tenants:
+                buf = self._buffers.get(t["name"])
+                if buf is None or not buf.lines or buf.inflight:
+                    continue
+                if not force and now < buf.retry_at:
+                    continue
+                if not force and len(buf.lines) < batch_size and now - buf.first_ts < interval:
+                    continue
+                n = min(batch_size, len(buf.lines))
+                lines = [buf.lines.popleft() for _ in range(n)]
+                buf.first_ts = now if buf.lines else None
+                buf.inflight = True
+                jobs.append((t, buf, lines))
+        for t, buf, lines in jobs:
+            self._pool.submit(self._write, t, buf, lines)
+
+    def _post(self, tenant: dict, lines: list):
+        """(ok, retry, message)"""
+        if self._session is None:
+            return False, True, "requests nicht installiert"
+        body = "\n".join(lines).encode()
+        headers = {"Authorization": f"Token {tenant['token']}", "Content-Type": "text/plain; charset=utf-8"}
+        if self.influx_cfg.get("gzip", True):
+            body = gzip.compress(body, compresslevel=1)
+            headers["Content-Encoding"] = "gzip"
+        try:
+            r = self._session.post(f"{tenant['url']}/api/v2/write",
+                                   params={"org": tenant["org"], "bucket": tenant["bucket"], "precision": "s"},
+                                   data=body, headers=headers,
+                                   timeout=float(self.influx_cfg.get("timeout_s", 10)))
+        except requests.RequestException as e:
+            return False, True, str(e)
+        if r.status_code < 300:
+            return True, False, ""
+        retry = r.status_code == 429 or r.status_code >= 500
+        return False, retry, f"HTTP {r.status_code}: {r.text[:200]}"
+
+    def _write(self, tenant: dict, buf: TenantBuffer, lines: list):
+        name = tenant["name"]
+        t0 = time.perf_counter()
+        try:
+            ok, retry, msg = self._post(tenant, lines)
+        except Exception as e:
+            ok, retry, msg = False, True, str(e)
+        self.stats.observe("write", (time.perf_counter() - t0) * 1000.0)
+        with self._lock:
+            buf.inflight = False
+            if ok:
+                buf.backoff_s = 0.0
+                self._pending -= len(lines)
+            elif retry:
+                buf.lines.extendleft(reversed(lines))
+                buf.first_ts = buf.first_ts or time.monotonic()
+                buf.backoff_s = min(BACKOFF_MAX_S, max(BACKOFF_MIN_S, buf.backoff_s * 2))
+                buf.retry_at = time.monotonic() + buf.backoff_s
+            else:
+                self._pending -= len(lines)
+        if ok:
+            self._incr(f"written|{name}", len(lines))
+            self._incr(f"writes|{name}")
+        elif retry:
+            self._incr(f"write_failures|{name}")
+            logging.warning(f"⚠️  Influx-Write {name} fehlgeschlagen ({msg}) – erneut in {buf.backoff_s:.0f} s")
+        else:
+            self._incr(f"write_failures|{name}")
+            self._incr(f"dropped|{name}|rejected", len(lines))
+            logging.error(f"❌ Influx lehnt {len(lines)} Punkte für {name} ab: {msg}")
+
+    # ------------------------------------------------------------
+    # Status
+    # ------------------------------------------------------------
+    def status(self) -> dict:
+        with self._lock:
+            pending = {name: len(buf.lines) for name, buf in self._buffers.items()}
+        return {
+            "mqtt_connected": self.mqtt_connected,
+            "inbox": self.inbox.qsize(),
+            "pending": pending,
+            "pending_total": self._pending,
+            "devices_with_schema": len(self.schemas),
+            "dedupe_keys": len(self.deduper),
+        }
+
+    def render_metrics(self) -> str:
+        snap = self.stats.snapshot()
+        counters, st = snap["counters"], self.status()
+        out = metrics.Exposition()
+
+        def by_prefix(prefix):
+            for key, value in sorted(counters.items()):
+                parts = key.split("|")
+                if parts[0] == prefix:
+                    yield parts[1:], value
+
+        out.family("brunnen_ingest_mqtt_connected", "gauge", "Verbindung zum Broker")
+        out.sample("brunnen_ingest_mqtt_connected", st["mqtt_connected"])
+        out.family("brunnen_ingest_inbox", "gauge", "Empfangene, noch nicht verarbeitete Nachrichten")
+        out.sample("brunnen_ingest_inbox", st["inbox"])
+        out.family("brunnen_ingest_messages", "counter", "Empfangene MQTT-Nachrichten")
+        for (kind,), v in by_prefix("messages"):
+            out.sample("brunnen_ingest_messages_total", v, {"kind": kind})
+        out.family("brunnen_ingest_points_received", "counter", "Empfangene Messpunkte")
+        out.sample("brunnen_ingest_points_received_total", counters.get("points_received", 0))
+        out.family("brunnen_ingest_points_duplicate", "counter", "Verworfene Duplikate (Nachsenden der Geräte)")
+        out.sample("brunnen_ingest_points_duplicate_total", counters.get("points_duplicate", 0))
+        out.family("brunnen_ingest_rejected", "counter", "Ungültige Punkte/Nachrichten")
+        for (reason,), v in by_prefix("rejected"):
+            out.sample("brunnen_ingest_rejected_total", v, {"reason": reason})
+        out.family("brunnen_ingest_points_written", "counter", "An InfluxDB geschriebene Punkte")
+        for (tenant,), v in by_prefix("written"):
+            out.sample("brunnen_ingest_points_written_total", v, {"tenant": tenant})
+        out.family("brunnen_ingest_writes", "counter", "Erfolgreiche Batch-Writes")
+        for (tenant,), v in by_prefix("writes"):
+            out.sample("brunnen_ingest_writes_total", v, {"tenant": tenant})
+        out.family("brunnen_ingest_write_failures", "counter", "Fehlgeschlagene Batch-Writes")
+        for (tenant,), v in by_prefix("write_failures"):
+            out.sample("brunnen_ingest_write_failures_total", v, {"tenant": tenant})
+        out.family("brunnen_ingest_points_dropped", "counter", "Verworfene Punkte (Puffer voll / von InfluxDB abgelehnt)")
+        for (tenant, reason), v in by_prefix("dropped"):
+            out.sample("brunnen_ingest_points_dropped_total", v, {"tenant": tenant, "reason": reason})
+        out.family("brunnen_ingest_pending_points", "gauge", "Gepufferte, noch nicht geschriebene Punkte")
+        for tenant, n in sorted(st["pending"].items()):
+            out.sample("brunnen_ingest_pending_points", n, {"tenant": tenant})
+        write = snap["stages"].get("write")
+        if write:
+            out.family("brunnen_ingest_write_duration_seconds", "histogram", "Dauer der Batch-Writes")
+            out.histogram("brunnen_ingest_write_duration_seconds",
+                          [b / 1000.0 for b in snap["bucket_bounds_ms"]], write["buckets"],
+                          write["sum_ms"] / 1000.0, write["count"])
+        return out.render()
+
+    # ------------------------------------------------------------
+    def run(self):
+        threading.Thread(target=self._process_loop, daemon=True, name="ingest-process").start()
+        flusher = threading.Thread(target=self._flush_loop, daemon=True, name="ingest-flush")
+        flusher.start()
+        self.start_mqtt()
+        self._stop.wait()
+
+        logging.info("Beende: MQTT trennen, Eingang und Puffer leeren…")
+        if self._client:
+            self._client.disconnect()
+            self._client.loop_stop()
+        deadline = time.monotonic() + 10
+        while not self.inbox.empty() and time.monotonic() < deadline:
+            time.sleep(0.1)
+        flusher.join(5)
+        self._pool.shutdown(wait=True)
+        if self._pending:
+            logging.warning(f"⚠️  {self._pending} Punkte beim Beenden nicht geschrieben")
+
+    def stop(self):
+        self._stop.set()
+
+
+# ============================================================
+# 🌐 /metrics und /health
+# ============================================================
+def serve_http(ingest: FleetIngest, host: str, port: int):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path == "/metrics":
+                body = ingest.render_metrics().encode()
+                ctype = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+            elif self.path == "/health":
+                body = json.dumps(ingest.status()).encode()
+                ctype = "application/json"
+            else:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", ctype)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, fmt, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True, name="ingest-http").start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingest-Dienst: MQTT vieler Geräte → InfluxDB")
+    parser.add_argument("--config", default="config/fleet_ingest.json")
+    args = parser.parse_args()
+
+    cfg = load_config(args.config)
+    ingest = FleetIngest(cfg)
+    if not ingest.tenants.tenants:
+        logging.warning("⚠️  Keine Mandanten konfiguriert – alle Punkte werden verworfen.")
+    serve_http(ingest, cfg.get("metrics_host", "127.0.0.1"), int(cfg.get("metrics_port", 9105)))
+
+    def _shutdown(signum, frame):
+        ingest.stop()
+
+    signal.signal(signal.SIGTERM, _shutdown)
+    signal.signal(signal.SIGINT, _shutdown)
+    logging.info(f"Fleet-Ingest: {len(ingest.tenants.tenants)} Mandanten, Abos {[t for t, _ in ingest.topics()]}")
+    ingest.run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,469 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+fleet_status.py – Flottenübersicht: viele Geräte parallel abfragen.
+
+Fragt von jedem Gerät gleichzeitig /api/measurements, /api/reed und
+/api/stats ab (asyncio; mit aiohttp, falls installiert, sonst nur
+Standardbibliothek) und zeigt eine Tabelle mit
+den letzten Messwerten, Wasserzählern, Queue-Tiefe und dem Alter der letzten
+Messung. Authentifizierung per "Authorization: Bearer <API_TOKEN>" (siehe
+API_TOKEN in der Gerätekonfiguration).
+
+- Jede Anfrage hat ein eigenes Timeout, jedes Gerät ein Gesamt-Timeout – ein
+  hängendes Gerät verzögert die Tabelle nicht.
+- Höchstens `concurrency` Geräte gleichzeitig (Semaphore).
+- Ergebnisse werden `ttl_s` zwischengespeichert (Fehler `error_ttl_s`);
+  gleichzeitige Abrufe im Server-Modus teilen sich eine Aktualisierung.
+
+Aufruf:
+    python3 fleet_status.py --config config/fleet_devices.json            # Tabelle
+    python3 fleet_status.py --config config/fleet_devices.json --watch 10 # alle 10 s
+    python3 fleet_status.py --config config/fleet_devices.json --json
+    python3 fleet_status.py --config config/fleet_devices.json --serve 8090
+"""
+
+import argparse
+import asyncio
+import gzip
+import html
+import json
+import ssl
+import sys
+import time
+from datetime import datetime
+from urllib.parse import urlsplit
+
+try:
+    import aiohttp
+except ImportError:               # optional – ohne Paket eigener HTTP/1.1-Client über asyncio-Streams
+    aiohttp = None
+
+DEFAULTS = {
+    "token": "",
+    "timeout_s": 2.0,             # pro Anfrage
+    "device_timeout_s": 3.0,      # pro Gerät (alle Endpunkte)
+    "verify_tls": True,
+    "ca_cert": "",
+    "concurrency": 200,
+    "ttl_s": 10.0,
+    "error_ttl_s": 5.0,
+    "stale_after_s": 60.0,
+}
+ENDPOINTS = ("/api/measurements", "/api/reed", "/api/stats")
+MAX_BODY = 2 * 1024 * 1024
+
+
+def load_config(path: str) -> tuple:
+    """(settings, devices) – devices: [{"name", "url"[, "token"]}]."""
+    with open(path) as f:
+        raw = json.load(f)
+    settings = dict(DEFAULTS, **raw.get("defaults", {}))
+    devices = []
+    for d in raw.get("devices", []):
+        if isinstance(d, str):
+            d = {"url": d}
+        url = d["url"].rstrip("/")
+        devices.append(dict(d, url=url, name=d.get("name") or urlsplit(url).hostname))
+    return settings, devices
+
+
+# ============================================================
+# 🌐 HTTP (aiohttp, falls installiert – sonst asyncio-Streams)
+# ============================================================
+class HttpError(Exception):
+    pass
+
+
+def _check_status(status: int, location: str):
+    if status in (301, 302, 303) and "/login" in (location or ""):
+        raise HttpError("Token abgelehnt")
+    if status != 200:
+        raise HttpError(f"HTTP {status}")
+
+
+def _request_headers(token: str) -> dict:
+    headers = {"Accept": "application/json", "Accept-Encoding": "gzip"}
+    if token:
+        headers["Authorization"] = f"Bearer {token}"
+    return headers
+
+
+async def _aiohttp_get_json(session, url: str, token: str, timeout: float) -> object:
+    try:
+        async with session.get(url, headers=_request_headers(token), allow_redirects=False,
+                               timeout=aiohttp.ClientTimeout(total=timeout)) as resp:
+            _check_status(resp.status, resp.headers.get("Location", ""))
+            body = bytearray()
+            async for chunk in resp.content.iter_chunked(65536):
+                body += chunk
+                if len(body) > MAX_BODY:
+                    raise HttpError("Antwort zu groß")
+    except aiohttp.ClientPayloadError:
+        raise HttpError("Antwort unvollständig")
+    except asyncio.TimeoutError:
+        raise HttpError("Timeout")
+    except aiohttp.ClientError as e:
+        raise HttpError(str(e) or type(e).__name__)
+    return json.loads(body)
+
+
+async def _read_body(reader, headers: dict) -> bytes:
+    """Körper nach Transfer-Encoding bzw. Content-Length; abgeschnittene Antworten → HttpError."""
+    try:
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            body = bytearray()
+            while True:
+                line = await reader.readuntil(b"\r\n")
+                try:
+                    size = int(line.split(b";")[0].strip(), 16)
+                except ValueError:
+                    raise HttpError("ungültige Chunk-Größe")
+                if size == 0:
+                    return bytes(body)
+                if len(body) + size > MAX_BODY:
+                    raise HttpError("Antwort zu groß")
+                body += await reader.readexactly(size)
+                await reader.readexactly(2)
+        if "content-length" in headers:
+            try:
+                length = int(headers["content-length"])
+            except ValueError:
+                raise HttpError("ungültige Content-Length")
+            if length > MAX_BODY:
+                raise HttpError("Antwort zu groß")
+            return await reader.readexactly(length)
+        body = bytearray()                # weder noch: bis Verbindungsende (Connection: close)
+        while len(body) <= MAX_BODY:
+            chunk = await reader.read(65536)
+            if not chunk:
+                return bytes(body)
+            body += chunk
+        raise HttpError("Antwort zu groß")
+    except (asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+        raise HttpError("Antwort unvollständig")
+
+
+async def http_get_json(url: str, token: str, timeout: float, ssl_ctx) -> object:
+    """Ein GET ohne Zusatzpakete (HTTP/1.1, Connection: close)."""
+    parts = urlsplit(url)
+    https = parts.scheme == "https"
+    port = parts.port or (443 if https else 80)
+    path = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+
+    async def _exchange():
+        reader, writer = await asyncio.open_connection(parts.hostname, port, ssl=ssl_ctx if https else None)
+        try:
+            lines = [f"GET {path} HTTP/1.1", f"Host: {parts.netloc}", "Connection: close"]
+            lines += [f"{k}: {v}" for k, v in _request_headers(token).items()]
+            writer.write(("\r\n".join(lines) + "\r\n\r\n").encode())
+            await writer.drain()
+            try:
+                head = await reader.readuntil(b"\r\n\r\n")
+            except (asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+                raise HttpError("ungültige Antwort")
+            head_lines = head.decode("latin-1").split("\r\n")
+            try:
+                status = int(head_lines[0].split()[1])
+            except (IndexError, ValueError):
+                raise HttpError("ungültige Antwort")
+            headers = {}
+            for line in head_lines[1:]:
+                k, _, v = line.partition(":")
+                if k:
+                    headers[k.strip().lower()] = v.strip()
+            _check_status(status, headers.get("location", ""))
+            return headers, await _read_body(reader, headers)
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except (OSError, ssl.SSLError):
+                pass
+
+    headers, body = await asyncio.wait_for(_exchange(), timeout)
+    if headers.get("content-encoding", "").lower() == "gzip":
+        try:
+            body = gzip.decompress(body)
+        except (OSError, EOFError):
+            raise HttpError("Antwort unvollständig")
+    return json.loads(body)
+
+
+# ============================================================
+# 📋 GERÄTESTATUS
+# ============================================================
+def _epoch(ts):
+    try:
+        return datetime.fromisoformat(str(ts)).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+def summarize(device: dict, results: dict, latency_ms: float) -> dict:
+    """Antworten der drei Endpunkte → eine Tabellenzeile (Teilergebnisse erlaubt)."""
+    row = {"name": device["name"], "url": device["url"], "latency_ms": round(latency_ms),
+           "fetched": time.time(), "channels": {}, "reed": [], "queue_depth": None,
+           "logger_stale": None, "last_ts": None, "errors": {}}
+    for endpoint, value in results.items():
+        if isinstance(value, Exception):
+            row["errors"][endpoint] = str(value) or type(value).__name__
+    measurements = results.get("/api/measurements")
+    if isinstance(measurements, list):
+        for entry in measurements:
+            ch = entry.get("channel")
+            if not ch:
+                continue
+            row["channels"][ch] = {"value": entry.get("value"), "unit": entry.get("unit") or "",
+                                   "name": entry.get("name", "")}
+            ts = _epoch(entry.get("timestamp"))
+            if ts and (row["last_ts"] is None or ts > row["last_ts"]):
+                row["last_ts"] = ts
+    elif isinstance(measurements, dict) and measurements.get("error"):
+        row["errors"]["/api/measurements"] = measurements["error"]
+    reed = results.get("/api/reed")
+    if isinstance(reed, list):
+        row["reed"] = [{"name": r.get("name"), "liter": r.get("liter")} for r in reed]
+    stats = results.get("/api/stats")
+    if isinstance(stats, dict):
+        row["queue_depth"] = (stats.get("gauges") or {}).get("queue_depth")
+        row["logger_stale"] = stats.get("stale")
+    row["ok"] = len(row["errors"]) < len(ENDPOINTS)
+    return row
+
+
+class FleetPoller:
+    def __init__(self, settings: dict, devices: list):
+        self.settings = settings
+        self.devices = devices
+        self._cache = {}              # (name, url) -> (monotonic, row)
+        self._sem = asyncio.Semaphore(max(1, int(settings["concurrency"])))
+        self._refresh = None          # laufende Aktualisierung (geteilt)
+        self._ssl = ssl.create_default_context(cafile=settings.get("ca_cert") or None)
+        if not settings.get("verify_tls", True):
+            self._ssl.check_hostname = False
+            self._ssl.verify_mode = ssl.CERT_NONE
+        self._session = None          # aiohttp.ClientSession (Keep-Alive über alle Abrufe)
+
+    def _get_json(self, url: str, token: str, timeout: float):
+        if aiohttp is None:
+            return http_get_json(url, token, timeout, self._ssl)
+        if self._session is None:
+            connector = aiohttp.TCPConnector(ssl=self._ssl, limit=max(1, int(self.settings["concurrency"])) * 2)
+            self._session = aiohttp.ClientSession(connector=connector, auto_decompress=True)
+        return _aiohttp_get_json(self._session, url, token, timeout)
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def _poll_device(self, device: dict) -> dict:
+        token = device.get("token") or self.settings["token"]
+        timeout = float(device.get("timeout_s") or self.settings["timeout_s"])
+        async with self._sem:
+            t0 = time.perf_counter()
+            tasks = {ep: asyncio.ensure_future(self._get_json(device["url"] + ep, token, timeout))
+                     for ep in ENDPOINTS}
+            done, pending = await asyncio.wait(tasks.values(), timeout=float(self.settings["device_timeout_s"]))
+            for task in pending:
+                task.cancel()
+            results = {}
+            for ep, task in tasks.items():
+                if task in pending:
+                    results[ep] = HttpError("Timeout")
+                elif task.exception() is not None:
+                    exc = task.exception()
+                    results[ep] = HttpError("Timeout") if isinstance(exc, asyncio.TimeoutError) else exc
+                else:
+                    results[ep] = task.result()
+            return summarize(device, results, (time.perf_counter() - t0) * 1000.0)
+
+    def _fresh(self, device: dict, now: float) -> bool:
+        cached = self._cache.get((device["name"], device["url"]))
+        if cached is None:
+            return False
+        ttl = self.settings["ttl_s"] if cached[1]["ok"] else self.settings["error_ttl_s"]
+        return now - cached[0] < float(ttl)
+
+    async def _refresh_stale(self):
+        now = time.monotonic()
+        stale = [d for d in self.devices if not self._fresh(d, now)]
+        rows = await asyncio.gather(*(self._poll_device(d) for d in stale))
+        now = time.monotonic()
+        for d, row in zip(stale, rows):
+            self._cache[(d["name"], d["url"])] = (now, row)
+
+    async def snapshot(self) -> list:
+        """Alle Geräte; nur abgelaufene Einträge werden neu abgefragt."""
+        if self._refresh is None or self._refresh.done():
+            self._refresh = asyncio.ensure_future(self._refresh_stale())
+        await asyncio.shield(self._refresh)
+        rows = [self._cache[(d["name"], d["url"])][1] for d in self.devices]
+        stale_after = float(self.settings["stale_after_s"])
+        now = time.time()
+        for row in rows:
+            row["age_s"] = round(now - row["last_ts"]) if row["last_ts"] else None
+            row["stale"] = row["age_s"] is None or row["age_s"] > stale_after or bool(row["logger_stale"])
+        # Probleme zuerst, dann nach Name
+        return sorted(rows, key=lambda r: (r["ok"] and not r["stale"] and not r["errors"], r["name"]))
+
+
+# ============================================================
+# 🖨️ AUSGABE
+# ============================================================
+def _fmt_age(seconds) -> str:
+    if seconds is None:
+        return "–"
+    if seconds < 120:
+        return f"{seconds} s"
+    if seconds < 7200:
+        return f"{seconds // 60} min"
+    return f"{seconds // 3600} h"
+
+
+def _fmt_value(v) -> str:
+    if v is None:
+        return "–"
+    if isinstance(v, float):
+        return f"{v:.2f}"
+    return str(v)
+
+
+def _channel_order(rows: list) -> list:
+    seen = {ch for r in rows for ch in r["channels"]}
+    analog = sorted(ch for ch in seen if ch.startswith("A"))
+    return analog + sorted(ch for ch in seen if ch not in analog)
+
+
+def table(rows: list) -> tuple:
+    """(kopf, zeilen) als Text – gemeinsam für Konsole und HTML."""
+    channels = _channel_order(rows)
+    head = ["Gerät", "Status", "Alter"] + channels + ["Queue", "ms"]
+    body = []
+    for r in rows:
+        if not r["ok"]:
+            status = "✖ " + "; ".join(sorted(set(r["errors"].values())))
+        elif r["errors"]:
+            status = "◐ " + ", ".join(ep.rsplit("/", 1)[-1] for ep in r["errors"])
+        else:
+            status = "⚠ veraltet" if r["stale"] else "✔"
+        cells = [r["name"], status, _fmt_age(r["age_s"])]
+        for ch in channels:
+            c = r["channels"].get(ch)
+            cells.append(f"{_fmt_value(c['value'])} {c['unit']}".strip() if c else "")
+        cells += [_fmt_value(r["queue_depth"]), str(r["latency_ms"])]
+        body.append(cells)
+    return head, body
+
+
+def render_text(rows: list, elapsed_s: float) -> str:
+    head, body = table(rows)
+    widths = [max(len(str(x)) for x in col) for col in zip(head, *body)] if body else [len(h) for h in head]
+    lines = ["  ".join(str(c).ljust(w) for c, w in zip(head, widths)),
+             "  ".join("-" * w for w in widths)]
+    lines += ["  ".join(str(c).ljust(w) for c, w in zip(cells, widths)) for cells in body]
+    ok = sum(1 for r in rows if r["ok"] and not r["stale"] and not r["errors"])
+    lines.append(f"\n{len(rows)} Geräte, {ok} in Ordnung, {len(rows) - ok} auffällig – {elapsed_s:.2f} s")
+    return "\n".join(lines)
+
+
+def render_html(rows: list, refresh_s: int) -> str:
+    head, body = table(rows)
+    th = "".join(f"<th>{html.escape(h)}</th>" for h in head)
+    trs = []
+    for r, cells in zip(rows, body):
+        cls = "err" if not r["ok"] else "warn" if (r["stale"] or r["errors"]) else ""
+        tds = "".join(f"<td>{html.escape(str(c))}</td>" for c in cells)
+        trs.append(f'<tr class="{cls}" title="{html.escape(r["url"])}">{tds}</tr>')
+    return (f"<!doctype html><html lang=de><meta charset=utf-8><meta http-equiv=refresh content={refresh_s}>"
+            "<title>Brunnen-Flotte</title><style>body{font:13px sans-serif;background:#0f172a;color:#e2e8f0}"
+            "table{border-collapse:collapse}td,th{padding:3px 8px;border-bottom:1px solid #334155;"
+            "text-align:left;white-space:nowrap}tr.err{background:#7f1d1d}tr.warn{background:#78350f}</style>"
+            f"<h3>Brunnen-Flotte – {len(rows)} Geräte, Stand {time.strftime('%H:%M:%S')}</h3>"
+            f"<table><tr>{th}</tr>{''.join(trs)}</table></html>")
+
+
+async def serve(poller: FleetPoller, host: str, port: int):
+    """Minimaler HTTP-Server: / (HTML-Tabelle) und /api/fleet (JSON)."""
+    refresh_s = max(5, int(poller.settings["ttl_s"]))
+
+    async def handle(reader, writer):
+        try:
+            request_line = (await asyncio.wait_for(reader.readline(), 10)).decode("latin-1")
+            while (await asyncio.wait_for(reader.readline(), 10)) not in (b"\r\n", b"\n", b""):
+                pass
+            path = request_line.split()[1] if len(request_line.split()) > 1 else "/"
+            if path == "/":
+                status, ctype, body = 200, "text/html; charset=utf-8", render_html(await poller.snapshot(), refresh_s)
+            elif path == "/api/fleet":
+                status, ctype, body = 200, "application/json", json.dumps(await poller.snapshot())
+            else:
+                status, ctype, body = 404, "text/plain", "nicht gefunden"
+            data = body.encode()
+            writer.write(f"HTTP/1.1 {status} {'OK' if status == 200 else 'Not Found'}\r\n"
+                         f"Content-Type: {ctype}\r\nContent-Length: {len(data)}\r\n"
+                         "Connection: close\r\n\r\n".encode() + data)
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError, IndexError):
+            pass
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, host, port)
+    print(f"Flottenübersicht: http://{host}:{port}/  ({len(poller.devices)} Geräte)", flush=True)
+    async with server:
+        await server.serve_forever()
+
+
+async def run(args):
+    settings, devices = load_config(args.config) if args.config else (dict(DEFAULTS), [])
+    for url in args.device or []:
+        devices.append({"url": url.rstrip("/"), "name": urlsplit(url).hostname})
+    if args.token:
+        settings["token"] = args.token
+    if args.insecure:
+        settings["verify_tls"] = False
+    if not devices:
+        sys.exit("Keine Geräte konfiguriert (--config oder --device).")
+    poller = FleetPoller(settings, devices)
+    try:
+        if args.serve:
+            await serve(poller, args.host, args.serve)
+            return
+        while True:
+            t0 = time.perf_counter()
+            rows = await poller.snapshot()
+            elapsed = time.perf_counter() - t0
+            if args.json:
+                print(json.dumps(rows, indent=2))
+            else:
+                if args.watch:
+                    print("\033[2J\033[H", end="")
+                print(render_text(rows, elapsed), flush=True)
+            if not args.watch:
+                return
+            await asyncio.sleep(args.watch)
+    finally:
+        await poller.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Flottenübersicht: viele Geräte parallel abfragen")
+    parser.add_argument("--config", help="JSON mit defaults und devices (siehe config/fleet_devices.template.json)")
+    parser.add_argument("--device", action="append", help="zusätzliche Geräte-URL (mehrfach möglich)")
+    parser.add_argument("--token", help="API_TOKEN für alle Geräte ohne eigenen Token")
+    parser.add_argument("--insecure", action="store_true", help="TLS-Zertifikate nicht prüfen (selbstsigniert)")
+    parser.add_argument("--json", action="store_true", help="Ergebnis als JSON ausgeben")
+    parser.add_argument("--watch", type=float, default=0, help="Tabelle alle N Sekunden neu ausgeben")
+    parser.add_argument("--serve", type=int, default=0, help="als Webdienst auf diesem Port laufen")
+    parser.add_argument("--host", default="127.0.0.1", help="Adresse für --serve")
+    args = parser.parse_args()
+    try:
+        asyncio.run(run(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
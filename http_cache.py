@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+http_cache.py – Bedingte Abrufe (ETag/304) und Kompression für die Webapp.
+
+- Datenversion statt Inhalt: für Endpunkte, deren Antwort nur von Dateien
+  abhängt (latest_measurement.json, reed_counts.json, config.json), bildet
+  file_version() aus mtime und Größe eine Version. Passt der ETag des Clients
+  dazu, antwortet die Webapp mit 304, ohne die Dateien zu lesen.
+- BodyCache hält pro Endpunkt die zuletzt erzeugte Antwort (und ihre
+  komprimierten Fassungen), solange sich die Version nicht ändert – viele
+  Browser-Tabs und Abfragen bauen dasselbe JSON nur einmal.
+- negotiate()/compress(): brotli (optional, Paket "brotli"), sonst gzip.
+  Komprimierte Darstellungen bekommen einen eigenen ETag (Suffix -br/-gz).
+"""
+
+import gzip
+import hashlib
+import os
+import threading
+
+try:
+    import brotli
+except ImportError:               # optional – ohne Paket nur gzip
+    brotli = None
+
+MIN_COMPRESS_BYTES = 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5                # guter Kompromiss aus Größe und CPU auf dem Pi
+SUFFIXES = {"br": "-br", "gzip": "-gz"}
+COMPRESSIBLE = {
+    "application/json", "text/html", "text/plain", "text/css", "text/javascript",
+    "application/javascript", "image/svg+xml", "application/openmetrics-text",
+}
+
+
+def file_version(*paths) -> str:
+    """Version aus mtime_ns und Größe der Dateien (fehlende Dateien zählen als "-")."""
+    parts = []
+    for path in paths:
+        try:
+            st = os.stat(path)
+            parts.append(f"{st.st_mtime_ns:x}.{st.st_size:x}")
+        except OSError:
+            parts.append("-")
+    return ":".join(parts)
+
+
+def make_etag(*parts) -> str:
+    """Starker ETag-Wert (ohne Anführungszeichen) aus beliebigen Teilen."""
+    h = hashlib.sha1()
+    for part in parts:
+        h.update(part if isinstance(part, bytes) else str(part).encode())
+        h.update(b"\0")
+    return h.hexdigest()[:20]
+
+
+def variants(tag: str) -> tuple:
+    """Alle ETags derselben Version (unkomprimiert, gzip, brotli)."""
+    return (tag,) + tuple(tag + s for s in SUFFIXES.values())
+
+
+def negotiate(accept_encodings) -> str:
+    """"br", "gzip" oder None nach Accept-Encoding (werkzeug Accept-Objekt)."""
+    if brotli is not None and accept_encodings["br"] > 0:
+        return "br"
+    if accept_encodings["gzip"] > 0:
+        return "gzip"
+    return None
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL)
+
+
+class BodyCache:
+    """Letzte Antwort pro Schlüssel (Endpunkt) mit ihrer Version und komprimierten Fassungen."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}            # key -> [version, body, mimetype, {encoding: bytes}]
+
+    def get(self, key: str, version: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] == version:
+                return entry[1], entry[2]
+        return None
+
+    def put(self, key: str, version: str, body: bytes, mimetype: str):
+        with self._lock:
+            self._entries[key] = [version, body, mimetype, {}]
+
+    def compressed(self, key: str, version: str, body: bytes, encoding: str) -> bytes:
+        """Komprimierte Fassung – bei gleicher Version nur einmal berechnet."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] == version and encoding in entry[3]:
+                return entry[3][encoding]
+        data = compress(body, encoding)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] == version:
+                entry[3][encoding] = data
+        return data
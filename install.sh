@@ -74,8 +74,10 @@ brunnen ALL=NOPASSWD: /usr/bin/tee -a /etc/wpa_supplicant/wpa_supplicant.conf
 brunnen ALL=NOPASSWD: /usr/bin/wpa_cli
 brunnen ALL=NOPASSWD: /usr/bin/systemctl restart brunnen_web.service
 brunnen ALL=NOPASSWD: /usr/bin/systemctl restart brunnen_logger.service
+brunnen ALL=NOPASSWD: /usr/bin/systemctl restart brunnen_outputs.service
 brunnen ALL=NOPASSWD: /bin/systemctl restart brunnen_web.service
 brunnen ALL=NOPASSWD: /bin/systemctl restart brunnen_logger.service
+brunnen ALL=NOPASSWD: /bin/systemctl restart brunnen_outputs.service
 brunnen ALL=NOPASSWD: /usr/bin/systemctl restart NetworkManager
 brunnen ALL=NOPASSWD: /usr/bin/systemctl reload nginx
 brunnen ALL=NOPASSWD: /bin/systemctl reload nginx
@@ -95,9 +97,10 @@ fi
 section "Logrotate Configuration"
 
 cat << 'EOF' > /etc/logrotate.d/brunnen_web
+# wasserstand.log rotiert der Logger selbst (log_pipeline.py, gzip)
 /opt/brunnen_web/logs/logger.err.log
-/opt/brunnen_web/logs/wasserstand.log
 /opt/brunnen_web/logs/webapp.err.log
+/opt/brunnen_web/logs/outputs.err.log
 /var/log/check-vpn.log 
 {
     size 5M
@@ -181,6 +184,9 @@ section "5️⃣  Systemd-Service konfigurieren"
 WEBAPP_SECRET=$(python3 -c "import secrets; print(secrets.token_hex(32))")
 ok "Zufälliger WEBAPP_SECRET generiert"
 
+# Thread-Budget: 2 Worker × 4 Threads = 8 gleichzeitige Requests. Jeder offene Live-Stream
+# (/outputs/stream, /logs/stream) belegt einen Thread, endet aber nach 60 s (Browser verbindet
+# neu) – "-t" greift bei gthread nur für hängende Worker, nicht für einzelne Requests.
 cat <<EOF > "$WEB_SERVICE_FILE"
 [Unit]
 Description=Brunnen Webinterface (Flask via Gunicorn)
@@ -191,7 +197,7 @@ User=brunnen
 Group=brunnen
 SupplementaryGroups=gpio
 WorkingDirectory=$BASE_DIR
-ExecStart=$BASE_DIR/venv/bin/gunicorn -w 1 --threads 1 -t 180 -b 127.0.0.1:8080 webapp:app
+ExecStart=$BASE_DIR/venv/bin/gunicorn -w 2 --threads 4 -t 180 -b 127.0.0.1:8080 webapp:app
 Restart=always
 Environment="PATH=$BASE_DIR/venv/bin:/usr/local/sbin:/usr/local/bin:/usr/sbin:/usr/bin:/sbin:/bin"
 Environment="WEBAPP_SECRET=$WEBAPP_SECRET"
@@ -220,6 +226,14 @@ StandardError=append:$BASE_DIR/logs/logger.err.log
 WantedBy=multi-user.target
 EOF
 
+# RAM-Verzeichnis für flüchtigen Zustand (latest_measurement.json, Zählerstände, Statistik)
+cp "$BASE_DIR/deploy/tmpfiles/brunnen.conf" /etc/tmpfiles.d/brunnen.conf
+systemd-tmpfiles --create /etc/tmpfiles.d/brunnen.conf
+
+# Ausgangs-Steuerdienst (besitzt die GPIO-Ausgänge, Webapp spricht ihn per Unix-Socket an)
+cp "$BASE_DIR/deploy/systemd/brunnen_outputs.service" /etc/systemd/system/brunnen_outputs.service
+chmod 644 /etc/systemd/system/brunnen_outputs.service
+
 ok "Systemd-Service-Datei erstellt: $WEB_SERVICE_FILE"
 
 section "6️⃣  Start- und Stop-Skripte anlegen"
@@ -228,6 +242,7 @@ section "7️⃣  Dienst aktivieren"
 systemctl daemon-reload
 systemctl enable brunnen_web.service 
 systemctl enable brunnen_logger.service
+systemctl enable brunnen_outputs.service
 ok "Systemd-Dienst aktiviert"
 
 section "8️⃣  I²C aktivieren"
@@ -261,8 +276,8 @@ ok "Nginx und SSL-Zertifikat konfiguriert"
 
 section "9️⃣  Starte Dienste"
 
-systemctl restart brunnen_web.service brunnen_logger.service
-systemctl status brunnen_web.service brunnen_logger.service
+systemctl restart brunnen_outputs.service brunnen_web.service brunnen_logger.service
+systemctl status brunnen_outputs.service brunnen_web.service brunnen_logger.service
 
 section "✅ Installation abgeschlossen!"
 echo -e "${GREEN}${BOLD}Starte Service:${RESET} systemctl start brunnen_web.service brunnen_logger.service"
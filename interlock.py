@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+interlock.py – Pegelabhängige Verriegelungen der MOSFET-Ausgänge.
+
+Regeln aus config/interlocks.json werden bei jedem Config-Reload einmal
+kompiliert und im Logger direkt nach dem ADC-Scan ausgewertet, z.B.
+Trockenlaufschutz: "A0 < 1.5 m → Ausgang 2 AUS erzwingen, Freigabe ab 2.0 m".
+
+    [
+      {"name": "Trockenlaufschutz Pumpe", "channel": "A0",
+       "below": 1.5, "release": 2.0, "output": 1, "state": 0, "restore": false}
+    ]
+
+- "below" oder "above": Auslöseschwelle; "release": Freigabeschwelle (Hysterese)
+- "output": Ausgang (0-basiert wie in output_schedule.json, 1 = Kanal 2)
+- "state": erzwungener Zustand (Standard 0 = AUS)
+- "restore": nach Freigabe den Gegenzustand wiederherstellen (Standard: nein)
+
+Solange eine Verriegelung aktiv ist, lehnt der Ausgangsdienst abweichende
+Schaltbefehle für diesen Ausgang ab (Webapp, Zeitpläne, API). Die Sperren
+tragen im Ausgangsdienst den Key "interlock:<key>"; beim Start übernimmt der
+Logger die dort noch gehaltenen Sperren (adopt), statt sie zu vergessen.
+"""
+
+import logging
+import time
+
+from alarm import ThresholdCondition
+
+LOCK_PREFIX = "interlock:"   # Namensraum der Sperren im Ausgangsdienst
+
+
+class InterlockRule:
+    __slots__ = ("key", "name", "condition", "output", "state", "restore", "active", "last_value")
+
+    def __init__(self, key: str, name: str, condition: ThresholdCondition,
+                 output: int, state: bool, restore: bool):
+        self.key = key
+        self.name = name
+        self.condition = condition
+        self.output = output
+        self.state = state
+        self.restore = restore
+        self.active = False
+        self.last_value = None
+
+    def evaluate(self, values: dict, now: float):
+        """Gibt "engaged", "released" oder None zurück."""
+        tripped, value = self.condition.check(values, now, self.active)
+        if tripped is None:
+            return None
+        self.last_value = value
+        if tripped and not self.active:
+            self.active = True
+            return "engaged"
+        if not tripped and self.active:
+            self.active = False
+            return "released"
+        return None
+
+    @property
+    def lock_key(self) -> str:
+        return LOCK_PREFIX + self.key
+
+    def describe(self) -> str:
+        c = self.condition
+        op = "<" if c.below else ">"
+        return (f"{self.name}: {c.channel} {op} {c.limit:g} → Ausgang {self.output + 1} "
+                f"{'EIN' if self.state else 'AUS'} (Freigabe bei {c.release:g})")
+
+
+def compile_interlocks(raw_rules: list, n_outputs: int = 6) -> list:
+    """Prüft und kompiliert die Regeln. Ungültige Einträge werden protokolliert und übersprungen."""
+    rules = []
+    for i, raw in enumerate(raw_rules or []):
+        try:
+            if not isinstance(raw, dict):
+                raise ValueError("Regel muss ein Objekt sein")
+            channel = str(raw["channel"]).strip()
+            if ("below" in raw) == ("above" in raw):
+                raise ValueError("genau eines von 'below' oder 'above' angeben")
+            below = "below" in raw
+            limit = float(raw["below"] if below else raw["above"])
+            release = float(raw.get("release", limit))
+            if (below and release < limit) or (not below and release > limit):
+                raise ValueError("'release' liegt auf der falschen Seite der Schwelle")
+            output = int(raw["output"])
+            if not 0 <= output < n_outputs:
+                raise ValueError(f"Ausgang {output} existiert nicht")
+            state = bool(int(raw.get("state", 0)))
+            name = str(raw.get("name") or f"Verriegelung {i + 1}")
+            key = str(raw.get("key") or f"{channel}_{'lt' if below else 'gt'}_{limit:g}_out{output}")
+            condition = ThresholdCondition(channel, limit, below, abs(release - limit))
+            rules.append(InterlockRule(key, name, condition, output, state,
+                                       bool(raw.get("restore", False))))
+        except (KeyError, TypeError, ValueError) as e:
+            logging.error(f"Verriegelung {i + 1} ungültig, übersprungen: {e}")
+    return rules
+
+
+class InterlockEngine:
+    """Hält die kompilierten Verriegelungen; Zustand bleibt über Reloads pro Key erhalten."""
+
+    def __init__(self, rules: list = None):
+        self.rules = []
+        self.replace_rules(rules or [])
+
+    def replace_rules(self, rules: list) -> list:
+        """Tauscht die Regeln und gibt die aktiven Regeln zurück, die entfallen sind."""
+        previous = {r.key: r for r in self.rules}
+        for rule in rules:
+            old = previous.pop(rule.key, None)
+            if old is not None:
+                rule.active = old.active
+                rule.last_value = old.last_value
+        self.rules = rules
+        return [r for r in previous.values() if r.active]
+
+    def evaluate(self, values: dict, now: float = None) -> list:
+        """Gibt (rule, event) für alle Zustandswechsel zurück."""
+        now = time.time() if now is None else now
+        events = []
+        for rule in self.rules:
+            event = rule.evaluate(values, now)
+            if event:
+                events.append((rule, event))
+        return events
+
+    def active(self) -> list:
+        return [r for r in self.rules if r.active]
+
+    def adopt(self, held: dict) -> list:
+        """
+        Gleicht mit den Sperren des Ausgangsdienstes ab ({output: [lock_key, ...]}).
+        Bekannte Sperren setzen die Regel aktiv (die Freigabe wird dann regulär
+        gesendet), verwaiste "interlock:"-Sperren werden als (output, lock_key)
+        zurückgegeben und müssen entsperrt werden.
+        """
+        by_key = {(r.output, r.lock_key): r for r in self.rules}
+        orphans = []
+        for output, keys in held.items():
+            for lock_key in keys:
+                if not lock_key.startswith(LOCK_PREFIX):
+                    continue
+                rule = by_key.get((int(output), lock_key))
+                if rule is not None:
+                    rule.active = True
+                else:
+                    orphans.append((int(output), lock_key))
+        return orphans
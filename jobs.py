@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+jobs.py – Hintergrund-Jobs der Webapp (WLAN-Scan, Dienst-Neustart, Backups, Zertifikate).
+
+Langsame Subprozess- oder Netzwerkarbeit läuft nicht mehr im Request-Thread:
+submit() legt einen Job an und gibt sofort seine ID zurück, ein kleiner
+Thread-Pool arbeitet ihn ab, der Browser fragt /jobs/<id> ab.
+
+- Zustand pro Job als JSON-Datei im State-Verzeichnis (tmpfs), damit jeder
+  Gunicorn-Worker jeden Job kennt – egal, welcher ihn ausführt.
+- Gleiche Jobs (gleicher Schlüssel) laufen nur einmal: solange einer wartet
+  oder läuft, bekommt jeder weitere Aufruf denselben Job zurück.
+- Ergebnis-Cache: ein erfolgreicher Job, der jünger als cache_s ist, wird
+  wiederverwendet (z.B. WLAN-Scan 20 s).
+- Stirbt der ausführende Worker, gilt sein laufender Job als abgebrochen.
+
+Debouncer fasst Serien von Auslösern (z.B. mehrere Konfig-Speicherungen
+hintereinander) zu einem Aufruf zusammen.
+"""
+
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+ACTIVE = ("queued", "running")
+KEEP_S = 3600                     # fertige Jobs so lange abrufbar
+PRUNE_EVERY_S = 300
+
+
+def _pid_alive(pid) -> bool:
+    try:
+        os.kill(int(pid), 0)
+        return True
+    except (OSError, TypeError, ValueError):
+        return False
+
+
+class JobRunner:
+    def __init__(self, state_dir: str, max_workers: int = 2):
+        self._dir = state_dir
+        os.makedirs(self._dir, exist_ok=True)
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._lock = threading.Lock()
+        self._last_prune = 0.0
+
+    # ---------- Dateien ----------
+    def _path(self, job_id: str) -> str:
+        return os.path.join(self._dir, f"{job_id}.json")
+
+    def _write(self, job: dict):
+        tmp = self._path(job["id"]) + f".{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(job, f)
+        os.replace(tmp, self._path(job["id"]))
+
+    @contextmanager
+    def _locked(self):
+        """Prozessübergreifend (flock) und im Prozess (Lock) – für Index und Deduplizierung."""
+        with self._lock, open(os.path.join(self._dir, ".lock"), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _read_index(self) -> dict:
+        try:
+            with open(os.path.join(self._dir, "index.json")) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_index(self, index: dict):
+        tmp = os.path.join(self._dir, f"index.json.{os.getpid()}.tmp")
+        with open(tmp, "w") as f:
+            json.dump(index, f)
+        os.replace(tmp, os.path.join(self._dir, "index.json"))
+
+    # ---------- Abfragen ----------
+    def get(self, job_id: str):
+        """Job als dict oder None; verwaiste Jobs (Worker beendet) werden als Fehler gemeldet."""
+        if not job_id or not all(c.isalnum() for c in job_id):
+            return None
+        try:
+            with open(self._path(job_id)) as f:
+                job = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if job["status"] in ACTIVE and not _pid_alive(job.get("pid")):
+            job.update(status="error", message="Abgebrochen (Webapp-Worker beendet)", finished=time.time())
+        return job
+
+    def list(self, limit: int = 50) -> list:
+        jobs = []
+        for name in os.listdir(self._dir):
+            if name.endswith(".json") and name != "index.json":
+                job = self.get(name[:-5])
+                if job:
+                    jobs.append(job)
+        jobs.sort(key=lambda j: j["created"], reverse=True)
+        return jobs[:limit]
+
+    # ---------- Starten ----------
+    def submit(self, kind: str, fn, *args, key: str = None, cache_s: float = 0, **kwargs) -> dict:
+        """fn(progress, *args, **kwargs) im Pool ausführen; progress(prozent, meldung) ist optional.
+        Läuft schon ein Job mit gleichem Schlüssel (oder ist ein Ergebnis jünger als cache_s),
+        kommt dieser zurück."""
+        key = key or kind
+        now = time.time()
+        with self._locked():
+            index = self._read_index()
+            latest = self.get(index.get(key))
+            if latest:
+                if latest["status"] in ACTIVE:
+                    return latest
+                if cache_s and latest["status"] == "done" and now - latest["finished"] < cache_s:
+                    return dict(latest, cached=True)
+            job = {"id": uuid.uuid4().hex[:16], "kind": kind, "key": key, "status": "queued",
+                   "progress": 0, "message": "", "result": None, "pid": os.getpid(),
+                   "created": now, "started": None, "finished": None}
+            self._write(job)
+            index[key] = job["id"]
+            self._write_index(index)
+        self._pool.submit(self._run, job, fn, args, kwargs)
+        if now - self._last_prune > PRUNE_EVERY_S:
+            self._last_prune = now
+            self._prune(now)
+        return job
+
+    def invalidate(self, key: str):
+        """Zwischengespeichertes Ergebnis verwerfen (z.B. Backup-Liste nach neuem Backup)."""
+        with self._locked():
+            index = self._read_index()
+            job = self.get(index.get(key))
+            if job and job["status"] not in ACTIVE:
+                index.pop(key, None)
+                self._write_index(index)
+
+    def _run(self, job: dict, fn, args, kwargs):
+        def progress(percent=None, message=None):
+            if percent is not None:
+                job["progress"] = max(0, min(100, int(percent)))
+            if message is not None:
+                job["message"] = str(message)
+            self._write(job)
+
+        job.update(status="running", started=time.time())
+        self._write(job)
+        try:
+            job["result"] = fn(progress, *args, **kwargs)
+            job.update(status="done", progress=100)
+        except Exception as e:
+            job.update(status="error", message=str(e) or type(e).__name__)
+        job["finished"] = time.time()
+        self._write(job)
+
+    def _prune(self, now: float):
+        for name in os.listdir(self._dir):
+            if not name.endswith(".json") or name == "index.json":
+                continue
+            job = self.get(name[:-5])
+            if job and job["status"] not in ACTIVE and now - (job["finished"] or job["created"]) > KEEP_S:
+                try:
+                    os.remove(self._path(job["id"]))
+                except OSError:
+                    pass
+
+
+class Debouncer:
+    """fn() erst aufrufen, wenn seit dem letzten trigger() delay_s vergangen sind – spätestens
+    max_wait_s nach dem ersten trigger() einer Serie (Dauer-Änderungen verhindern ihn nicht ewig)."""
+
+    def __init__(self, fn, max_wait_s: float = 300.0):
+        self._fn = fn
+        self._max_wait = max_wait_s
+        self._cond = threading.Condition()
+        self._first = None
+        self._due = None
+        self._thread = None
+
+    def trigger(self, delay_s: float):
+        now = time.monotonic()
+        with self._cond:
+            if self._first is None:
+                self._first = now
+            self._due = min(now + max(0.0, delay_s), self._first + self._max_wait)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._wait_and_run, daemon=True, name="debounce")
+                self._thread.start()
+            self._cond.notify()
+
+    def _wait_and_run(self):
+        with self._cond:
+            while True:
+                remaining = self._due - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            self._first = self._due = None
+            self._thread = None
+        try:
+            self._fn()
+        except Exception as e:
+            logging.warning(f"Verzögerter Aufruf fehlgeschlagen: {e}")
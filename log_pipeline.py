@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+log_pipeline.py – Asynchrones Logging für den Logger (schont die SD-Karte).
+
+Die Messschleife legt Log-Records nur in eine begrenzte Queue (QueueHandler,
+blockiert nie – bei voller Queue wird verworfen und gezählt). Ein
+QueueListener-Thread schreibt gepuffert in die Logdatei und leert den Puffer
+höchstens alle FLUSH_INTERVAL_S (Fehler sofort). Rotation nach Größe oder täglich,
+rotierte Dateien werden gzip-komprimiert; bei knappem Speicherplatz werden nur
+noch Fehler geschrieben.
+
+Wiederholte gleiche Warnungen/Fehler (z.B. "Fehler beim Senden an InfluxDB"
+in jedem Zyklus) werden innerhalb von DEDUPE_WINDOW_S unterdrückt und danach
+einmal mit der Anzahl der unterdrückten Wiederholungen ausgegeben.
+"""
+
+import gzip
+import logging
+import logging.handlers
+import os
+import queue
+import shutil
+import sys
+import time
+
+QUEUE_MAX = 5000
+FLUSH_INTERVAL_S = 2.0
+MAX_BYTES = 5 * 1024 * 1024
+BACKUP_COUNT = 7
+DEDUPE_WINDOW_S = 300.0
+MIN_FREE_MB = 50
+WRITE_BUFFER = 64 * 1024
+
+FORMAT = "%(asctime)s [%(levelname)s] %(message)s"
+
+
+# ============================================================
+# 🔁 DUPLIKATE UNTERDRÜCKEN
+# ============================================================
+class DedupeFilter(logging.Filter):
+    """Lässt eine Meldung ab WARNING pro Fenster nur einmal durch."""
+
+    def __init__(self, window_s: float = DEDUPE_WINDOW_S, min_level: int = logging.WARNING):
+        super().__init__()
+        self.window_s = window_s
+        self.min_level = min_level
+        self._seen = {}    # (level, text) -> [erstes_mal, unterdrückt]
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno < self.min_level:
+            return True
+        key = (record.levelno, record.getMessage())
+        now = record.created
+        entry = self._seen.get(key)
+        if entry is None or now - entry[0] >= self.window_s:
+            suppressed = entry[1] if entry else 0
+            self._seen[key] = [now, 0]
+            if suppressed:
+                record.msg = f"{key[1]} ({suppressed}× unterdrückt in {self.window_s:.0f} s)"
+                record.args = None
+            if len(self._seen) > 1000:
+                self._seen = {k: v for k, v in self._seen.items() if now - v[0] < self.window_s}
+            return True
+        entry[1] += 1
+        return False
+
+
+# ============================================================
+# 📥 NICHT BLOCKIERENDE QUEUE
+# ============================================================
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    def __init__(self, q):
+        super().__init__(q)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+# ============================================================
+# 💾 GEPUFFERTE, ROTIERENDE DATEI
+# ============================================================
+def _gzip_namer(name: str) -> str:
+    return name + ".gz"
+
+
+def _gzip_rotator(source: str, dest: str):
+    with open(source, "rb") as f_in, gzip.open(dest, "wb", compresslevel=6) as f_out:
+        shutil.copyfileobj(f_in, f_out)
+    os.remove(source)
+
+
+class BufferedRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    """
+    RotatingFileHandler mit großem Schreibpuffer: flush() schreibt nur, wenn
+    FLUSH_INTERVAL_S vergangen ist oder ein Fehler protokolliert wurde.
+    Rotiert zusätzlich beim ersten Eintrag eines neuen Kalendertags.
+    """
+
+    def __init__(self, filename: str):
+        super().__init__(filename, maxBytes=MAX_BYTES, backupCount=BACKUP_COUNT,
+                         encoding="utf-8", delay=True)
+        self.namer = _gzip_namer
+        self.rotator = _gzip_rotator
+        self._last_flush = time.monotonic()
+        self._force_flush = False
+        self._file_day = self._day(self._last_write())
+        self._disk_checked = 0.0
+        self._disk_low = False
+
+    @staticmethod
+    def _day(ts: float) -> tuple:
+        return time.localtime(ts)[:3]
+
+    def _last_write(self) -> float:
+        try:
+            return os.stat(self.baseFilename).st_mtime
+        except OSError:
+            return time.time()
+
+    def _open(self):
+        return open(self.baseFilename, self.mode, encoding=self.encoding, buffering=WRITE_BUFFER)
+
+    def shouldRollover(self, record) -> bool:
+        if self._day(record.created) != self._file_day:
+            self._file_day = self._day(record.created)
+            if os.path.exists(self.baseFilename) and os.path.getsize(self.baseFilename) > 0:
+                return True
+        return bool(super().shouldRollover(record))
+
+    def _disk_space_low(self) -> bool:
+        now = time.monotonic()
+        if now - self._disk_checked >= 60:
+            self._disk_checked = now
+            try:
+                free_mb = shutil.disk_usage(os.path.dirname(self.baseFilename)).free / 1024 / 1024
+                self._disk_low = free_mb < MIN_FREE_MB
+            except OSError:
+                self._disk_low = False
+        return self._disk_low
+
+    def emit(self, record):
+        if record.levelno < logging.ERROR and self._disk_space_low():
+            return
+        if record.levelno >= logging.ERROR:
+            self._force_flush = True
+        super().emit(record)
+
+    def flush(self, force: bool = False):
+        if not (force or self._force_flush or time.monotonic() - self._last_flush >= FLUSH_INTERVAL_S):
+            return
+        self._force_flush = False
+        self._last_flush = time.monotonic()
+        super().flush()
+
+    def close(self):
+        self.flush(force=True)
+        super().close()
+
+
+class _Listener(logging.handlers.QueueListener):
+    """QueueListener, der in Leerlaufphasen den Schreibpuffer leert."""
+
+    def dequeue(self, block):
+        while True:
+            try:
+                return self.queue.get(timeout=FLUSH_INTERVAL_S)
+            except queue.Empty:
+                for handler in self.handlers:
+                    try:
+                        handler.flush()
+                    except Exception:
+                        pass
+
+
+# ============================================================
+# 🚀 EINRICHTEN
+# ============================================================
+_listener = None
+_queue_handler = None
+_console = None
+
+
+def setup(logfile: str, level: int = logging.INFO):
+    """Ersetzt die Root-Handler durch QueueHandler → (Datei, Konsole)."""
+    global _listener, _queue_handler, _console
+    os.makedirs(os.path.dirname(logfile), exist_ok=True)
+    formatter = logging.Formatter(FORMAT)
+
+    file_handler = BufferedRotatingFileHandler(logfile)
+    file_handler.setFormatter(formatter)
+    # stderr landet unter systemd in logger.err.log – dort nur Warnungen/Fehler,
+    # interaktiv (Terminal) alles
+    _console = logging.StreamHandler()
+    _console.setFormatter(formatter)
+
+    q = queue.Queue(maxsize=QUEUE_MAX)
+    _queue_handler = DroppingQueueHandler(q)
+    _queue_handler.addFilter(DedupeFilter())
+
+    root = logging.getLogger()
+    for h in list(root.handlers):
+        root.removeHandler(h)
+    root.addHandler(_queue_handler)
+
+    _listener = _Listener(q, file_handler, _console, respect_handler_level=True)
+    _listener.start()
+    set_level(level)
+
+
+def set_level(level: int):
+    root = logging.getLogger()
+    root.setLevel(level)
+    if _queue_handler:
+        _queue_handler.setLevel(level)
+    if _console:
+        _console.setLevel(level if sys.stderr.isatty() else max(level, logging.WARNING))
+
+
+def dropped() -> int:
+    return _queue_handler.dropped if _queue_handler else 0
+
+
+def shutdown():
+    """Restliche Records schreiben und Puffer leeren (am Programmende)."""
+    global _listener
+    if _listener:
+        _listener.stop()
+        for h in _listener.handlers:
+            try:
+                h.close()
+            except Exception:
+                pass
+        _listener = None
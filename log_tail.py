@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+log_tail.py – Logdateien von hinten lesen und inkrementell verfolgen.
+
+- tail(): liest blockweise rückwärts vom Dateiende, bis genug passende
+  Zeilen gefunden sind – unabhängig von der Dateigröße, ohne Subprozess.
+- follow(): liefert ab einem Cursor (inode, byte-offset) nur neu
+  angehängte, vollständige Zeilen. Rotation (neue inode) und
+  copytruncate (Datei kürzer als der Offset) werden erkannt.
+
+Der Cursor lässt sich als "inode:offset" serialisieren und dient im
+SSE-Stream als Event-ID, damit ein Reconnect nahtlos fortsetzt.
+"""
+
+import os
+import re
+
+BLOCK_SIZE = 8192
+MAX_SCAN_BYTES = 4 * 1024 * 1024     # tail(): höchstens so weit zurücklesen
+MAX_READ_BYTES = 256 * 1024          # follow(): pro Aufruf höchstens so viel lesen
+
+LEVELS = {"DEBUG": 10, "INFO": 20, "WARNING": 30, "ERROR": 40, "CRITICAL": 50}
+_LEVEL_RE = re.compile(r"\[(DEBUG|INFO|WARNING|ERROR|CRITICAL)\]")
+
+
+class LineFilter:
+    """Filter nach Mindest-Level ("[LEVEL]" in der Zeile) und/oder regulärem Ausdruck."""
+
+    def __init__(self, level: str = "", pattern: str = ""):
+        self.min_level = LEVELS.get(str(level or "").upper(), 0)
+        # re.error wird bewusst durchgereicht (ungültiges Muster → HTTP 400)
+        self.regex = re.compile(pattern, re.IGNORECASE) if pattern else None
+
+    @property
+    def active(self) -> bool:
+        return bool(self.min_level or self.regex)
+
+    def match(self, line: str) -> bool:
+        if self.min_level:
+            m = _LEVEL_RE.search(line)
+            # Zeilen ohne Level (Tracebacks, fremde Ausgaben) nur ohne Level-Filter
+            if not m or LEVELS[m.group(1)] < self.min_level:
+                return False
+        if self.regex and not self.regex.search(line):
+            return False
+        return True
+
+
+def format_cursor(cursor: tuple) -> str:
+    return f"{cursor[0]}:{cursor[1]}"
+
+
+def parse_cursor(value: str):
+    try:
+        inode, offset = str(value).split(":", 1)
+        return int(inode), int(offset)
+    except (ValueError, AttributeError):
+        return None
+
+
+def tail(path: str, lines: int = 200, line_filter: LineFilter = None) -> tuple:
+    """Letzte `lines` (passende) Zeilen + Cursor am Dateiende. Wirft OSError."""
+    line_filter = line_filter or LineFilter()
+    with open(path, "rb") as f:
+        st = os.fstat(f.fileno())
+        end = st.st_size
+        pos = end
+        rest = b""
+        found = []
+        first = True
+        while pos > 0 and len(found) < lines and end - pos < MAX_SCAN_BYTES:
+            step = min(BLOCK_SIZE, pos)
+            pos -= step
+            f.seek(pos)
+            chunk = f.read(step) + rest
+            parts = chunk.split(b"\n")
+            rest = parts[0]
+            if first and len(parts) > 1:
+                # Unvollständige letzte Zeile: nicht ausgeben, follow() liest sie später ganz
+                end -= len(parts[-1])
+                parts[-1] = b""
+            first = False
+            for raw in reversed(parts[1:]):
+                if not raw:
+                    continue
+                line = raw.decode("utf-8", errors="replace")
+                if line_filter.match(line):
+                    found.append(line)
+                    if len(found) >= lines:
+                        break
+        if pos == 0 and rest and len(found) < lines:
+            line = rest.decode("utf-8", errors="replace")
+            if line_filter.match(line):
+                found.append(line)
+    found.reverse()
+    return found, (st.st_ino, end)
+
+
+def follow(path: str, cursor: tuple, line_filter: LineFilter = None) -> tuple:
+    """
+    Neue vollständige Zeilen seit cursor. Gibt (zeilen, neuer_cursor, rotiert) zurück.
+    Nach Rotation/Kürzung wird die neue Datei von vorne gelesen.
+    """
+    line_filter = line_filter or LineFilter()
+    inode, offset = cursor
+    rotated = False
+    with open(path, "rb") as f:
+        st = os.fstat(f.fileno())
+        if st.st_ino != inode or st.st_size < offset:
+            inode, offset, rotated = st.st_ino, 0, True
+        if st.st_size == offset:
+            return [], (inode, offset), rotated
+        f.seek(offset)
+        data = f.read(min(MAX_READ_BYTES, st.st_size - offset))
+    cut = data.rfind(b"\n")
+    if cut < 0:
+        if len(data) < MAX_READ_BYTES:
+            return [], (inode, offset), rotated    # Zeile noch nicht fertig geschrieben
+        cut = len(data) - 1                        # überlange Zeile: hart umbrechen
+    complete = data[:cut + 1]
+    result = [line for line in complete.decode("utf-8", errors="replace").splitlines()
+              if line and line_filter.match(line)]
+    return result, (inode, offset + len(complete)), rotated
@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+metrics.py – Prometheus/OpenMetrics-Textformat für /metrics.
+
+Alle Werte stammen aus vorberechneten Quellen, kein Tabellen-Scan pro Abruf:
+- logger_stats.json im State-Verzeichnis (cycle_stats.py): Zyklus-Histogramme, Zähler, Queue-Tiefe
+- Ausgangsdienst (get_state / stats), Alarmzustand (eine Zeile pro Regel), reed_counts.json
+- Request-Latenzen der Webapp: jeder Gunicorn-Worker führt eigene Zähler und legt
+  sie höchstens alle FLUSH_INTERVAL_S in web_metrics/<pid>.json im State-Verzeichnis
+  (tmpfs) ab; /metrics summiert alle Dateien lebender Worker, Dateien beendeter
+  Worker werden entfernt.
+"""
+
+import ipaddress
+import json
+import os
+import threading
+import time
+
+FLUSH_INTERVAL_S = 10.0
+PRUNE_INTERVAL_S = 600.0
+REQUEST_BUCKETS_S = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+# ============================================================
+# 🌐 ZUGRIFF
+# ============================================================
+def parse_networks(spec: str) -> list:
+    """"127.0.0.1, 10.8.0.0/24" → Liste von ip_network (ungültige Einträge werden ignoriert)."""
+    nets = []
+    for part in str(spec or "").replace(";", ",").split(","):
+        part = part.strip()
+        if not part:
+            continue
+        try:
+            nets.append(ipaddress.ip_network(part, strict=False))
+        except ValueError:
+            continue
+    return nets
+
+
+def ip_allowed(ip: str, networks: list) -> bool:
+    try:
+        addr = ipaddress.ip_address(ip)
+    except ValueError:
+        return False
+    return any(addr in net for net in networks)
+
+
+# ============================================================
+# ⏱️ REQUEST-LATENZEN (pro Worker)
+# ============================================================
+class RequestMetrics:
+    def __init__(self, dir_path: str):
+        self.dir_path = dir_path
+        self._lock = threading.Lock()
+        self._series = {}      # (route, method, status) -> [count, sum_s, buckets...]
+        self._last_flush = 0.0
+        self._last_prune = 0.0
+
+    def observe(self, route: str, method: str, status: int, seconds: float):
+        key = (route, method, f"{int(status) // 100}xx")
+        with self._lock:
+            s = self._series.get(key)
+            if s is None:
+                s = self._series[key] = [0, 0.0] + [0] * len(REQUEST_BUCKETS_S)
+            s[0] += 1
+            s[1] += seconds
+            for i, bound in enumerate(REQUEST_BUCKETS_S):
+                if seconds <= bound:
+                    s[2 + i] += 1
+                    break
+            due = time.monotonic() - self._last_flush >= FLUSH_INTERVAL_S
+        if due:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            self._last_flush = time.monotonic()
+            data = [list(k) + v for k, v in self._series.items()]
+        try:
+            os.makedirs(self.dir_path, exist_ok=True)
+            path = os.path.join(self.dir_path, f"{os.getpid()}.json")
+            with open(path + ".tmp", "w") as f:
+                json.dump(data, f)
+            os.replace(path + ".tmp", path)
+        except OSError:
+            pass
+        if time.monotonic() - self._last_prune >= PRUNE_INTERVAL_S:
+            self.prune()
+
+    def prune(self) -> list:
+        """Dateien beendeter Worker löschen; gibt die Pfade der lebenden zurück."""
+        self._last_prune = time.monotonic()
+        try:
+            names = os.listdir(self.dir_path)
+        except OSError:
+            return []
+        alive = []
+        for name in names:
+            path = os.path.join(self.dir_path, name)
+            if name.endswith(".tmp"):
+                pid = name.split(".")[0]
+            elif name.endswith(".json"):
+                pid = name[:-5]
+            else:
+                continue
+            try:
+                os.kill(int(pid), 0)
+            except ProcessLookupError:
+                try:
+                    os.remove(path)    # Worker beendet
+                except OSError:
+                    pass
+                continue
+            except (ValueError, PermissionError):
+                pass
+            if name.endswith(".json"):
+                alive.append(path)
+        return alive
+
+    def collect(self) -> dict:
+        """Summe über alle lebenden Worker: {(route, method, status): [count, sum, buckets...]}."""
+        self.flush()
+        total = {}
+        for path in self.prune():
+            try:
+                with open(path) as f:
+                    rows = json.load(f)
+            except (OSError, ValueError):
+                continue
+            for row in rows:
+                key, values = tuple(row[:3]), row[3:]
+                acc = total.get(key)
+                if acc is None:
+                    total[key] = list(values)
+                else:
+                    for i, v in enumerate(values):
+                        acc[i] += v
+        return total
+
+
+# ============================================================
+# 📝 TEXTFORMAT
+# ============================================================
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + "}"
+
+
+def _num(value) -> str:
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, float):
+        return repr(round(value, 6))
+    return str(value)
+
+
+class Exposition:
+    def __init__(self):
+        self._lines = []
+
+    def family(self, name: str, kind: str, help_text: str):
+        self._lines.append(f"# HELP {name} {help_text}")
+        self._lines.append(f"# TYPE {name} {kind}")
+
+    def sample(self, name: str, value, labels: dict = None):
+        if value is None:
+            return
+        self._lines.append(f"{name}{_labels(labels)} {_num(value)}")
+
+    def histogram(self, name: str, bounds, cumulative, total_sum, count, labels: dict = None):
+        labels = labels or {}
+        for bound, c in zip(bounds, cumulative):
+            self.sample(f"{name}_bucket", c, dict(labels, le=_num(float(bound))))
+        self.sample(f"{name}_bucket", count, dict(labels, le="+Inf"))
+        self.sample(f"{name}_sum", total_sum, labels)
+        self.sample(f"{name}_count", count, labels)
+
+    def render(self) -> str:
+        return "\n".join(self._lines) + "\n# EOF\n"
+
+
+# Zähler aus logger_stats.json → Metrikname
+_LOGGER_COUNTERS = {
+    "points_queued":   ("brunnen_points_queued_total", "In die Offline-Queue geschriebene Messpunkte"),
+    "points_flushed":  ("brunnen_points_flushed_total", "Aus der Queue an InfluxDB übertragene Punkte"),
+    "points_dropped":  ("brunnen_points_dropped_total", "Verworfene Punkte (korrupt oder ungültig)"),
+    "flush_retries":   ("brunnen_flush_retries_total", "Flush-Versuche nach einem Fehlschlag"),
+    "influx_writes":   ("brunnen_influx_writes_total", "Erfolgreiche InfluxDB-Writes"),
+    "influx_failures": ("brunnen_influx_failures_total", "Fehlgeschlagene InfluxDB-Writes"),
+    "mqtt_published":  ("brunnen_mqtt_published_total", "Erfolgreich übergebene MQTT-Nachrichten"),
+    "mqtt_failed":     ("brunnen_mqtt_failed_total", "Fehlgeschlagene MQTT-Publishes"),
+    "mqtt_skipped":    ("brunnen_mqtt_skipped_total", "Von paho abgelehnte, übersprungene MQTT-Nachrichten"),
+    "mqtt_acked":      ("brunnen_mqtt_acked_total", "Vom Broker bestätigte MQTT-Nachrichten"),
+    "mqtt_replayed":   ("brunnen_mqtt_replayed_total", "Nach einem Broker-Ausfall nachgesendete MQTT-Nachrichten"),
+    "mqtt_buffer_dropped": ("brunnen_mqtt_buffer_dropped_total", "Wegen Puffer-Obergrenze verworfene MQTT-Zyklen"),
+    "sensor_errors":   ("brunnen_sensor_errors_total", "Fehlerhafte Kanalmessungen"),
+    "flash_writes":    ("brunnen_flash_writes_total", "Gebündelte Zustands-Schreibvorgänge auf die SD-Karte"),
+    "flash_bytes":     ("brunnen_flash_bytes_total", "Dabei geschriebene Bytes"),
+    "flash_deferred":  ("brunnen_flash_deferred_total", "Wegen Schreibbudget verschobene Schreibvorgänge"),
+    "points_downsampled": ("brunnen_points_downsampled_total", "Durch Verdichtung zusammengefasste Queue-Einträge"),
+    "points_live":     ("brunnen_points_live_total", "Sofort (Vorrangspur) gesendete Punkte des aktuellen Zyklus"),
+    "vacuum_pages":    ("brunnen_queue_vacuum_pages_total", "Per incremental_vacuum freigegebene Seiten"),
+}
+
+
+def render(device_id: str, logger_stats: dict, outputs: dict, alarms: list,
+           reed: list, requests_total: dict) -> str:
+    """
+    outputs        : {"state": [...], "locks": {...}, "events": {...}} oder None (Dienst weg)
+    alarms         : [{"key", "name", "active", "acknowledged"}, ...]
+    reed           : [{"gpio", "name", "impulse", "liter"}, ...]
+    requests_total : Ergebnis von RequestMetrics.collect()
+    """
+    now = time.time()
+    out = Exposition()
+    dev = {"device_id": device_id}
+
+    # --- Logger
+    out.family("brunnen_logger_up", "gauge", "Logger-Statistik aktuell (1) oder veraltet/fehlend (0)")
+    out.sample("brunnen_logger_up", bool(logger_stats) and not logger_stats.get("stale"), dev)
+    if logger_stats:
+        out.family("brunnen_logger_last_cycle_timestamp_seconds", "gauge", "Zeitpunkt des letzten Zyklus")
+        out.sample("brunnen_logger_last_cycle_timestamp_seconds", logger_stats.get("updated"), dev)
+        out.family("brunnen_logger_cycles", "counter", "Abgeschlossene Messzyklen seit Start")
+        out.sample("brunnen_logger_cycles_total", logger_stats.get("cycles", 0), dev)
+
+        gauges = logger_stats.get("gauges", {})
+        out.family("brunnen_queue_depth", "gauge", "Einträge in der Offline-Queue")
+        out.sample("brunnen_queue_depth", gauges.get("queue_depth"), dev)
+        oldest = gauges.get("queue_oldest_ts")
+        out.family("brunnen_queue_oldest_age_seconds", "gauge", "Alter des ältesten Queue-Eintrags")
+        out.sample("brunnen_queue_oldest_age_seconds", max(0.0, now - oldest) if oldest else 0.0, dev)
+        out.family("brunnen_queue_downsampled", "gauge", "Verdichtete Einträge in der Offline-Queue")
+        out.sample("brunnen_queue_downsampled", gauges.get("queue_downsampled"), dev)
+        out.family("brunnen_queue_db_bytes", "gauge", "Größe der Queue-Datenbank nach Belegung")
+        for state in ("used", "free"):
+            out.sample("brunnen_queue_db_bytes", gauges.get(f"queue_{state}_bytes"), dict(dev, state=state))
+        out.family("brunnen_backlog_rate_points_per_second", "gauge", "Nachsende-Durchsatz des Rückstands")
+        out.sample("brunnen_backlog_rate_points_per_second", gauges.get("backlog_rate_pps"), dev)
+        out.family("brunnen_backlog_eta_seconds", "gauge", "Geschätzte Restzeit bis der Rückstand gesendet ist")
+        out.sample("brunnen_backlog_eta_seconds", gauges.get("backlog_eta_s"), dev)
+        out.family("brunnen_mqtt_connected", "gauge", "MQTT-Verbindung des Loggers")
+        out.sample("brunnen_mqtt_connected", gauges.get("mqtt_connected"), dev)
+        out.family("brunnen_mqtt_buffered_cycles", "gauge", "Noch nicht bestätigte MQTT-Zyklen im Puffer")
+        out.sample("brunnen_mqtt_buffered_cycles", gauges.get("mqtt_buffered_cycles"), dev)
+        out.family("brunnen_interlocks_active", "gauge", "Aktive Verriegelungen")
+        out.sample("brunnen_interlocks_active", gauges.get("interlocks_active"), dev)
+        out.family("brunnen_logger_write_bytes", "gauge", "Vom Logger-Prozess auf Blockgeräte geschriebene Bytes")
+        out.sample("brunnen_logger_write_bytes", gauges.get("process_write_bytes"), dev)
+
+        counters = logger_stats.get("counters", {})
+        for key, (name, help_text) in _LOGGER_COUNTERS.items():
+            out.family(name[:-len("_total")], "counter", help_text)
+            out.sample(name, counters.get(key, 0), dev)
+
+        out.family("brunnen_queue_retention_dropped", "counter", "Wegen Queue-Grenzen verworfene Einträge")
+        for reason in ("age", "rows", "bytes"):
+            out.sample("brunnen_queue_retention_dropped_total", counters.get(f"retention_dropped_{reason}", 0),
+                       dict(dev, reason=reason))
+
+        bounds_s = [b / 1000.0 for b in logger_stats.get("bucket_bounds_ms", [])]
+        out.family("brunnen_logger_stage_duration_seconds", "histogram", "Laufzeit der Logger-Stufen")
+        for stage, st in sorted(logger_stats.get("stages", {}).items()):
+            out.histogram("brunnen_logger_stage_duration_seconds", bounds_s, st.get("buckets", []),
+                          st.get("sum_ms", 0) / 1000.0, st.get("count", 0), dict(dev, stage=stage))
+
+    # --- Ausgänge
+    out.family("brunnen_outputs_up", "gauge", "Ausgangsdienst erreichbar")
+    out.sample("brunnen_outputs_up", outputs is not None, dev)
+    if outputs is not None:
+        locks = outputs.get("locks", {})
+        out.family("brunnen_output_state", "gauge", "Schaltzustand der MOSFET-Ausgänge (1 = EIN)")
+        for i, state in enumerate(outputs.get("state", [])):
+            out.sample("brunnen_output_state", bool(state), dict(dev, channel=str(i + 1)))
+        out.family("brunnen_output_locked", "gauge", "Ausgang durch Verriegelung gesperrt")
+        for i in range(len(outputs.get("state", []))):
+            out.sample("brunnen_output_locked", bool(locks.get(str(i))), dict(dev, channel=str(i + 1)))
+        events = outputs.get("events") or {}
+        out.family("brunnen_output_events", "counter", "Schaltereignisse nach Verbleib")
+        for result in ("written", "spooled", "dropped"):
+            out.sample("brunnen_output_events_total", events.get(result, 0), dict(dev, result=result))
+
+    # --- Alarme
+    # (Samples einer Familie müssen im OpenMetrics-Format zusammenhängend stehen)
+    for field, help_text in (("active", "Alarmzustand pro Regel (1 = aktiv)"),
+                             ("acknowledged", "Aktiver Alarm quittiert")):
+        out.family(f"brunnen_alarm_{field}", "gauge", help_text)
+        for a in alarms:
+            out.sample(f"brunnen_alarm_{field}", bool(a.get(field)),
+                       dict(dev, key=a["key"], name=a.get("name", "")))
+
+    # --- Reedkontakte
+    for field, metric, help_text in (("impulse", "brunnen_reed_pulses", "Impulse der Wasserzähler"),
+                                     ("liter", "brunnen_reed_liters", "Volumen der Wasserzähler in Litern")):
+        out.family(metric, "counter", help_text)
+        for r in reed:
+            out.sample(f"{metric}_total", r[field], dict(dev, gpio=str(r["gpio"]), name=r["name"]))
+
+    # --- Webapp
+    out.family("brunnen_http_request_duration_seconds", "histogram", "Antwortzeit der Webapp")
+    for (route, method, status), values in sorted(requests_total.items()):
+        count, total_sum, buckets = values[0], values[1], values[2:]
+        cumulative, acc = [], 0
+        for c in buckets:
+            acc += c
+            cumulative.append(acc)
+        out.histogram("brunnen_http_request_duration_seconds", REQUEST_BUCKETS_S, cumulative,
+                      total_sum, count, dict(dev, route=route, method=method, status=status))
+
+    return out.render()
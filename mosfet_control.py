@@ -10,15 +10,28 @@ CHANNELS = [4, 17, 18, 22, 23, 24]
 # Globale Variablen
 chip = None
 _handles = {}
+_group_claimed = False   # True: alle Kanäle als lgpio-Gruppe reserviert (Leader = CHANNELS[0])
 _state = {i: False for i in range(len(CHANNELS))}
 
 
 def init_gpio():
-    """Initialisiert alle GPIOs als Ausgänge."""
-    global chip
+    """Initialisiert alle GPIOs als Ausgänge – bevorzugt als eine lgpio-Gruppe."""
+    global chip, _group_claimed
     if chip is None:
         chip = lgpio.gpiochip_open(0)
 
+    if _group_claimed:
+        return
+    if not _handles:
+        try:
+            lgpio.group_claim_output(chip, CHANNELS, [0] * len(CHANNELS))
+            _group_claimed = True
+            for i in range(len(CHANNELS)):
+                _state[i] = False
+            return
+        except Exception as e:
+            logging.warning(f"GPIO-Gruppe {CHANNELS} nicht reservierbar, nutze Einzel-GPIOs: {e}")
+
     for i, ch in enumerate(CHANNELS):
         try:
             if ch not in _handles:
@@ -30,28 +43,56 @@ def init_gpio():
             logging.error(f"Fehler beim Initialisieren von GPIO {ch}: {e}")
 
 
-def set_output(index: int, state: bool):
-    """Setzt den angegebenen Kanal auf HIGH oder LOW (thread-safe)."""
-    global chip
-    if chip is None:
-        chip = lgpio.gpiochip_open(0)
-
-    ch = CHANNELS[index]
+def set_outputs(changes: dict) -> bool:
+    """
+    Setzt mehrere Kanäle gleichzeitig (thread-safe).
+    changes = {index: bool}. Mit reservierter Gruppe geschieht das mit
+    einem einzigen group_write (Bitmaske), sonst kanalweise.
+    """
+    for index in changes:
+        if not 0 <= int(index) < len(CHANNELS):
+            raise ValueError(f"Ungültiger Kanal: {index}")
+    changes = {int(i): bool(v) for i, v in changes.items()}
+    if not changes:
+        return True
 
     with _gpio_lock:
-        if ch not in _handles:
+        if chip is None or (not _group_claimed and len(_handles) < len(CHANNELS)):
+            init_gpio()
+
+        if _group_claimed:
+            bits = mask = 0
+            for index, state in changes.items():
+                mask |= 1 << index
+                if state:
+                    bits |= 1 << index
             try:
-                handle = lgpio.gpio_claim_output(chip, ch)
-                _handles[ch] = handle
+                lgpio.group_write(chip, CHANNELS[0], bits, mask)
             except Exception as e:
-                logging.error(f"GPIO {ch} konnte nicht reserviert werden: {e}")
-                return
+                logging.error(f"Fehler beim Gruppen-Schreiben (Maske {mask:#04x}): {e}")
+                return False
+            _state.update(changes)
+            return True
 
-        try:
-            lgpio.gpio_write(chip, ch, 1 if state else 0)
-            _state[index] = state
-        except Exception as e:
-            logging.error(f"Fehler beim Setzen von Ausgang {index}: {e}")
+        ok = True
+        for index, state in changes.items():
+            ch = CHANNELS[index]
+            if ch not in _handles:
+                logging.error(f"GPIO {ch} nicht reserviert – Ausgang {index} übersprungen")
+                ok = False
+                continue
+            try:
+                lgpio.gpio_write(chip, ch, 1 if state else 0)
+                _state[index] = state
+            except Exception as e:
+                logging.error(f"Fehler beim Setzen von Ausgang {index}: {e}")
+                ok = False
+        return ok
+
+
+def set_output(index: int, state: bool) -> bool:
+    """Setzt den angegebenen Kanal auf HIGH oder LOW (thread-safe)."""
+    return set_outputs({index: state})
 
 
 def get_state():
@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+mqtt_buffer.py – Dauerhafte MQTT-Pufferung mit Nachsenden nach Broker-Ausfällen.
+
+Jeder Messzyklus ergibt eine Gruppe von Nachrichten (topic, payload) und wird
+zuerst in mqtt_log (data/offline_cache.db) angehängt. Ein eigener Cursor
+(mqtt_cursor) zeigt auf den letzten vollständig bestätigten Zyklus; alles
+dahinter wird in Reihenfolge veröffentlicht – im Normalbetrieb nur der gerade
+angehängte Zyklus, nach einem Ausfall der ganze Rückstand, gebremst auf
+MQTT_REPLAY_MSGS_PER_S. paho begrenzt zusätzlich die gleichzeitig
+unbestätigten Nachrichten (max_inflight_messages_set).
+
+"Bestätigt" heißt on_publish von paho (QoS 1: PUBACK, QoS 2: PUBCOMP, QoS 0:
+gesendet). Der Callback läuft im paho-Thread und legt die mid nur in eine
+deque; ausgewertet wird im Logger-Thread in pump() – keine Sperre um
+publish(). Bei einem Verbindungsabbruch sendet paho seine offenen
+Nachrichten selbst erneut; erst ein neuer Client (attach) oder ein Neustart
+beginnt wieder beim Cursor (at-least-once, Duplikate möglich).
+
+Lehnt paho eine einzelne Nachricht dauerhaft ab (z.B. ValueError bei einem
+Wildcard-Topic), wird nur diese übersprungen und gezählt (mqtt_skipped) –
+sonst hinge der Rückstand für immer an ihr fest.
+
+Nachrichten sind (topic, payload) oder (topic, payload, retain); binäre
+Nutzlast (Batch-Modus "struct"/"zlib", siehe mqtt_codec.py) wird base64-kodiert
+abgelegt.
+"""
+
+import base64
+import json
+import logging
+import sqlite3
+import time
+from collections import OrderedDict, deque
+
+FLAG_BINARY = 1
+FLAG_RETAIN = 2
+
+MAX_CYCLES = 17280               # Puffer-Obergrenze (1 Tag bei 5 s Messintervall)
+MAX_PENDING_FACTOR = 5           # höchstens inflight × Faktor Nachrichten an paho übergeben
+PRUNE_INTERVAL_S = 60.0
+REPLAY_FETCH = 50                # Zyklen pro Leseschritt
+
+try:
+    from paho.mqtt.client import MQTT_ERR_SUCCESS, MQTT_ERR_NO_CONN
+except ImportError:
+    MQTT_ERR_SUCCESS, MQTT_ERR_NO_CONN = 0, 4
+
+
+def _pack(messages: list) -> str:
+    rows = []
+    for msg in messages:
+        topic, payload = msg[0], msg[1]
+        flags = FLAG_RETAIN if len(msg) > 2 and msg[2] else 0
+        if isinstance(payload, (bytes, bytearray)):
+            payload = base64.b64encode(payload).decode("ascii")
+            flags |= FLAG_BINARY
+        rows.append([topic, payload, flags] if flags else [topic, payload])
+    return json.dumps(rows)
+
+
+def _unpack(raw: str) -> list:
+    """[(topic, payload, retain)] – ältere Einträge haben kein Flag-Feld."""
+    messages = []
+    for row in json.loads(raw):
+        flags = row[2] if len(row) > 2 else 0
+        payload = base64.b64decode(row[1]) if flags & FLAG_BINARY else row[1]
+        messages.append((row[0], payload, bool(flags & FLAG_RETAIN)))
+    return messages
+
+
+class MqttBuffer:
+    def __init__(self, db_path: str, stats=None, max_cycles: int = MAX_CYCLES):
+        self.stats = stats
+        self.max_cycles = max_cycles
+        self._conn = sqlite3.connect(db_path, timeout=5)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS mqtt_log (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                ts REAL NOT NULL,
+                messages TEXT NOT NULL
+            )""")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS mqtt_cursor (
+                name TEXT PRIMARY KEY,
+                last_id INTEGER NOT NULL
+            )""")
+        self._conn.commit()
+        row = self._conn.execute("SELECT last_id FROM mqtt_cursor WHERE name='acked'").fetchone()
+        self.cursor = row[0] if row else 0
+        self._saved_cursor = self.cursor
+        self._last_id = self._conn.execute("SELECT MAX(id) FROM mqtt_log").fetchone()[0] or 0
+        self._acks = deque()              # mids aus dem paho-Thread
+        self._mids = {}                   # mid -> log_id
+        self._outstanding = OrderedDict() # log_id -> offene Nachrichten (veröffentlicht, unbestätigt)
+        self._sent_id = self.cursor       # höchste an paho übergebene log_id
+        self._failed = False              # Publish abgelehnt → beim nächsten pump() ab Cursor neu
+        self._last_pump = time.monotonic()
+        self._last_prune = 0.0
+
+    # ------------------------------------------------------------
+    # Aufrufe aus dem paho-Thread
+    # ------------------------------------------------------------
+    def on_publish(self, mid: int):
+        self._acks.append(mid)
+
+    # ------------------------------------------------------------
+    def attach(self):
+        """Neuer paho-Client: alles Unbestätigte ab dem Cursor erneut senden."""
+        self._acks.clear()
+        self._mids.clear()
+        self._outstanding.clear()
+        self._sent_id = self.cursor
+
+    def _incr(self, name: str, n: int = 1):
+        if self.stats and n:
+            self.stats.incr(name, n)
+
+    def _process_acks(self):
+        acked = 0
+        while self._acks:
+            log_id = self._mids.pop(self._acks.popleft(), None)
+            if log_id in self._outstanding:
+                self._outstanding[log_id] -= 1
+                acked += 1
+        self._incr("mqtt_acked", acked)
+        while self._outstanding:
+            log_id, remaining = next(iter(self._outstanding.items()))
+            if remaining > 0:
+                break
+            self._outstanding.popitem(last=False)
+            self.cursor = log_id
+
+    def _replay(self, client, qos: int, budget: int, max_pending: int):
+        while budget > 0 and len(self._mids) < max_pending:
+            rows = self._conn.execute(
+                "SELECT id, messages FROM mqtt_log WHERE id > ? ORDER BY id ASC LIMIT ?",
+                (self._sent_id, REPLAY_FETCH)).fetchall()
+            if not rows:
+                return
+            for log_id, raw in rows:
+                try:
+                    messages = _unpack(raw)
+                except (ValueError, TypeError, IndexError):
+                    messages = []
+                if len(messages) > budget and self._outstanding:
+                    return    # Rest im nächsten Zyklus
+                pending = 0
+                for topic, payload, retain in messages:
+                    try:
+                        info = client.publish(topic, payload, qos=qos, retain=retain)
+                    except (ValueError, TypeError) as e:
+                        logging.error(f"❌ MQTT Nachricht verworfen ({topic!r}): {e}")
+                        self._incr("mqtt_skipped")
+                        continue
+                    if info.rc not in (MQTT_ERR_SUCCESS, MQTT_ERR_NO_CONN):
+                        logging.warning(f"⚠️  MQTT Publish Fehler ({topic}): rc={info.rc}")
+                        self._incr("mqtt_failed")
+                        self._failed = True
+                        return
+                    self._mids[info.mid] = log_id
+                    pending += 1
+                self._outstanding[log_id] = pending
+                self._sent_id = log_id
+                budget -= len(messages)
+                self._incr("mqtt_published", len(messages))
+                if log_id < self._last_id:
+                    self._incr("mqtt_replayed", len(messages))
+                if budget <= 0 or len(self._mids) >= max_pending:
+                    return
+
+    def _prune(self):
+        """Bestätigte Zyklen löschen, Obergrenze durchsetzen (älteste zuerst)."""
+        self._conn.execute("DELETE FROM mqtt_log WHERE id <= ?", (self.cursor,))
+        floor = self._last_id - self.max_cycles
+        if floor > self.cursor:
+            self._incr("mqtt_buffer_dropped", floor - self.cursor)
+            logging.warning(f"✂️ MQTT-Puffer voll: {floor - self.cursor} älteste Zyklen verworfen")
+            self._conn.execute("DELETE FROM mqtt_log WHERE id <= ?", (floor,))
+            self.cursor = floor
+            if self._sent_id < floor:
+                self._sent_id = floor
+            for log_id in [k for k in self._outstanding if k <= floor]:
+                del self._outstanding[log_id]
+
+    # ------------------------------------------------------------
+    def pump(self, client, connected: bool, messages: list, qos: int = 1,
+             replay_per_s: float = 50.0, max_inflight: int = 20):
+        """
+        Einmal pro Messzyklus (Logger-Thread): Zyklus anhängen, Bestätigungen
+        auswerten, bei Verbindung den Rückstand ab dem Cursor veröffentlichen.
+        """
+        now = time.monotonic()
+        if messages:
+            # Sofort committen: die Schreibsperre der gemeinsamen DB nie über publish() halten
+            cur = self._conn.execute("INSERT INTO mqtt_log (ts, messages) VALUES (?, ?)",
+                                     (time.time(), _pack(messages)))
+            self._last_id = cur.lastrowid
+            self._conn.commit()
+        self._process_acks()
+
+        if self._failed:
+            self._failed = False
+            self.attach()
+        if client is not None and connected:
+            budget = max(len(messages), int(replay_per_s * (now - self._last_pump)))
+            self._replay(client, qos, budget, max(1, max_inflight) * MAX_PENDING_FACTOR)
+        self._last_pump = now
+
+        cursor = self.cursor
+        try:
+            if now - self._last_prune >= PRUNE_INTERVAL_S:
+                self._last_prune = now
+                self._prune()
+            if cursor != self._saved_cursor:
+                self._conn.execute("INSERT OR REPLACE INTO mqtt_cursor (name, last_id) VALUES ('acked', ?)",
+                                   (cursor,))
+            self._conn.commit()
+            self._saved_cursor = cursor
+        except sqlite3.Error:
+            self._conn.rollback()   # Sperre freigeben, nächster Zyklus versucht es erneut
+            raise
+
+    def status(self) -> dict:
+        return {
+            "buffered_cycles": max(0, self._last_id - self.cursor),
+            "inflight": len(self._mids),
+            "cursor": self.cursor,
+        }
+
+    def close(self):
+        try:
+            self._conn.commit()
+            self._conn.close()
+        except sqlite3.Error:
+            pass
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+mqtt_codec.py – Kompakte MQTT-Nutzlast: eine Nachricht pro Messzyklus.
+
+Im Kanalmodus geht pro Kanal eine JSON-Nachricht hinaus, die jedes Mal
+device_id, location, name, type und unit wiederholt. Im Batch-Modus stehen
+diese Angaben einmal im Schema (retained auf <prefix>/<device_id>/batch/schema),
+die Zyklus-Nachricht auf <prefix>/<device_id>/batch enthält nur noch Werte:
+
+- "json"   : {"s": schema_id, "t": epoch_ms, "d": [[werte kanal 1], ...]}
+- "zlib"   : dasselbe JSON, zlib-komprimiert
+- "struct" : Binär nach schema["struct"] (Big Endian): Version, schema_id,
+             epoch_ms, danach je Kanal die Felder als float32/float64/uint32;
+             fehlende Werte = NaN bzw. 0xFFFFFFFF
+
+Die Reihenfolge der Kanäle und Felder legt das Schema fest. Es bleibt stabil,
+solange keine neuen Kanäle auftauchen oder sich Name/Typ/Einheit ändern –
+fällt ein Kanal in einem Zyklus aus (z.B. BMP280), steht dort null bzw. NaN.
+decode() ist die Gegenrichtung für Empfänger (fleet_ingest.py) und den
+Benchmark; die Kodierung erkennt detect_encoding() am ersten Byte.
+"""
+
+import json
+import math
+import struct
+import zlib
+from datetime import datetime
+
+FORMAT_VERSION = 1
+MODES = ("channel", "batch", "both")
+ENCODINGS = ("json", "zlib", "struct")
+
+HEADER_FORMAT = "BHQ"             # Version, schema_id, epoch_ms
+U32_NONE = 0xFFFFFFFF
+
+# Felder pro Sensortyp (Reihenfolge = Layout) und ihr struct-Code
+TYPE_FIELDS = {
+    "LEVEL":    (("value", "f"), ("current_mA", "f"), ("level_m", "f"), ("wasser_oberflaeche_m", "f"),
+                 ("messwert_NN", "f"), ("pegel_diff", "f")),
+    "PRESSURE": (("value", "f"), ("temperature_C", "f")),
+    "COUNTER":  (("value", "d"), ("impulse_total", "I")),
+}
+DEFAULT_FIELDS = (("value", "f"), ("current_mA", "f"))
+
+
+class SchemaMismatch(ValueError):
+    """Batch verweist auf ein anderes Schema als das bekannte."""
+
+
+def _epoch_ms(timestamp) -> int:
+    try:
+        return int(datetime.fromisoformat(str(timestamp)).timestamp() * 1000)
+    except (TypeError, ValueError):
+        return 0
+
+
+def _channel_schema(entry: dict) -> dict:
+    sensor_type = entry.get("type", "") or ""
+    fields = TYPE_FIELDS.get(sensor_type, DEFAULT_FIELDS)
+    return {
+        "c": entry.get("channel", "unknown"),
+        "n": entry.get("name", ""),
+        "t": sensor_type,
+        "u": entry.get("unit", "") or "",
+        "f": [name for name, _ in fields],
+        "x": "".join(code for _, code in fields),
+    }
+
+
+class BatchEncoder:
+    """Hält das aktuelle Schema und kodiert einen Zyklus (all_data) in eine Nachricht."""
+
+    def __init__(self, device_id: str = "", location: str = ""):
+        self.device_id = device_id
+        self.location = location
+        self.schema = None
+        self._index = {}              # channel -> Position im Schema
+
+    def reset(self, device_id: str = None, location: str = None):
+        """Nach Config-Reload: Schema beim nächsten Zyklus neu aufbauen."""
+        if device_id is not None:
+            self.device_id = device_id
+        if location is not None:
+            self.location = location
+        self.schema = None
+        self._index = {}
+
+    def _build_schema(self, channels: list) -> dict:
+        body = {
+            "v": FORMAT_VERSION,
+            "device_id": self.device_id,
+            "location": self.location,
+            "channels": channels,
+            "struct": ">" + HEADER_FORMAT + "".join(ch["x"] for ch in channels),
+        }
+        body["id"] = zlib.crc32(json.dumps(body, sort_keys=True).encode()) & 0xFFFF
+        return body
+
+    def update_schema(self, all_data: list) -> bool:
+        """True, wenn sich das Schema geändert hat (neu veröffentlichen)."""
+        channels = list(self.schema["channels"]) if self.schema else []
+        changed = self.schema is None
+        for entry in all_data:
+            ch = _channel_schema(entry)
+            pos = self._index.get(ch["c"])
+            if pos is None:
+                self._index[ch["c"]] = len(channels)
+                channels.append(ch)
+                changed = True
+            elif channels[pos] != ch:
+                channels[pos] = ch
+                changed = True
+        if changed:
+            self.schema = self._build_schema(channels)
+        return changed
+
+    def schema_payload(self) -> str:
+        return json.dumps(self.schema, separators=(",", ":")) if self.schema else ""
+
+    def encode(self, all_data: list, encoding: str = "json"):
+        """Nutzlast (str bei json, sonst bytes) für einen Zyklus; update_schema() vorher aufrufen."""
+        rows = [None] * len(self.schema["channels"])
+        for entry in all_data:
+            pos = self._index.get(entry.get("channel", "unknown"))
+            if pos is not None:
+                rows[pos] = entry
+        ts = _epoch_ms(all_data[0].get("timestamp")) if all_data else 0
+
+        if encoding == "struct":
+            values = [FORMAT_VERSION, self.schema["id"], ts]
+            for ch, entry in zip(self.schema["channels"], rows):
+                for name, code in zip(ch["f"], ch["x"]):
+                    raw = entry.get(name) if entry else None
+                    if code == "I":
+                        values.append(int(raw) if raw is not None else U32_NONE)
+                    else:
+                        values.append(float(raw) if raw is not None else math.nan)
+            return struct.pack(self.schema["struct"], *values)
+
+        data = [[entry.get(name) for name in ch["f"]] if entry else None
+                for ch, entry in zip(self.schema["channels"], rows)]
+        text = json.dumps({"s": self.schema["id"], "t": ts, "d": data}, separators=(",", ":"))
+        if encoding == "zlib":
+            return zlib.compress(text.encode(), 9)
+        return text
+
+
+def detect_encoding(payload) -> str:
+    """Kodierung einer Batch-Nachricht am ersten Byte erkennen (JSON "{", zlib 0x78, sonst struct)."""
+    first = payload[:1]
+    if first in (b"{", "{"):
+        return "json"
+    if first == b"\x78":
+        return "zlib"
+    return "struct"
+
+
+def decode(payload, schema: dict = None, encoding: str = None, schemas: dict = None) -> list:
+    """
+    Gegenrichtung: Nutzlast + Schema → [{channel, name, type, unit, timestamp_ms, feld: wert}].
+    Statt eines Schemas kann schemas = {schema_id: schema} übergeben werden; dann
+    wird das Schema verwendet, auf das die Nachricht verweist (z.B. nachgesendete
+    Batches aus der Zeit vor einer Schemaänderung).
+    """
+    def resolve(schema_id):
+        found = schemas.get(schema_id) if schemas is not None else schema
+        if found is None or schema_id != found["id"]:
+            known = sorted(schemas) if schemas is not None else schema["id"]
+            raise SchemaMismatch(f"Schema {schema_id} passt nicht zu {known}")
+        return found
+
+    encoding = encoding or detect_encoding(payload)
+    if encoding == "struct":
+        schema = resolve(struct.unpack_from(">" + HEADER_FORMAT, payload)[1])
+        values = struct.unpack(schema["struct"], payload)
+        ts, pos = values[2], 3
+        data = []
+        for ch in schema["channels"]:
+            row = []
+            for code in ch["x"]:
+                v = values[pos]
+                pos += 1
+                row.append(None if (code == "I" and v == U32_NONE) or (code != "I" and math.isnan(v)) else v)
+            data.append(None if all(v is None for v in row) else row)
+    else:
+        if encoding == "zlib":
+            payload = zlib.decompress(payload)
+        doc = json.loads(payload)
+        schema = resolve(doc["s"])
+        ts, data = doc["t"], doc["d"]
+
+    result = []
+    for ch, row in zip(schema["channels"], data):
+        if row is None:
+            continue
+        entry = {"channel": ch["c"], "name": ch["n"], "type": ch["t"], "unit": ch["u"], "timestamp_ms": ts}
+        entry.update(zip(ch["f"], row))
+        result.append(entry)
+    return result
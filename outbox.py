@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+outbox.py – Dauerhafte Benachrichtigungs-Warteschlange (SQLite).
+
+Alarmmeldungen werden nicht direkt versendet, sondern pro Zustellkanal
+(email, webhook, mqtt) als Zeile in der Tabelle notification_outbox
+abgelegt – in derselben Datenbank wie die offline_queue. Ein Dispatcher-
+Thread im Logger stellt fällige Einträge zu:
+
+- pro Kanal eigene Parallelität (Thread-Pool), Retry-Anzahl und Backoff
+- fehlgeschlagene Zustellungen werden mit exponentiellem Backoff wiederholt
+- nach max_attempts landet ein Eintrag als "dead" im Dead-Letter-Bestand
+
+Die Webapp legt Meldungen nur ab (enqueue); zugestellt wird im Logger.
+"""
+
+import json
+import logging
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS notification_outbox (
+    id           INTEGER PRIMARY KEY AUTOINCREMENT,
+    channel      TEXT NOT NULL,
+    subject      TEXT NOT NULL,
+    body         TEXT NOT NULL,
+    meta         TEXT NOT NULL DEFAULT '{}',
+    status       TEXT NOT NULL DEFAULT 'pending',
+    attempts     INTEGER NOT NULL DEFAULT 0,
+    next_attempt REAL NOT NULL,
+    created      REAL NOT NULL,
+    last_error   TEXT NOT NULL DEFAULT ''
+);
+CREATE INDEX IF NOT EXISTS idx_outbox_due ON notification_outbox(status, next_attempt);
+"""
+
+POLL_INTERVAL_S = 5.0       # Abfrageintervall des Dispatchers
+_DEAD_RETENTION_S = 30 * 86400  # Dead-Letter-Einträge nach 30 Tagen löschen
+
+
+class _Channel:
+    __slots__ = ("name", "sender", "concurrency", "max_attempts", "backoff_s",
+                 "backoff_max_s", "pool", "in_flight")
+
+    def __init__(self, name, sender, concurrency, max_attempts, backoff_s, backoff_max_s):
+        self.name = name
+        self.sender = sender
+        self.concurrency = max(1, int(concurrency))
+        self.max_attempts = max(1, int(max_attempts))
+        self.backoff_s = float(backoff_s)
+        self.backoff_max_s = float(backoff_max_s)
+        self.pool = None
+        self.in_flight = 0
+
+    def delay(self, attempts: int) -> float:
+        return min(self.backoff_max_s, self.backoff_s * (2 ** max(0, attempts - 1)))
+
+
+class Outbox:
+    """Transaktionale Outbox mit kanalweiser Zustellung."""
+
+    def __init__(self, db_path: str):
+        self._conn = sqlite3.connect(db_path, timeout=5, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._channels = {}
+        self._running = False
+        self._thread = None
+        self._cfg_getter = None
+        with self._lock, self._conn:
+            self._conn.executescript(_SCHEMA)
+
+    # ---------------------------------------------------------- Ablegen
+    def enqueue(self, channels, subject: str, body: str, meta: dict = None) -> int:
+        """Legt eine Meldung für jeden angegebenen Kanal ab. Gibt die Anzahl Zeilen zurück."""
+        channels = list(channels)
+        if not channels:
+            return 0
+        now = time.time()
+        meta_json = json.dumps(meta or {})
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT INTO notification_outbox (channel, subject, body, meta, next_attempt, created) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [(ch, subject, body, meta_json, now, now) for ch in channels],
+            )
+        self._wake.set()
+        return len(channels)
+
+    # --------------------------------------------------------- Zustellung
+    def register_channel(self, name: str, sender, concurrency: int = 1, max_attempts: int = 10,
+                         backoff_s: float = 30.0, backoff_max_s: float = 3600.0):
+        """
+        Registriert einen Zustellkanal.
+        sender(cfg, message) -> (ok, fehlermeldung); message enthält subject, body, meta.
+        """
+        self._channels[name] = _Channel(name, sender, concurrency, max_attempts,
+                                        backoff_s, backoff_max_s)
+
+    def start(self, cfg_getter):
+        """Startet den Dispatcher-Thread. cfg_getter() liefert die aktuelle Konfiguration."""
+        if self._running:
+            return
+        self._cfg_getter = cfg_getter
+        # Nach Absturz hängengebliebene Zustellungen wieder freigeben
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE notification_outbox SET status='pending' WHERE status='sending'")
+        for ch in self._channels.values():
+            ch.pool = ThreadPoolExecutor(max_workers=ch.concurrency,
+                                         thread_name_prefix=f"outbox-{ch.name}")
+        self._running = True
+        self._thread = threading.Thread(target=self._loop, daemon=True, name="outbox")
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        self._wake.set()
+        for ch in self._channels.values():
+            if ch.pool:
+                ch.pool.shutdown(wait=False, cancel_futures=True)
+
+    def _loop(self):
+        last_prune = 0.0
+        while self._running:
+            try:
+                self._dispatch_due()
+                now = time.time()
+                if now - last_prune > 3600:
+                    with self._lock, self._conn:
+                        self._conn.execute(
+                            "DELETE FROM notification_outbox WHERE status='dead' AND created < ?",
+                            (now - _DEAD_RETENTION_S,))
+                    last_prune = now
+            except Exception as e:
+                logging.error(f"Outbox: Dispatcher-Fehler: {e}")
+            self._wake.wait(POLL_INTERVAL_S)
+            self._wake.clear()
+
+    def _dispatch_due(self):
+        now = time.time()
+        for ch in self._channels.values():
+            free = ch.concurrency - ch.in_flight
+            if free <= 0:
+                continue
+            with self._lock, self._conn:
+                rows = self._conn.execute(
+                    "SELECT id, subject, body, meta, attempts FROM notification_outbox "
+                    "WHERE channel=? AND status='pending' AND next_attempt<=? "
+                    "ORDER BY id ASC LIMIT ?",
+                    (ch.name, now, free),
+                ).fetchall()
+                for row in rows:
+                    self._conn.execute(
+                        "UPDATE notification_outbox SET status='sending' WHERE id=?", (row["id"],))
+            for row in rows:
+                with self._lock:
+                    ch.in_flight += 1
+                ch.pool.submit(self._deliver, ch, dict(row))
+
+    def _deliver(self, ch: _Channel, row: dict):
+        try:
+            message = {"subject": row["subject"], "body": row["body"],
+                       "meta": json.loads(row["meta"] or "{}")}
+            try:
+                ok, err = ch.sender(self._cfg_getter(), message)
+            except Exception as e:
+                ok, err = False, str(e)
+            attempts = row["attempts"] + 1
+            with self._lock, self._conn:
+                if ok:
+                    self._conn.execute("DELETE FROM notification_outbox WHERE id=?", (row["id"],))
+                elif attempts >= ch.max_attempts:
+                    self._conn.execute(
+                        "UPDATE notification_outbox SET status='dead', attempts=?, last_error=? WHERE id=?",
+                        (attempts, str(err)[:500], row["id"]))
+                    logging.error(f"Outbox: {ch.name}-Meldung {row['id']} nach {attempts} "
+                                  f"Versuchen verworfen (dead letter): {err}")
+                else:
+                    self._conn.execute(
+                        "UPDATE notification_outbox SET status='pending', attempts=?, "
+                        "next_attempt=?, last_error=? WHERE id=?",
+                        (attempts, time.time() + ch.delay(attempts), str(err)[:500], row["id"]))
+                    logging.warning(f"Outbox: {ch.name}-Zustellung fehlgeschlagen "
+                                    f"(Versuch {attempts}): {err}")
+        finally:
+            with self._lock:
+                ch.in_flight -= 1
+            self._wake.set()
+
+    # ------------------------------------------------------------- Lesen
+    def stats(self) -> dict:
+        """Gibt {kanal: {status: anzahl}} zurück."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT channel, status, COUNT(*) AS n FROM notification_outbox GROUP BY channel, status"
+            ).fetchall()
+        result = {}
+        for row in rows:
+            result.setdefault(row["channel"], {})[row["status"]] = row["n"]
+        return result
+
+    def dead_letters(self, limit: int = 50) -> list:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, channel, subject, attempts, created, last_error FROM notification_outbox "
+                "WHERE status='dead' ORDER BY id DESC LIMIT ?", (int(limit),)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def retry_dead(self) -> int:
+        """Stellt alle Dead-Letter-Einträge erneut zur Zustellung ein."""
+        with self._lock, self._conn:
+            cur = self._conn.execute(
+                "UPDATE notification_outbox SET status='pending', attempts=0, next_attempt=? "
+                "WHERE status='dead'", (time.time(),))
+        self._wake.set()
+        return cur.rowcount
+
+    def close(self):
+        self.stop()
+        with self._lock:
+            self._conn.close()
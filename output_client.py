@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+output_client.py – Client für den Ausgangs-Steuerdienst (output_daemon.py).
+
+Protokoll: zeilenweises JSON über einen lokalen Unix-Socket.
+
+    Anfrage : {"cmd": "set", "channel": 0, "state": true, "source": "web"}
+    Antwort : {"ok": true, "state": [true, false, ...]}
+    Fehler  : {"ok": false, "error": "..."}
+
+Befehle: ping, get_state, set, set_many, lock, unlock, stats,
+reload_schedule, schedule_status, subscribe.
+Nach "subscribe" bleibt die Verbindung offen und der Dienst sendet
+Ereignisse ({"event": "state", ...}) sowie alle 15 s {"event": "ping"}.
+
+Jede Anfrage öffnet eine eigene kurze Verbindung – damit ist der Client
+ohne gemeinsamen Zustand in beliebig vielen Gunicorn-Workern nutzbar.
+"""
+
+import json
+import os
+import socket
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SOCKET_PATH = os.environ.get("BRUNNEN_OUTPUT_SOCKET",
+                             os.path.join(BASE_DIR, "data", "outputs.sock"))
+
+DEFAULT_TIMEOUT = 5.0
+
+
+class OutputServiceError(Exception):
+    """Dienst nicht erreichbar oder Anfrage abgelehnt."""
+
+
+class OutputLockedError(OutputServiceError):
+    """Ausgang ist durch eine Verriegelung (interlock.py) gesperrt."""
+
+
+def _connect(timeout: float) -> socket.socket:
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    try:
+        sock.connect(SOCKET_PATH)
+    except OSError as e:
+        sock.close()
+        raise OutputServiceError(f"Ausgangsdienst nicht erreichbar ({SOCKET_PATH}): {e}")
+    return sock
+
+
+def request(cmd: str, timeout: float = DEFAULT_TIMEOUT, **params) -> dict:
+    """Sendet eine Anfrage und gibt die Antwort zurück (wirft OutputServiceError)."""
+    sock = _connect(timeout)
+    try:
+        sock.sendall((json.dumps({"cmd": cmd, **params}) + "\n").encode())
+        with sock.makefile("rb") as f:
+            line = f.readline()
+    except OSError as e:
+        raise OutputServiceError(f"Ausgangsdienst: Kommunikationsfehler: {e}")
+    finally:
+        sock.close()
+
+    if not line:
+        raise OutputServiceError("Ausgangsdienst: Verbindung ohne Antwort geschlossen")
+    try:
+        resp = json.loads(line)
+    except ValueError:
+        raise OutputServiceError("Ausgangsdienst: ungültige Antwort")
+    if not resp.get("ok"):
+        if resp.get("code") == "locked":
+            raise OutputLockedError(resp.get("error"))
+        raise OutputServiceError(resp.get("error") or "Unbekannter Fehler")
+    return resp
+
+
+def ping() -> bool:
+    try:
+        request("ping", timeout=1.0)
+        return True
+    except OutputServiceError:
+        return False
+
+
+def get_state() -> dict:
+    """Gibt {index: bool} für alle Kanäle zurück."""
+    resp = request("get_state")
+    return {i: bool(v) for i, v in enumerate(resp.get("state", []))}
+
+
+def set_output(index: int, state: bool, source: str = "web") -> dict:
+    """Schaltet einen Kanal. Gibt den neuen Gesamtzustand {index: bool} zurück."""
+    resp = request("set", channel=int(index), state=bool(state), source=source)
+    return {i: bool(v) for i, v in enumerate(resp.get("state", []))}
+
+
+def set_outputs(changes: dict, source: str = "web") -> dict:
+    """Schaltet mehrere Kanäle atomar ({index: bool}). Gibt den neuen Gesamtzustand zurück."""
+    outputs = {str(int(i)): bool(v) for i, v in changes.items()}
+    resp = request("set_many", outputs=outputs, source=source)
+    return {i: bool(v) for i, v in enumerate(resp.get("state", []))}
+
+
+def get_locks() -> dict:
+    """{"<index>": [grund, ...]} aller verriegelten Ausgänge."""
+    return request("get_state").get("locks", {})
+
+
+def get_lock_keys(timeout: float = DEFAULT_TIMEOUT) -> dict:
+    """Gibt {output: [key, ...]} aller gehaltenen Verriegelungen zurück."""
+    resp = request("get_state", timeout=timeout)
+    return {int(o): list(keys) for o, keys in resp.get("lock_keys", {}).items()}
+
+
+def lock(output: int, state: bool, key: str, reason: str = "", timeout: float = DEFAULT_TIMEOUT) -> dict:
+    """Verriegelt einen Ausgang im Zustand state (idempotent, schaltet bei Bedarf sofort)."""
+    return request("lock", timeout=timeout, output=int(output), state=bool(state),
+                   key=key, reason=reason or key)
+
+
+def unlock(output: int, key: str, restore=None, timeout: float = DEFAULT_TIMEOUT) -> dict:
+    """Hebt eine Verriegelung auf; restore=True/False schaltet danach in diesen Zustand."""
+    return request("unlock", timeout=timeout, output=int(output), key=key, restore=restore)
+
+
+def reload_schedule() -> None:
+    request("reload_schedule")
+
+
+def schedule_status(limit: int = 20) -> dict:
+    """{"next_runs": {job_id: ts}, "upcoming": [{ts, kind, job, channel, state}, ...]}"""
+    resp = request("schedule_status", limit=int(limit))
+    return {"next_runs": resp.get("next_runs", {}), "upcoming": resp.get("upcoming", [])}
+
+
+def subscribe(timeout: float = 30.0):
+    """
+    Generator über Zustandsereignisse des Dienstes.
+    Das erste Ereignis ist immer der aktuelle Gesamtzustand.
+    """
+    sock = _connect(timeout)
+    try:
+        sock.sendall(b'{"cmd": "subscribe"}\n')
+        with sock.makefile("rb") as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
+    except OSError as e:
+        raise OutputServiceError(f"Ausgangsdienst: Abo unterbrochen: {e}")
+    finally:
+        sock.close()
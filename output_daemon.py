@@ -0,0 +1,375 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+output_daemon.py – Ausgangs-Steuerdienst (brunnen_outputs.service).
+
+Einziger Prozess, der den GPIO-Chip der MOSFET-Ausgänge öffnet. Er hält
+den Schaltzustand, führt die Zeitpläne aus (output_scheduler.py) und
+übergibt Schaltereignisse an den gebündelten Event-Writer
+(output_events.py). Webapp-Worker und andere Tools sprechen ihn über
+einen lokalen Unix-Socket an (siehe output_client.py), so dass die
+Webapp mit mehreren Gunicorn-Workern laufen kann.
+"""
+
+import json
+import logging
+import os
+import queue
+import signal
+import socketserver
+import threading
+import time
+
+import mosfet_control
+import output_events
+import output_scheduler
+import alarm as alarm_module
+import outbox
+from output_client import SOCKET_PATH
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CONFIG_PATH = os.path.join(BASE_DIR, "config", "config.json")
+SCHEDULE_FILE = os.path.join(BASE_DIR, "config", "output_schedule.json")
+NAMES_FILE = os.path.join(BASE_DIR, "config", "output_names.json")
+DB_PATH = os.path.join(BASE_DIR, "data", "offline_cache.db")
+SCHEDULER_STATE_FILE = os.path.join(BASE_DIR, "data", "scheduler_state.json")
+
+SUBSCRIBER_PING_S = 15       # Lebenszeichen an Abonnenten
+SUBSCRIBER_QUEUE_MAX = 100   # langsame Abonnenten verlieren Ereignisse statt zu blockieren
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s [%(levelname)s] %(message)s",
+)
+
+
+class OutputLocked(Exception):
+    """Schaltbefehl widerspricht einer aktiven Verriegelung."""
+
+
+scheduler = None
+event_writer = None
+_outbox = None
+
+# Verriegelungen {ausgang: {key: {"state": bool, "reason": str}}} – gesetzt vom Logger (interlock.py)
+_locks = {}
+_switch_lock = threading.RLock()   # Sperrprüfung und Schalten atomar
+
+_subscribers = set()
+_subscribers_lock = threading.Lock()
+
+
+# ============================================================
+# 📂 Konfiguration (nur lesend – gepflegt wird sie von der Webapp)
+# ============================================================
+class _JsonSnapshot:
+    """Zwischengespeicherter JSON-Inhalt, neu gelesen nur bei geänderter mtime."""
+
+    def __init__(self, path, default):
+        self._path = path
+        self._default = default
+        self._mtime = None
+        self._data = default
+        self._lock = threading.Lock()
+
+    def get(self):
+        try:
+            mtime = os.stat(self._path).st_mtime
+        except OSError:
+            return self._default
+        with self._lock:
+            if mtime != self._mtime:
+                try:
+                    with open(self._path) as f:
+                        self._data = json.load(f)
+                    self._mtime = mtime
+                except Exception as e:
+                    logging.warning(f"{os.path.basename(self._path)} nicht lesbar: {e}")
+            return self._data
+
+
+_config = _JsonSnapshot(CONFIG_PATH, {})
+_names = _JsonSnapshot(NAMES_FILE, {})
+
+
+def load_config() -> dict:
+    return _config.get()
+
+
+def load_names() -> dict:
+    return _names.get()
+
+
+# ============================================================
+# 📣 Abonnenten
+# ============================================================
+def _state_list() -> list:
+    state = mosfet_control.get_state()
+    return [bool(state.get(i, False)) for i in range(len(mosfet_control.CHANNELS))]
+
+
+def _publish(event: dict):
+    with _subscribers_lock:
+        subscribers = list(_subscribers)
+    for q in subscribers:
+        try:
+            q.put_nowait(event)
+        except queue.Full:
+            pass
+
+
+# ============================================================
+# 🔌 Schalten
+# ============================================================
+def _locks_snapshot() -> dict:
+    with _switch_lock:
+        return {str(o): [l["reason"] for l in locks.values()] for o, locks in _locks.items() if locks}
+
+
+def _lock_keys_snapshot() -> dict:
+    with _switch_lock:
+        return {str(o): list(locks) for o, locks in _locks.items() if locks}
+
+
+def apply_outputs(changes: dict, source: str, force: bool = False, partial: bool = False) -> list:
+    """
+    Schaltet einen oder mehrere Kanäle in einem Schritt (ein group_write),
+    benachrichtigt Abonnenten und protokolliert alles als ein Ereignis.
+    Verriegelte Ausgänge: force=True (Interlock) schaltet trotzdem, partial=True
+    (Zeitpläne) lässt sie aus, sonst wird OutputLocked ausgelöst.
+    """
+    changes = {int(i): bool(v) for i, v in changes.items()}
+    with _switch_lock:
+        if not force:
+            blocked = {ch: l["reason"] for ch, v in changes.items()
+                       for l in _locks.get(ch, {}).values() if l["state"] != v}
+            if blocked:
+                text = ", ".join(f"Kanal {ch + 1} ({reason})" for ch, reason in sorted(blocked.items()))
+                if not partial:
+                    raise OutputLocked(f"Verriegelt: {text}")
+                logging.warning(f"Ausgänge verriegelt, ausgelassen ({source}): {text}")
+                changes = {ch: v for ch, v in changes.items() if ch not in blocked}
+                if not changes:
+                    return _state_list()
+        if not mosfet_control.set_outputs(changes):
+            raise RuntimeError("GPIO-Fehler beim Schalten – siehe Log")
+        current = _state_list()
+    summary = ", ".join(f"{i + 1}→{'EIN' if v else 'AUS'}" for i, v in sorted(changes.items()))
+    logging.info(f"Ausgänge {summary} ({source})")
+    _publish({"event": "state", "state": current,
+              "changes": {str(i): v for i, v in changes.items()},
+              "locks": _locks_snapshot(), "source": source, "ts": time.time()})
+    event_writer.submit(changes, source)
+    return current
+
+
+def lock_output(output: int, state: bool, key: str, reason: str) -> list:
+    """Setzt (idempotent) eine Verriegelung und erzwingt den Zustand, falls nötig."""
+    if not 0 <= output < len(mosfet_control.CHANNELS):
+        raise ValueError(f"Ungültiger Kanal: {output}")
+    with _switch_lock:
+        locks = _locks.setdefault(output, {})
+        is_new = locks.get(key) != {"state": state, "reason": reason}
+        locks[key] = {"state": state, "reason": reason}
+        current = _state_list()
+        if current[output] != state:
+            current = apply_outputs({output: state}, "interlock", force=True)
+    if is_new:
+        logging.warning(f"🔒 Ausgang {output + 1} verriegelt ({'EIN' if state else 'AUS'}): {reason}")
+        _publish({"event": "locks", "locks": _locks_snapshot(), "ts": time.time()})
+    return current
+
+
+def unlock_output(output: int, key: str, restore=None) -> list:
+    """Hebt eine Verriegelung auf; restore (bool) schaltet danach optional zurück."""
+    with _switch_lock:
+        removed = _locks.get(output, {}).pop(key, None)
+        if output in _locks and not _locks[output]:
+            del _locks[output]
+        current = _state_list()
+        if removed and restore is not None and output not in _locks:
+            current = apply_outputs({output: bool(restore)}, "interlock", force=True)
+    if removed:
+        logging.warning(f"🔓 Ausgang {output + 1} freigegeben: {removed['reason']}")
+        _publish({"event": "locks", "locks": _locks_snapshot(), "ts": time.time()})
+    return current
+
+
+def apply_output(index: int, state: bool, source: str) -> list:
+    return apply_outputs({index: state}, source)
+
+
+def _notify_output_change(cfg, names, changes, source):
+    """Optional: Alarm bei Output-Schaltung (Zustellung über die Outbox des Loggers)."""
+    global _outbox
+    if not cfg.get("ALARM_OUTPUT_CHANGES_EN") or not alarm_module.notification_channels(cfg):
+        return
+    lines = []
+    for channel, state in sorted(changes.items()):
+        ch_name = names.get(str(channel), f"Kanal {channel + 1}")
+        lines.append(f"Ausgang {channel + 1} ({ch_name}): {'EIN' if state else 'AUS'}")
+    if len(changes) == 1:
+        channel, state = next(iter(changes.items()))
+        ch_name = names.get(str(channel), f"Kanal {channel + 1}")
+        subject = f"[BrunnenWeb] Ausgang {ch_name} {'EIN' if state else 'AUS'}"
+    else:
+        subject = f"[BrunnenWeb] {len(changes)} Ausgänge geschaltet"
+    body = "Ausgänge wurden geschaltet:\n" + "\n".join(lines)
+    if _outbox is None:
+        _outbox = outbox.Outbox(DB_PATH)
+    alarm_module.dispatch(cfg, subject, body,
+                          {"outputs": {str(i): 1 if v else 0 for i, v in changes.items()},
+                           "source": source}, _outbox)
+
+
+# ============================================================
+# 🧵 Socket-Server
+# ============================================================
+def handle_request(req: dict) -> dict:
+    cmd = req.get("cmd")
+    if cmd == "ping":
+        return {"ok": True}
+    if cmd == "get_state":
+        return {"ok": True, "state": _state_list(), "locks": _locks_snapshot(),
+                "lock_keys": _lock_keys_snapshot()}
+    if cmd == "set":
+        try:
+            channel = int(req["channel"])
+        except (KeyError, TypeError, ValueError):
+            return {"ok": False, "error": "Parameter 'channel' fehlt oder ist ungültig"}
+        try:
+            state = apply_output(channel, bool(req.get("state")), str(req.get("source") or "api"))
+        except OutputLocked as e:
+            return {"ok": False, "code": "locked", "error": str(e)}
+        except (ValueError, RuntimeError) as e:
+            return {"ok": False, "error": str(e)}
+        return {"ok": True, "state": state}
+    if cmd == "set_many":
+        outputs = req.get("outputs")
+        if not isinstance(outputs, dict) or not outputs:
+            return {"ok": False, "error": "Parameter 'outputs' muss {kanal: zustand} sein"}
+        try:
+            changes = {int(k): bool(v) for k, v in outputs.items()}
+            state = apply_outputs(changes, str(req.get("source") or "api"))
+        except OutputLocked as e:
+            return {"ok": False, "code": "locked", "error": str(e)}
+        except (ValueError, RuntimeError) as e:
+            return {"ok": False, "error": str(e)}
+        return {"ok": True, "state": state}
+    if cmd in ("lock", "unlock"):
+        try:
+            output = int(req["output"])
+            key = str(req["key"])
+        except (KeyError, TypeError, ValueError):
+            return {"ok": False, "error": "Parameter 'output' und 'key' erforderlich"}
+        try:
+            if cmd == "lock":
+                state = lock_output(output, bool(req.get("state")), key,
+                                    str(req.get("reason") or key))
+            else:
+                state = unlock_output(output, key, req.get("restore"))
+        except (ValueError, RuntimeError) as e:
+            return {"ok": False, "error": str(e)}
+        return {"ok": True, "state": state, "locks": _locks_snapshot()}
+    if cmd == "stats":
+        return {"ok": True, "events": event_writer.stats()}
+    if cmd == "reload_schedule":
+        scheduler.request_reload()
+        return {"ok": True}
+    if cmd == "schedule_status":
+        return {"ok": True, "next_runs": scheduler.next_runs(),
+                "upcoming": scheduler.upcoming(int(req.get("limit") or 20))}
+    return {"ok": False, "error": f"Unbekannter Befehl: {cmd}"}
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def _send(self, obj: dict):
+        self.wfile.write((json.dumps(obj) + "\n").encode())
+        self.wfile.flush()
+
+    def handle(self):
+        for raw in self.rfile:
+            try:
+                req = json.loads(raw)
+                if not isinstance(req, dict):
+                    raise ValueError
+            except ValueError:
+                self._send({"ok": False, "error": "Ungültiges JSON"})
+                continue
+            if req.get("cmd") == "subscribe":
+                self._stream()
+                return
+            try:
+                resp = handle_request(req)
+            except Exception as e:
+                logging.exception("Fehler bei Anfrage:")
+                resp = {"ok": False, "error": str(e)}
+            self._send(resp)
+
+    def _stream(self):
+        q = queue.Queue(maxsize=SUBSCRIBER_QUEUE_MAX)
+        with _subscribers_lock:
+            _subscribers.add(q)
+        try:
+            self._send({"event": "state", "state": _state_list(),
+                        "locks": _locks_snapshot(), "ts": time.time()})
+            while True:
+                try:
+                    event = q.get(timeout=SUBSCRIBER_PING_S)
+                except queue.Empty:
+                    event = {"event": "ping"}
+                self._send(event)
+        except OSError:
+            pass  # Abonnent hat die Verbindung geschlossen
+        finally:
+            with _subscribers_lock:
+                _subscribers.discard(q)
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def main():
+    mosfet_control.init_gpio()
+
+    os.makedirs(os.path.dirname(SOCKET_PATH), exist_ok=True)
+    if os.path.exists(SOCKET_PATH):
+        os.unlink(SOCKET_PATH)
+    server = _Server(SOCKET_PATH, _Handler)
+    os.chmod(SOCKET_PATH, 0o660)
+
+    global scheduler, event_writer
+    event_writer = output_events.OutputEventWriter(DB_PATH, load_config, load_names,
+                                                   notify=_notify_output_change)
+    event_writer.start()
+    scheduler = output_scheduler.OutputScheduler(
+        SCHEDULE_FILE, SCHEDULER_STATE_FILE,
+        lambda changes, source: apply_outputs(changes, source, partial=True),
+        n_channels=len(mosfet_control.CHANNELS))
+    scheduler.start()
+
+    def _shutdown(signum, frame):
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, _shutdown)
+    signal.signal(signal.SIGINT, _shutdown)
+
+    logging.info(f"Ausgangsdienst lauscht auf {SOCKET_PATH}")
+    try:
+        server.serve_forever()
+    finally:
+        scheduler.stop()
+        server.server_close()
+        event_writer.stop()
+        if _outbox:
+            _outbox.close()
+        try:
+            os.unlink(SOCKET_PATH)
+        except OSError:
+            pass
+        logging.info("Ausgangsdienst beendet")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+output_events.py – Gebündeltes Schreiben der Ausgangs-Schaltereignisse.
+
+Ein einziger Hintergrund-Thread nimmt Schaltereignisse aus einer
+In-Memory-Queue, fasst sie zu Batches zusammen und schreibt sie als
+digital_output-Punkte über einen wiederverwendeten InfluxDB-Client.
+Ist InfluxDB nicht erreichbar, landen die Punkte in der SQLite-
+offline_queue und werden vom Logger mit den Messwerten nachgesendet
+(send_to_influx kennt dafür den Typ "OUTPUT").
+
+Das Schalten selbst wartet nie auf InfluxDB: submit() legt nur ab.
+"""
+
+import json
+import logging
+import queue
+import socket
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+
+BATCH_MAX = 200            # Ereignisse pro Write
+LINGER_S = 0.2             # kurz sammeln, damit Bursts in einem Write landen
+QUEUE_MAX = 10000
+OFFLINE_BACKOFF_S = 30.0   # nach einem Fehler so lange direkt in die offline_queue schreiben
+
+
+def make_entry(channel: int, state: bool, name: str, source: str, timestamp: str) -> dict:
+    """Queue-Eintrag im Format der offline_queue (type = OUTPUT)."""
+    return {
+        "type": "OUTPUT",
+        "channel": str(channel),
+        "name": name,
+        "state": 1 if state else 0,
+        "source": source,
+        "timestamp": timestamp,
+    }
+
+
+def to_point(entry: dict, device_id: str, location: str):
+    """Baut aus einem OUTPUT-Eintrag den digital_output-Punkt (auch vom Logger genutzt)."""
+    from influxdb_client import Point, WritePrecision
+    state = int(entry.get("state", 0))
+    p = (Point("digital_output")
+         .tag("device_id", device_id)
+         .tag("location", location)
+         .tag("channel", str(entry.get("channel", "")))
+         .tag("name", entry.get("name", ""))
+         .field("state", state)
+         .field("state_text", "EIN" if state else "AUS")
+         .time(entry["timestamp"], WritePrecision.MS))
+    if entry.get("source"):
+        p = p.tag("source", entry["source"])
+    return p
+
+
+class OutputEventWriter:
+    """
+    cfg_getter() / names_getter() liefern zwischengespeicherte Snapshots.
+    notify(cfg, names, changes, source) wird optional pro Ereignis aufgerufen.
+    """
+
+    def __init__(self, db_path: str, cfg_getter, names_getter, notify=None):
+        self._db_path = db_path
+        self._cfg_getter = cfg_getter
+        self._names_getter = names_getter
+        self._notify = notify
+        self._queue = queue.Queue(maxsize=QUEUE_MAX)
+        self._thread = None
+        self._conn = None
+        self._client = None
+        self._client_key = None
+        self._write_api = None
+        self._offline_until = 0.0
+        self._stats = {"submitted": 0, "written": 0, "spooled": 0, "dropped": 0, "batches": 0}
+
+    # ---------------------------------------------------------- Ablegen
+    def submit(self, changes: dict, source: str):
+        """Legt ein Schaltereignis ab (blockiert nie)."""
+        item = (datetime.now(timezone.utc).isoformat(timespec="milliseconds"), dict(changes), source)
+        try:
+            self._queue.put_nowait(item)
+            self._stats["submitted"] += 1
+        except queue.Full:
+            self._stats["dropped"] += 1
+            logging.warning("Output-Events: Queue voll – Ereignis verworfen")
+
+    def stats(self) -> dict:
+        return dict(self._stats, pending=self._queue.qsize(),
+                    offline=time.time() < self._offline_until)
+
+    # ----------------------------------------------------------- Thread
+    def start(self):
+        if self._thread:
+            return
+        self._thread = threading.Thread(target=self._loop, daemon=True, name="output-events")
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        """Arbeitet die Queue ab (bei Bedarf in die offline_queue) und beendet den Thread."""
+        if not self._thread:
+            return
+        self._queue.put(None)
+        self._thread.join(timeout)
+        self._thread = None
+
+    def _loop(self):
+        try:
+            self._run()
+        finally:
+            self._drop_client()
+            if self._conn:
+                self._conn.close()
+                self._conn = None
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            batch = [item]
+            deadline = time.monotonic() + LINGER_S
+            stop = False
+            while len(batch) < BATCH_MAX:
+                try:
+                    nxt = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if nxt is None:
+                    stop = True
+                    break
+                batch.append(nxt)
+            try:
+                self._process(batch)
+            except Exception as e:
+                logging.error(f"Output-Events: Fehler beim Verarbeiten: {e}")
+            if stop:
+                return
+
+    # --------------------------------------------------------- Schreiben
+    def _process(self, batch: list):
+        cfg = self._cfg_getter()
+        names = self._names_getter()
+        entries = []
+        for ts, changes, source in batch:
+            for channel, state in sorted(changes.items()):
+                name = names.get(str(channel), f"Kanal {channel + 1}")
+                entries.append(make_entry(channel, state, name, source, ts))
+            if self._notify:
+                try:
+                    self._notify(cfg, names, changes, source)
+                except Exception as e:
+                    logging.warning(f"Output-Events: Benachrichtigung fehlgeschlagen: {e}")
+        self._stats["batches"] += 1
+
+        if not cfg.get("INFLUX_ENABLED", True):
+            return
+        if not cfg.get("INFLUX_URL") or not cfg.get("INFLUX_TOKEN") or not cfg.get("INFLUX_BUCKET"):
+            return
+        if time.time() < self._offline_until:
+            self._spool(entries)
+            return
+        try:
+            self._write(cfg, entries)
+            self._stats["written"] += len(entries)
+        except Exception as e:
+            logging.warning(f"InfluxDB Output-Log Fehler ({len(entries)} Punkte → offline_queue): {e}")
+            self._offline_until = time.time() + OFFLINE_BACKOFF_S
+            self._drop_client()
+            self._spool(entries)
+
+    def _write(self, cfg: dict, entries: list):
+        from influxdb_client import InfluxDBClient
+        from influxdb_client.client.write_api import SYNCHRONOUS
+        key = (cfg["INFLUX_URL"], cfg["INFLUX_TOKEN"], cfg.get("INFLUX_ORG", ""))
+        if self._client is None or key != self._client_key:
+            self._drop_client()
+            self._client = InfluxDBClient(url=key[0], token=key[1], org=key[2], timeout=10_000)
+            self._write_api = self._client.write_api(write_options=SYNCHRONOUS)
+            self._client_key = key
+        device_id = cfg.get("DEVICE_ID", socket.gethostname())
+        location = cfg.get("LOCATION", "")
+        points = [to_point(e, device_id, location) for e in entries]
+        self._write_api.write(bucket=cfg["INFLUX_BUCKET"], record=points)
+
+    def _drop_client(self):
+        if self._client:
+            try:
+                self._client.close()
+            except Exception:
+                pass
+        self._client = self._write_api = self._client_key = None
+
+    def _spool(self, entries: list):
+        """Schreibt Punkte in die offline_queue des Loggers (eine Transaktion)."""
+        try:
+            if self._conn is None:
+                self._conn = sqlite3.connect(self._db_path, timeout=5)
+                self._conn.execute(
+                    "CREATE TABLE IF NOT EXISTS offline_queue ("
+                    "id INTEGER PRIMARY KEY AUTOINCREMENT, payload TEXT NOT NULL)")
+            with self._conn:
+                self._conn.executemany("INSERT INTO offline_queue (payload) VALUES (?)",
+                                       [(json.dumps(e),) for e in entries])
+            self._stats["spooled"] += len(entries)
+        except Exception as e:
+            self._stats["dropped"] += len(entries)
+            logging.error(f"Output-Events: offline_queue nicht beschreibbar, {len(entries)} Punkte verloren: {e}")
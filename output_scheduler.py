@@ -0,0 +1,449 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+output_scheduler.py – Zeitplan-Engine für die MOSFET-Ausgänge.
+
+Alle Jobs aus output_schedule.json werden zu Triggern kompiliert; ihre
+nächsten Ausführungszeiten liegen in einem Heap. Der Scheduler-Thread
+schläft genau bis zum nächsten fälligen Eintrag und liest die Datei nur
+neu ein, wenn sie sich geändert hat (mtime oder expliziter Reload).
+
+Job-Formate:
+    {"channel": 0, "state": 1, "time": "06:30"}                       täglich
+    {"channel": 0, "state": 1, "time": "06:30", "days": ["mo", "fr"]} an Wochentagen
+    {"channel": 0, "state": 1, "every_min": 120,
+     "from": "06:00", "until": "20:00"}                                Intervall
+    {"channel": 0, "state": 1, "cron": "*/15 6-20 * * 1-5"}            Cron (min h tag monat wtag)
+
+Optional pro Job:
+    "id"            eindeutige Kennung (fehlt sie, wird sie aus dem Inhalt abgeleitet)
+    "duration_min"  nach N Minuten wieder in den Gegenzustand schalten
+    "catch_up"      false = verpasste Ausführungen nach Neustart nicht nachholen
+
+Verpasste Ausführungen (Dienst gestoppt, Stromausfall) werden beim Start
+bis maximal CATCHUP_MAX_S nachgeholt: pro Kanal zählt der zuletzt fällige
+Zustand, alle Kanäle werden in einem Schritt geschaltet.
+"""
+
+import bisect
+import hashlib
+import heapq
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+from datetime import date, datetime, timedelta
+
+WEEKDAYS = ["mo", "di", "mi", "do", "fr", "sa", "so"]   # Index = datetime.weekday()
+
+CATCHUP_MAX_S = 24 * 3600   # ältere verpasste Ausführungen werden verworfen
+MAX_SLEEP_S = 300           # spätestens dann mtime prüfen (auch gegen Uhrsprünge nach NTP-Sync)
+_MAX_LOOKAHEAD_DAYS = 366 * 5
+
+
+# ============================================================
+# 🕒 Trigger
+# ============================================================
+def _parse_hhmm(value) -> int:
+    """'HH:MM' → Minute des Tages."""
+    try:
+        h, m = str(value).strip().split(":")
+        h, m = int(h), int(m)
+    except (AttributeError, ValueError):
+        raise ValueError(f"Ungültige Uhrzeit: {value!r} (erwartet HH:MM)")
+    if not (0 <= h <= 23 and 0 <= m <= 59):
+        raise ValueError(f"Ungültige Uhrzeit: {value!r}")
+    return h * 60 + m
+
+
+def _parse_days(days) -> set:
+    """Wochentage als Liste von Kürzeln ('mo'…'so') oder Zahlen (0=Mo … 6=So)."""
+    if days in (None, "", []):
+        return set(range(7))
+    if isinstance(days, str):
+        days = [d for d in days.replace(";", ",").split(",") if d.strip()]
+    result = set()
+    for d in days:
+        key = str(d).strip().lower()[:2]
+        if key in WEEKDAYS:
+            result.add(WEEKDAYS.index(key))
+        elif key.isdigit() and 0 <= int(key) <= 6:
+            result.add(int(key))
+        else:
+            raise ValueError(f"Ungültiger Wochentag: {d!r}")
+    return result
+
+
+def _parse_cron_field(field: str, lo: int, hi: int) -> set:
+    values = set()
+    for part in field.split(","):
+        step = 1
+        if "/" in part:
+            part, step_s = part.split("/", 1)
+            step = int(step_s)
+            if step < 1:
+                raise ValueError("Schrittweite muss >= 1 sein")
+        if part in ("*", ""):
+            a, b = lo, hi
+        elif "-" in part:
+            a, b = (int(x) for x in part.split("-", 1))
+        else:
+            a = int(part)
+            b = hi if step > 1 else a
+        if not (lo <= a <= b <= hi):
+            raise ValueError(f"Wert außerhalb {lo}–{hi}: {field!r}")
+        values.update(range(a, b + 1, step))
+    return values
+
+
+class Trigger:
+    """Menge von Minuten des Tages, eingeschränkt auf Tage (Wochentag/Monatstag/Monat)."""
+
+    __slots__ = ("minutes", "weekdays", "doms", "months", "dom_any", "dow_any")
+
+    def __init__(self, minutes, weekdays=None, doms=None, months=None):
+        self.minutes = sorted(set(minutes))
+        if not self.minutes:
+            raise ValueError("Regel ergibt keine Ausführungszeit")
+        self.dow_any = weekdays is None or len(weekdays) == 7
+        self.dom_any = doms is None or len(doms) == 31
+        self.weekdays = set(range(7)) if weekdays is None else set(weekdays)
+        self.doms = set(range(1, 32)) if doms is None else set(doms)
+        self.months = set(range(1, 13)) if months is None else set(months)
+
+    @classmethod
+    def from_cron(cls, expr: str) -> "Trigger":
+        fields = str(expr).split()
+        if len(fields) != 5:
+            raise ValueError(f"Cron-Ausdruck braucht 5 Felder (min h tag monat wtag): {expr!r}")
+        try:
+            minutes = _parse_cron_field(fields[0], 0, 59)
+            hours = _parse_cron_field(fields[1], 0, 23)
+            doms = _parse_cron_field(fields[2], 1, 31)
+            months = _parse_cron_field(fields[3], 1, 12)
+            # Cron: 0 und 7 = Sonntag → datetime.weekday(): 0 = Montag
+            dows = {(d + 6) % 7 for d in _parse_cron_field(fields[4], 0, 7)}
+        except ValueError as e:
+            raise ValueError(f"Ungültiger Cron-Ausdruck {expr!r}: {e}")
+        return cls([h * 60 + m for h in hours for m in minutes], dows, doms, months)
+
+    def _day_matches(self, day: date) -> bool:
+        if day.month not in self.months:
+            return False
+        dom_ok = day.day in self.doms
+        dow_ok = day.weekday() in self.weekdays
+        # Cron-Semantik: sind Monatstag UND Wochentag eingeschränkt, genügt einer von beiden
+        if not self.dom_any and not self.dow_any:
+            return dom_ok or dow_ok
+        return dom_ok and dow_ok
+
+    def next_after(self, ts: float):
+        """Nächste Ausführung (Epoch-Sekunden, lokale Zeit) strikt nach der Minute von ts."""
+        start = datetime.fromtimestamp(ts).replace(second=0, microsecond=0) + timedelta(minutes=1)
+        day = start.date()
+        first = start.hour * 60 + start.minute
+        for _ in range(_MAX_LOOKAHEAD_DAYS):
+            if self._day_matches(day):
+                i = bisect.bisect_left(self.minutes, first)
+                if i < len(self.minutes):
+                    m = self.minutes[i]
+                    return datetime(day.year, day.month, day.day, m // 60, m % 60).timestamp()
+            day += timedelta(days=1)
+            first = 0
+        return None
+
+
+# ============================================================
+# 📋 Jobs
+# ============================================================
+class Job:
+    __slots__ = ("id", "channel", "state", "trigger", "duration_s", "catch_up")
+
+    def __init__(self, job_id, channel, state, trigger, duration_s, catch_up):
+        self.id = job_id
+        self.channel = channel
+        self.state = state
+        self.trigger = trigger
+        self.duration_s = duration_s
+        self.catch_up = catch_up
+
+
+def job_id(job: dict) -> str:
+    """Vorhandene ID oder stabile, aus dem Inhalt abgeleitete ID (Alt-Einträge)."""
+    if job.get("id"):
+        return str(job["id"])
+    raw = json.dumps({k: v for k, v in job.items() if k != "id"}, sort_keys=True)
+    return hashlib.sha1(raw.encode()).hexdigest()[:8]
+
+
+def compile_job(job: dict, n_channels: int = 6) -> Job:
+    """Prüft und kompiliert einen Job-Eintrag. Wirft ValueError mit Klartext-Meldung."""
+    if not isinstance(job, dict):
+        raise ValueError("Job muss ein Objekt sein")
+    try:
+        channel = int(job["channel"])
+    except (KeyError, TypeError, ValueError):
+        raise ValueError("Kanal fehlt oder ist ungültig")
+    if not 0 <= channel < n_channels:
+        raise ValueError(f"Kanal {channel + 1} existiert nicht")
+    state = str(job.get("state", 1)).strip().lower() in ("1", "true", "on")
+
+    if job.get("cron"):
+        trigger = Trigger.from_cron(job["cron"])
+    elif job.get("every_min"):
+        try:
+            every = int(job["every_min"])
+        except (TypeError, ValueError):
+            raise ValueError(f"Ungültiges Intervall: {job['every_min']!r}")
+        if not 1 <= every <= 1440:
+            raise ValueError("Intervall muss zwischen 1 und 1440 Minuten liegen")
+        start = _parse_hhmm(job.get("from") or "00:00")
+        end = _parse_hhmm(job.get("until") or "23:59")
+        if end < start:
+            raise ValueError("'bis' liegt vor 'von'")
+        trigger = Trigger(range(start, end + 1, every), _parse_days(job.get("days")))
+    elif job.get("time"):
+        trigger = Trigger([_parse_hhmm(job["time"])], _parse_days(job.get("days")))
+    else:
+        raise ValueError("Zeit, Intervall oder Cron-Ausdruck erforderlich")
+
+    duration_s = 0.0
+    if job.get("duration_min") not in (None, "", 0, "0"):
+        try:
+            duration = float(job["duration_min"])
+        except (TypeError, ValueError):
+            raise ValueError(f"Ungültige Dauer: {job['duration_min']!r}")
+        if not 1 <= duration <= 24 * 60:
+            raise ValueError("Dauer muss zwischen 1 Minute und 24 Stunden liegen")
+        duration_s = duration * 60
+
+    return Job(job_id(job), channel, state, trigger, duration_s,
+               bool(job.get("catch_up", True)))
+
+
+def validate_job(job: dict, n_channels: int = 6) -> tuple:
+    try:
+        compile_job(job, n_channels)
+        return True, ""
+    except ValueError as e:
+        return False, str(e)
+
+
+def _write_json_atomic(path: str, data):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+
+# ============================================================
+# ⏰ Scheduler
+# ============================================================
+class OutputScheduler:
+    """
+    Heap-basierter Scheduler. apply_fn(changes: {kanal: bool}, source: str)
+    schaltet die Ausgänge; gleichzeitig fällige Einträge werden gebündelt.
+    """
+
+    def __init__(self, schedule_path: str, state_path: str, apply_fn,
+                 n_channels: int = 6, catchup_max_s: float = CATCHUP_MAX_S):
+        self._schedule_path = schedule_path
+        self._state_path = state_path
+        self._apply = apply_fn
+        self._n_channels = n_channels
+        self._catchup_max_s = catchup_max_s
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._reload_requested = False
+        self._running = False
+        self._thread = None
+        self._seq = itertools.count()
+        self._heap = []          # (ts, seq, kind "start"/"end", job_id, channel, state)
+        self._jobs = {}
+        self._mtime = None
+
+    # ---------------------------------------------------------- Steuerung
+    def start(self):
+        if self._running:
+            return
+        now = time.time()
+        self._jobs = self._load_jobs()
+        self._catch_up(now)
+        self._rebuild_heap(now)
+        self._save_state(now)
+        self._running = True
+        self._thread = threading.Thread(target=self._loop, daemon=True, name="scheduler")
+        self._thread.start()
+
+    def stop(self):
+        if self._running:
+            self._running = False
+            self._wake.set()
+            self._save_state(time.time())
+
+    def request_reload(self):
+        """Zeitplan beim nächsten Aufwachen neu einlesen (z.B. nach Änderung in der Webapp)."""
+        self._reload_requested = True
+        self._wake.set()
+
+    def upcoming(self, limit: int = 20) -> list:
+        with self._lock:
+            entries = heapq.nsmallest(limit, self._heap)
+        return [{"ts": ts, "kind": kind, "job": jid, "channel": ch, "state": st}
+                for ts, _, kind, jid, ch, st in entries]
+
+    def next_runs(self) -> dict:
+        """{job_id: nächste Startzeit}"""
+        with self._lock:
+            return {jid: ts for ts, _, kind, jid, _, _ in self._heap if kind == "start"}
+
+    # ------------------------------------------------------------- Laden
+    def _load_jobs(self) -> dict:
+        try:
+            self._mtime = os.stat(self._schedule_path).st_mtime
+            with open(self._schedule_path) as f:
+                raw = json.load(f)
+        except FileNotFoundError:
+            self._mtime = None
+            return {}
+        except Exception as e:
+            logging.error(f"Scheduler: Zeitplan nicht lesbar: {e}")
+            return dict(self._jobs)
+        jobs = {}
+        for entry in raw if isinstance(raw, list) else []:
+            try:
+                job = compile_job(entry, self._n_channels)
+                jobs[job.id] = job
+            except ValueError as e:
+                logging.warning(f"Scheduler: Job übersprungen ({e}): {entry}")
+        logging.info(f"Scheduler: {len(jobs)} Job(s) geladen")
+        return jobs
+
+    def _file_changed(self) -> bool:
+        try:
+            mtime = os.stat(self._schedule_path).st_mtime
+        except OSError:
+            mtime = None
+        return mtime != self._mtime
+
+    def _push(self, ts, kind, job_id, channel, state):
+        heapq.heappush(self._heap, (ts, next(self._seq), kind, job_id, channel, state))
+
+    def _rebuild_heap(self, now: float):
+        with self._lock:
+            # Laufende Dauer-Jobs werden auch nach Änderungen noch zurückgeschaltet
+            pending_ends = [e for e in self._heap if e[2] == "end"]
+            self._heap = []
+            for e in pending_ends:
+                self._push(e[0], "end", e[3], e[4], e[5])
+            for job in self._jobs.values():
+                ts = job.trigger.next_after(now)
+                if ts is not None:
+                    self._push(ts, "start", job.id, job.channel, job.state)
+
+    # -------------------------------------------------------- Persistenz
+    def _load_state(self) -> dict:
+        try:
+            with open(self._state_path) as f:
+                return json.load(f)
+        except Exception:
+            return {}
+
+    def _save_state(self, now: float):
+        with self._lock:
+            pending = [{"at": ts, "job": jid, "channel": ch, "state": st}
+                       for ts, _, kind, jid, ch, st in self._heap if kind == "end"]
+        try:
+            _write_json_atomic(self._state_path, {"last_tick": now, "pending_ends": pending})
+        except OSError as e:
+            logging.warning(f"Scheduler: Zustand nicht speicherbar: {e}")
+
+    def _catch_up(self, now: float):
+        """Holt seit dem letzten Lauf verpasste Ausführungen nach (ein Schaltvorgang)."""
+        state = self._load_state()
+        last_tick = state.get("last_tick")
+        events = []
+        for p in state.get("pending_ends", []):
+            try:
+                entry = (float(p["at"]), int(p["channel"]), bool(p["state"]))
+            except (KeyError, TypeError, ValueError):
+                continue
+            if entry[0] <= now:
+                events.append(entry)
+            else:
+                with self._lock:
+                    self._push(entry[0], "end", str(p.get("job", "")), entry[1], entry[2])
+
+        if last_tick:
+            since = max(float(last_tick), now - self._catchup_max_s)
+            for job in self._jobs.values():
+                if not job.catch_up:
+                    continue
+                ts = job.trigger.next_after(since)
+                while ts is not None and ts <= now:
+                    events.append((ts, job.channel, job.state))
+                    if job.duration_s:
+                        end = ts + job.duration_s
+                        if end <= now:
+                            events.append((end, job.channel, not job.state))
+                        else:
+                            with self._lock:
+                                self._push(end, "end", job.id, job.channel, not job.state)
+                    ts = job.trigger.next_after(ts)
+
+        if not events:
+            return
+        changes = {}
+        for _, channel, st in sorted(events):
+            changes[channel] = st
+        logging.info(f"Scheduler: {len(events)} verpasste Ausführung(en) nachgeholt")
+        try:
+            self._apply(changes, "schedule-catchup")
+        except Exception as e:
+            logging.error(f"Scheduler: Nachholen fehlgeschlagen: {e}")
+
+    # -------------------------------------------------------------- Lauf
+    def _loop(self):
+        while self._running:
+            with self._lock:
+                next_ts = self._heap[0][0] if self._heap else None
+            timeout = MAX_SLEEP_S if next_ts is None else min(MAX_SLEEP_S, next_ts - time.time())
+            if timeout > 0:
+                self._wake.wait(timeout)
+                self._wake.clear()
+            if not self._running:
+                break
+            try:
+                self._fire_due(time.time())
+                if self._reload_requested or self._file_changed():
+                    self._reload_requested = False
+                    self._jobs = self._load_jobs()
+                    self._rebuild_heap(time.time())
+                    self._save_state(time.time())
+            except Exception as e:
+                logging.error(f"Scheduler-Loop Fehler: {e}")
+
+    def _fire_due(self, now: float):
+        changes = {}
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                ts, _, kind, jid, channel, state = heapq.heappop(self._heap)
+                if kind == "start":
+                    job = self._jobs.get(jid)
+                    if job is None:
+                        continue
+                    nxt = job.trigger.next_after(max(ts, now))
+                    if nxt is not None:
+                        self._push(nxt, "start", jid, channel, state)
+                    if job.duration_s:
+                        self._push(ts + job.duration_s, "end", jid, channel, not state)
+                changes[channel] = state
+        if not changes:
+            return
+        try:
+            self._apply(changes, "schedule")
+        except Exception as e:
+            logging.error(f"Scheduler: Fehler bei Kanälen {sorted(changes)}: {e}")
+        self._save_state(now)
@@ -0,0 +1,364 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+queue_retention.py – Begrenzung und Pflege der Offline-Queue (data/offline_cache.db).
+
+Ohne Begrenzung wächst offline_queue bei einem langen Ausfall, bis die SD-Karte
+voll ist – und gelöschte Zeilen geben ohne VACUUM keinen Platz frei.
+
+- Verdichten (QUEUE_DOWNSAMPLE): Messpunkte älter als QUEUE_DOWNSAMPLE_AFTER_H
+  werden blockweise aus offline_queue genommen und pro Kanal und Zeitfenster
+  (QUEUE_DOWNSAMPLE_INTERVAL_S) als Mittelwert in offline_queue_downsampled
+  abgelegt. Zählerstände (COUNTER) behalten den letzten Wert des Fensters,
+  Schaltereignisse (OUTPUT) bleiben einzeln erhalten.
+- Grenzen (QUEUE_MAX_ROWS, QUEUE_MAX_MB, QUEUE_MAX_AGE_DAYS; 0 = aus): was
+  darüber liegt, wird vom ältesten Ende verworfen – zuerst die verdichteten Daten.
+- auto_vacuum=INCREMENTAL: freie Seiten gibt idle_vacuum() schrittweise in der
+  Leerlaufzeit des Loggers an das Dateisystem zurück. Bestehende Datenbanken
+  werden einmalig per VACUUM umgestellt, sobald sie klein genug sind.
+
+Die ids sind nicht lückenlos (die Vorrangspur löscht gesendete Live-Punkte
+oberhalb des Rückstands). Die Tiefe führt deshalb queue_meta: Trigger zählen
+jedes INSERT/DELETE mit – egal, über welche Verbindung (Logger, Nachsende-
+Thread, Verdichtung) – ohne COUNT(*)-Scan.
+"""
+
+import json
+import logging
+import math
+import sqlite3
+import time
+from datetime import datetime, timezone
+
+QUEUE_TABLE = "offline_queue"
+DOWNSAMPLED_TABLE = "offline_queue_downsampled"
+TABLES = (DOWNSAMPLED_TABLE, QUEUE_TABLE)    # Reihenfolge = älteste Daten zuerst
+META_TABLE = "queue_meta"                    # Zeilenzahl je Tabelle (per Trigger gepflegt)
+
+DOWNSAMPLE_CHUNK = 2000          # Zeilen pro Verdichtungsschritt
+MAX_DELETE_PER_RUN = 20000       # Obergrenze für Löschungen pro enforce_limits()
+VACUUM_STEP_PAGES = 128          # Seiten pro incremental_vacuum-Schritt
+MIGRATE_MAX_BYTES = 64 * 1024 * 1024    # Umstellung per VACUUM nur bis zu dieser Größe
+AUTO_VACUUM_INCREMENTAL = 2
+
+# Felder, die beim Verdichten gemittelt werden (sofern numerisch)
+_AVG_FIELDS = ("current_mA", "level_m", "wasser_oberflaeche_m", "messwert_NN",
+               "pegel_diff", "value", "temperature_C")
+
+
+class RetentionPolicy:
+    """Grenzen und Verdichtung aus der Config (0 = keine Grenze)."""
+
+    def __init__(self, cfg: dict):
+        self.max_rows = int(float(cfg.get("QUEUE_MAX_ROWS", 0) or 0))
+        self.max_bytes = int(float(cfg.get("QUEUE_MAX_MB", 0) or 0) * 1024 * 1024)
+        self.max_age_s = float(cfg.get("QUEUE_MAX_AGE_DAYS", 0) or 0) * 86400
+        self.downsample = bool(cfg.get("QUEUE_DOWNSAMPLE", True))
+        self.downsample_after_s = float(cfg.get("QUEUE_DOWNSAMPLE_AFTER_H", 24) or 0) * 3600
+        self.downsample_interval_s = max(1, int(float(cfg.get("QUEUE_DOWNSAMPLE_INTERVAL_S", 300) or 300)))
+
+
+# ============================================================
+# 🗄️ SCHEMA / ZUSTAND
+# ============================================================
+def ensure_schema(conn):
+    conn.execute(f"""
+    CREATE TABLE IF NOT EXISTS {DOWNSAMPLED_TABLE} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        payload TEXT NOT NULL
+    )
+    """)
+    conn.execute(f"CREATE TABLE IF NOT EXISTS {META_TABLE} (tbl TEXT PRIMARY KEY, rows INTEGER NOT NULL)")
+    for table in TABLES:
+        # Bestehende Datenbank: einmal zählen, danach halten die Trigger den Wert aktuell
+        conn.execute(f"INSERT OR IGNORE INTO {META_TABLE} (tbl, rows) SELECT ?, COUNT(*) FROM {table}",
+                     (table,))
+        conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS {table}_count_ins AFTER INSERT ON {table}
+        BEGIN UPDATE {META_TABLE} SET rows = rows + 1 WHERE tbl = '{table}'; END
+        """)
+        conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS {table}_count_del AFTER DELETE ON {table}
+        BEGIN UPDATE {META_TABLE} SET rows = rows - 1 WHERE tbl = '{table}'; END
+        """)
+    conn.commit()
+
+
+def entry_ts(entry):
+    """Zeitstempel eines Queue-Eintrags als Unix-Zeit (naiv = UTC), None wenn ungültig."""
+    try:
+        dt = datetime.fromisoformat(entry["timestamp"])
+    except (KeyError, TypeError, ValueError):
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+
+def table_span(conn, table: str) -> tuple:
+    return conn.execute(f"SELECT MIN(id), MAX(id) FROM {table}").fetchone()
+
+
+def table_rows(conn, table: str) -> int:
+    row = conn.execute(f"SELECT rows FROM {META_TABLE} WHERE tbl=?", (table,)).fetchone()
+    return max(0, row[0]) if row else 0
+
+
+def _row_ts(conn, table: str, rid: int):
+    """Zeitstempel der ersten Zeile mit id >= rid (ids können Lücken haben)."""
+    row = conn.execute(f"SELECT payload FROM {table} WHERE id >= ? ORDER BY id LIMIT 1", (rid,)).fetchone()
+    if row is None:
+        return None
+    try:
+        return entry_ts(json.loads(row[0]))
+    except ValueError:
+        return None
+
+
+def queue_status(conn) -> dict:
+    """Tiefe beider Tabellen und Zeitstempel des ältesten Eintrags (Indexzugriffe)."""
+    result = {"depth": 0, "downsampled": 0, "oldest_ts": None}
+    for table in TABLES:
+        n = table_rows(conn, table)
+        if not n:
+            continue
+        lo = table_span(conn, table)[0]
+        result["depth"] += n
+        if table == DOWNSAMPLED_TABLE:
+            result["downsampled"] = n
+        ts = _row_ts(conn, table, lo)
+        if ts is not None and (result["oldest_ts"] is None or ts < result["oldest_ts"]):
+            result["oldest_ts"] = ts
+    return result
+
+
+def db_usage(conn) -> dict:
+    page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+    pages = conn.execute("PRAGMA page_count").fetchone()[0]
+    free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    return {
+        "file_bytes": pages * page_size,
+        "used_bytes": (pages - free) * page_size,
+        "free_bytes": free * page_size,
+        "incremental": conn.execute("PRAGMA auto_vacuum").fetchone()[0] == AUTO_VACUUM_INCREMENTAL,
+    }
+
+
+# ============================================================
+# 📉 VERDICHTEN
+# ============================================================
+def _is_number(v) -> bool:
+    return isinstance(v, (int, float)) and not isinstance(v, bool)
+
+
+def _aggregate(rows: list, interval: int) -> list:
+    """rows: [(entry, ts)] → verdichtete Einträge in Reihenfolge des ersten Auftretens."""
+    out, groups = [], {}
+    for entry, ts in rows:
+        kind = str(entry.get("type", "LEVEL")).upper()
+        if kind == "OUTPUT":
+            out.append(("raw", entry))
+            continue
+        key = (kind, entry.get("channel"), int(ts // interval))
+        g = groups.get(key)
+        if g is None:
+            g = groups[key] = {"kind": kind, "bucket": key[2], "n": 0, "sums": {}, "counts": {}}
+            out.append(("group", g))
+        g["n"] += 1
+        g["last"] = entry
+        for field in _AVG_FIELDS:
+            v = entry.get(field)
+            if _is_number(v):
+                g["sums"][field] = g["sums"].get(field, 0.0) + v
+                g["counts"][field] = g["counts"].get(field, 0) + 1
+
+    result = []
+    for what, item in out:
+        if what == "raw":
+            result.append(item)    # Schaltereignis unverändert
+            continue
+        entry = dict(item["last"])
+        if item["kind"] != "COUNTER":
+            for field, total in item["sums"].items():
+                entry[field] = total / item["counts"][field]
+            entry["timestamp"] = datetime.fromtimestamp(item["bucket"] * interval, timezone.utc).isoformat()
+        entry["samples"] = item["n"]
+        result.append(entry)
+    return result
+
+
+def downsample_step(conn, policy: RetentionPolicy, now: float = None) -> tuple:
+    """
+    Verdichtet höchstens DOWNSAMPLE_CHUNK der ältesten Zeilen, soweit sie älter als
+    downsample_after_s sind. Gibt (gelesen, geschrieben) zurück.
+    """
+    if not policy.downsample:
+        return 0, 0
+    cutoff = (now or time.time()) - policy.downsample_after_s
+    interval = policy.downsample_interval_s
+
+    take = []    # (id, entry, ts)
+    c = conn.cursor()
+    try:
+        for rid, payload in c.execute(
+                f"SELECT id, payload FROM {QUEUE_TABLE} ORDER BY id ASC LIMIT ?", (DOWNSAMPLE_CHUNK,)):
+            try:
+                entry = json.loads(payload)
+            except ValueError:
+                entry = None    # korrupt: wird mit entfernt
+            ts = entry_ts(entry) if isinstance(entry, dict) else None
+            if ts is not None and ts >= cutoff:
+                break
+            take.append((rid, entry, ts))
+    finally:
+        c.close()
+    if not take:
+        return 0, 0
+
+    # Voller Block: das letzte Zeitfenster erst im nächsten Schritt vollständig verdichten
+    if len(take) == DOWNSAMPLE_CHUNK and take[-1][2] is not None:
+        last_bucket = int(take[-1][2] // interval)
+        cut = len(take)
+        while cut > 0 and take[cut - 1][2] is not None and int(take[cut - 1][2] // interval) == last_bucket:
+            cut -= 1
+        if cut > 0:
+            take = take[:cut]
+
+    rows = [(entry, ts) for _, entry, ts in take if isinstance(entry, dict) and ts is not None]
+    aggregated = _aggregate(rows, interval)
+    with conn:
+        conn.executemany(f"INSERT INTO {DOWNSAMPLED_TABLE} (payload) VALUES (?)",
+                         [(json.dumps(e),) for e in aggregated])
+        conn.execute(f"DELETE FROM {QUEUE_TABLE} WHERE id <= ?", (take[-1][0],))
+    return len(take), len(aggregated)
+
+
+# ============================================================
+# ✂️ GRENZEN
+# ============================================================
+def _drop_oldest(conn, n: int) -> int:
+    """Verwirft die n ältesten Zeilen über beide Tabellen."""
+    dropped = 0
+    for table in TABLES:
+        if n <= 0:
+            break
+        with conn:
+            k = conn.execute(f"DELETE FROM {table} WHERE id IN "
+                             f"(SELECT id FROM {table} ORDER BY id ASC LIMIT ?)", (n,)).rowcount
+        dropped += k
+        n -= k
+    return dropped
+
+
+def _drop_older_than(conn, table: str, cutoff: float, limit: int) -> int:
+    """Binärsuche über die (annähernd zeitlich sortierten) ids, dann ein DELETE (höchstens limit Zeilen)."""
+    lo, hi = table_span(conn, table)
+    if lo is None or limit <= 0:
+        return 0
+    ts = _row_ts(conn, table, lo)
+    if ts is not None and ts >= cutoff:
+        return 0
+    a, b = lo, min(hi, lo + limit - 1)
+    while a < b:
+        mid = (a + b + 1) // 2
+        ts = _row_ts(conn, table, mid)
+        if ts is None or ts < cutoff:
+            a = mid
+        else:
+            b = mid - 1
+    with conn:
+        return conn.execute(f"DELETE FROM {table} WHERE id IN (SELECT id FROM {table} "
+                            f"WHERE id <= ? ORDER BY id ASC LIMIT ?)", (a, limit)).rowcount
+
+
+def enforce_limits(conn, policy: RetentionPolicy, now: float = None) -> dict:
+    """Setzt Alter-, Zeilen- und Byte-Grenze durch. Gibt die verworfenen Zeilen je Grund zurück."""
+    dropped = {"age": 0, "rows": 0, "bytes": 0}
+    budget = MAX_DELETE_PER_RUN
+
+    if policy.max_age_s:
+        cutoff = (now or time.time()) - policy.max_age_s
+        for table in TABLES:
+            n = _drop_older_than(conn, table, cutoff, budget)
+            dropped["age"] += n
+            budget -= n
+
+    if policy.max_rows and budget > 0:
+        excess = queue_status(conn)["depth"] - policy.max_rows
+        if excess > 0:
+            dropped["rows"] = _drop_oldest(conn, min(excess, budget))
+            budget -= dropped["rows"]
+
+    if policy.max_bytes and budget > 0:
+        used = db_usage(conn)["used_bytes"]
+        depth = queue_status(conn)["depth"]
+        if used > policy.max_bytes and depth:
+            per_row = used / depth    # grob, enthält auch Alarm-/Outbox-Tabellen → eher zu viel
+            dropped["bytes"] = _drop_oldest(conn, min(budget, math.ceil((used - policy.max_bytes) / per_row)))
+    return dropped
+
+
+# ============================================================
+# 🧹 INKREMENTELLES VACUUM
+# ============================================================
+def ensure_incremental_vacuum(conn, max_bytes: int = MIGRATE_MAX_BYTES) -> bool:
+    """
+    Stellt auf auto_vacuum=INCREMENTAL um. Bei leerer Datenbank wirkt das Pragma
+    sofort, sonst ist ein VACUUM nötig – nur bis max_bytes belegter Größe, damit
+    Laufzeit und temporärer Platzbedarf begrenzt bleiben. True = aktiv.
+    """
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == AUTO_VACUUM_INCREMENTAL:
+        return True
+    conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == AUTO_VACUUM_INCREMENTAL:
+        return True
+    used = db_usage(conn)["used_bytes"]
+    if used > max_bytes:
+        return False
+    try:
+        conn.commit()
+        t0 = time.monotonic()
+        conn.execute("VACUUM")
+        logging.info(f"🧹 Offline-Queue auf auto_vacuum=INCREMENTAL umgestellt "
+                     f"({used / 1024 / 1024:.1f} MB, {time.monotonic() - t0:.1f} s)")
+    except sqlite3.Error as e:
+        logging.warning(f"auto_vacuum-Umstellung verschoben: {e}")
+        return False
+    return conn.execute("PRAGMA auto_vacuum").fetchone()[0] == AUTO_VACUUM_INCREMENTAL
+
+
+def idle_vacuum(conn, deadline: float, pages: int = VACUUM_STEP_PAGES) -> int:
+    """Gibt freie Seiten in Schritten zurück, bis keine mehr frei sind oder deadline (monotonic) erreicht ist."""
+    freed = 0
+    while time.monotonic() < deadline:
+        before = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        if not before:
+            break
+        conn.execute(f"PRAGMA incremental_vacuum({int(pages)})").fetchall()
+        after = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        if after >= before:
+            break
+        freed += before - after
+    return freed
+
+
+# ============================================================
+# 🚦 ZUSTAND FÜR DIE GUI
+# ============================================================
+def health(gauges: dict, now: float = None) -> dict:
+    """Füllstand gegenüber den Grenzen (aus den Logger-Gauges) → ok / warn / critical."""
+    now = now or time.time()
+    oldest = gauges.get("queue_oldest_ts")
+    age_s = max(0.0, now - oldest) if oldest else 0.0
+    fill = {}
+    for name, value, limit in (("rows", gauges.get("queue_depth"), gauges.get("queue_limit_rows")),
+                               ("bytes", gauges.get("queue_used_bytes"), gauges.get("queue_limit_bytes")),
+                               ("age", age_s, gauges.get("queue_limit_age_s"))):
+        if value is not None and limit:
+            fill[name] = round(min(1.0, value / limit), 3)
+    worst = max(fill.values(), default=0.0)
+    return {
+        "status": "critical" if worst >= 0.9 else "warn" if worst >= 0.6 else "ok",
+        "fill": fill,
+        "age_s": round(age_s, 1),
+    }
@@ -3,20 +3,21 @@
 """
 Reedkontakt-Modul: Zählt Impulse auf GPIO 25 und GPIO 27.
 Jeder Impuls (fallende Flanke) entspricht einer konfigurierbaren Liter-Menge.
-Zählerstände werden persistent in einer JSON-Datei gespeichert.
+Zählerstände liegen aktuell im tmpfs und werden gebündelt (state_store.py)
+in die JSON-Datei auf der SD-Karte geschrieben.
 """
 
 import lgpio
 import threading
-import json
 import os
 import logging
 import time
 
+import state_store
+
 REED_GPIOS = [25, 27]        # GPIO-Pins der Reedkontakte
 DEBOUNCE_S = 0.05            # 50 ms Entprellzeit
 POLL_INTERVAL_S = 0.01       # 10 ms Abfrageintervall
-SAVE_INTERVAL_S = 30.0       # Automatische Speicherung alle 30 s
 
 _chip = None
 _counts: dict = {}
@@ -26,23 +27,24 @@ _prev_state: dict = {}
 _running = False
 _thread = None
 _count_file: str = None
+_store = None                # state_store.PersistentState
 
 
-def _load_counts(path: str) -> dict:
-    if os.path.exists(path):
-        try:
-            with open(path) as f:
-                return {int(k): int(v) for k, v in json.load(f).items()}
-        except Exception as e:
-            logging.warning(f"Reed: Zählerstand konnte nicht geladen werden: {e}")
+def _load_counts() -> dict:
+    try:
+        data = _store.load()
+        if data:
+            return {int(k): int(v) for k, v in data.items()}
+    except Exception as e:
+        logging.warning(f"Reed: Zählerstand konnte nicht geladen werden: {e}")
     return {g: 0 for g in REED_GPIOS}
 
 
-def _save_counts(path: str):
-    tmp = path + ".tmp"
-    with open(tmp, "w") as f:
-        json.dump({str(k): v for k, v in _counts.items()}, f)
-    os.replace(tmp, path)
+def _save_counts(force: bool = False):
+    """tmpfs sofort, SD-Karte gebündelt (force: sofort, z.B. nach Reset)."""
+    _store.update({str(k): v for k, v in _counts.items()})
+    if force:
+        _store.flush(force=True)
 
 
 def _check_reset_flags():
@@ -57,14 +59,13 @@ def _check_reset_flags():
                 os.remove(flag)
                 with _lock:
                     _counts[gpio] = 0
-                    _save_counts(_count_file)
+                    _save_counts(force=True)
                 logging.info(f"Reed GPIO{gpio}: Zähler zurückgesetzt")
             except Exception as e:
                 logging.warning(f"Reed: Reset-Fehler GPIO{gpio}: {e}")
 
 
 def _poll_loop():
-    last_save = time.time()
     while _running:
         now = time.time()
         changed = False
@@ -88,25 +89,25 @@ def _poll_loop():
             except Exception as e:
                 logging.warning(f"Reed: Lesefehler GPIO{gpio}: {e}")
 
-        # Periodisch oder bei Änderung speichern
-        if (changed or now - last_save >= SAVE_INTERVAL_S) and _count_file:
+        # Bei Änderung ins tmpfs (SD-Karte übernimmt state_store gebündelt)
+        if changed:
             with _lock:
                 try:
-                    _save_counts(_count_file)
+                    _save_counts()
                 except Exception as e:
                     logging.warning(f"Reed: Speicherfehler: {e}")
-            last_save = now
 
         time.sleep(POLL_INTERVAL_S)
 
 
 def init(count_file: str):
     """Initialisiert das Reed-Modul. Muss einmalig beim Start aufgerufen werden."""
-    global _chip, _counts, _prev_state, _running, _thread, _count_file
+    global _chip, _counts, _prev_state, _running, _thread, _count_file, _store
     _count_file = count_file
+    _store = state_store.PersistentState(os.path.basename(count_file), count_file)
 
-    # Persistierte Zählerstände laden
-    loaded = _load_counts(count_file)
+    # Persistierte Zählerstände laden (tmpfs-Fassung, falls neuer)
+    loaded = _load_counts()
     with _lock:
         for g in REED_GPIOS:
             _counts[g] = loaded.get(g, 0)
@@ -138,9 +139,9 @@ def reset_count(gpio: int):
     """Setzt Impulszähler für den angegebenen GPIO auf 0 zurück."""
     with _lock:
         _counts[gpio] = 0
-        if _count_file:
+        if _store:
             try:
-                _save_counts(_count_file)
+                _save_counts(force=True)
             except Exception as e:
                 logging.warning(f"Reed: Reset-Speicherfehler: {e}")
 
@@ -149,6 +150,11 @@ def shutdown():
     """Stoppt den Poll-Thread und schließt den GPIO-Chip."""
     global _running
     _running = False
+    if _thread:
+        _thread.join(timeout=1.0)
+    if _store:
+        with _lock:
+            _store.flush(force=True)
     if _chip is not None:
         try:
             lgpio.gpiochip_close(_chip)
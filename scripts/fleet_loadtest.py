@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+fleet_loadtest.py – Lasttest für fleet_ingest.py mit simulierten Geräten.
+
+Startet einen InfluxDB-Ersatz (POST /api/v2/write, prüft Token, zählt Zeilen
+pro Mandant und doppelt geschriebene Punkte, optional mit Fehlern und Latenz),
+bei Bedarf den Testbroker (mqtt_test_broker.py) und K Instanzen von
+fleet_ingest.py (Shared Subscription), und simuliert dann N Geräte, die wie
+wasserstand_logger.py veröffentlichen – Kanal- oder Batch-Modus, mit einem
+Anteil wiederholter Zyklen wie beim Nachsenden nach einem Ausfall.
+
+Am Ende: veröffentlichte und geschriebene Punkte, Duplikate in InfluxDB,
+Batch-Größen, Verzögerung bis zum Write (p50/p95) und /health jeder Instanz.
+
+Beispiel:
+    python3 scripts/fleet_loadtest.py --devices 200 --tenants 5 --instances 2 \\
+        --duration 60 --interval 5 --mode batch --encoding struct --dup-rate 0.05
+"""
+
+import argparse
+import gzip
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+import paho.mqtt.client as mqtt  # noqa: E402
+
+import mqtt_codec  # noqa: E402
+
+PREFIX = "brunnen"
+
+
+# ============================================================
+# 🗄️ INFLUXDB-ERSATZ
+# ============================================================
+class InfluxSink:
+    def __init__(self, tokens: dict, fail_rate: float = 0.0, latency_s: float = 0.0):
+        self.tokens = tokens              # (org, bucket) -> token
+        self.fail_rate = fail_rate
+        self.latency_s = latency_s
+        self.lock = threading.Lock()
+        self.lines = {}                   # (org, bucket) -> Anzahl
+        self.keys = set()                 # (serie, zeit)
+        self.duplicates = 0
+        self.batches = 0
+        self.failed = 0
+        self.delays = []                  # Sekunden zwischen Messzeitpunkt und Write
+
+    def handle(self, query: dict, headers, body: bytes) -> int:
+        if self.latency_s:
+            time.sleep(self.latency_s)
+        org, bucket = query.get("org", [""])[0], query.get("bucket", [""])[0]
+        if headers.get("Authorization") != f"Token {self.tokens.get((org, bucket))}":
+            return 401
+        if random.random() < self.fail_rate:
+            with self.lock:
+                self.failed += 1
+            return 503
+        if headers.get("Content-Encoding") == "gzip":
+            body = gzip.decompress(body)
+        now = time.time()
+        with self.lock:
+            self.batches += 1
+            for line in body.decode().splitlines():
+                head, _, ts = line.rsplit(" ", 2)
+                key = (head, ts)
+                if key in self.keys:
+                    self.duplicates += 1
+                else:
+                    self.keys.add(key)
+                self.lines[(org, bucket)] = self.lines.get((org, bucket), 0) + 1
+                self.delays.append(now - int(ts))
+        return 204
+
+    def serve(self, port: int):
+        sink = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                url = urlparse(self.path)
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                status = sink.handle(parse_qs(url.query), self.headers, body) if url.path == "/api/v2/write" else 404
+                self.send_response(status)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def log_message(self, fmt, *args):
+                pass
+
+        server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+
+# ============================================================
+# 📟 SIMULIERTE GERÄTE
+# ============================================================
+def make_cycle(n: int, ts: str) -> list:
+    data = []
+    for i, ch in enumerate(("A0", "A1", "A2", "A3")):
+        level = 10.0 + i + random.uniform(-0.05, 0.05)
+        data.append({"channel": ch, "timestamp": ts, "name": f"Brunnen {ch}", "type": "LEVEL", "unit": "m",
+                     "current_mA": 4 + level, "level_m": level, "wasser_oberflaeche_m": 3.0,
+                     "messwert_NN": 100.0 - level, "pegel_diff": -0.2, "value": level})
+    data.append({"channel": "BMP280", "timestamp": ts, "name": "Barometer", "type": "PRESSURE", "unit": "hPa",
+                 "value": 1013.0 + random.uniform(-1, 1), "temperature_C": 18.0, "current_mA": None})
+    for r in (1, 2):
+        data.append({"channel": f"REED{r}", "timestamp": ts, "name": f"Wasserzähler {r}", "type": "COUNTER",
+                     "unit": "L", "impulse_total": 1000 + n, "value": float(1000 + n), "current_mA": None})
+    return data
+
+
+class Device:
+    def __init__(self, device_id: str, args):
+        self.device_id = device_id
+        self.args = args
+        self.encoder = mqtt_codec.BatchEncoder(device_id, "Lasttest")
+        self.cycles = 0
+        self.points = 0
+        self.messages = 0
+        self.last = []
+        self.client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION1, client_id=device_id, clean_session=True)
+        self.client.connect_async(args.mqtt_host, args.mqtt_port, keepalive=60)
+        self.client.loop_start()
+
+    def build(self, all_data: list) -> list:
+        base = f"{PREFIX}/{self.device_id}"
+        if self.args.mode == "batch":
+            msgs = []
+            if self.encoder.update_schema(all_data):
+                msgs.append((f"{base}/batch/schema", self.encoder.schema_payload(), True))
+            msgs.append((f"{base}/batch", self.encoder.encode(all_data, self.args.encoding), False))
+            return msgs
+        return [(f"{base}/sensor/{e['channel']}",
+                 json.dumps(dict(e, device_id=self.device_id, location="Lasttest")), False) for e in all_data]
+
+    def tick(self):
+        if self.last and random.random() < self.args.dup_rate:
+            msgs = self.last                 # Nachsenden: derselbe Zyklus noch einmal
+        else:
+            ts = datetime.now(timezone.utc).replace(microsecond=0).isoformat()
+            all_data = make_cycle(self.cycles, ts)
+            msgs = self.build(all_data)
+            self.cycles += 1
+            self.points += len(all_data)
+        for topic, payload, retain in msgs:
+            self.client.publish(topic, payload, qos=1, retain=retain)
+        self.messages += len(msgs)
+        self.last = [m for m in msgs if not m[2]]
+
+    def close(self):
+        self.client.loop_stop()
+        self.client.disconnect()
+
+
+# ============================================================
+def _health(port: int) -> dict:
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=2) as r:
+            return json.load(r)
+    except Exception:
+        return {}
+
+
+def _pct(values: list, p: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p * len(values)))] if values else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Lasttest für fleet_ingest.py")
+    parser.add_argument("--devices", type=int, default=50)
+    parser.add_argument("--tenants", type=int, default=3)
+    parser.add_argument("--instances", type=int, default=1, help="Anzahl fleet_ingest-Instanzen (0 = extern)")
+    parser.add_argument("--duration", type=float, default=30.0, help="Sekunden")
+    parser.add_argument("--interval", type=float, default=5.0, help="Messintervall je Gerät")
+    parser.add_argument("--mode", choices=("channel", "batch"), default="channel")
+    parser.add_argument("--encoding", choices=mqtt_codec.ENCODINGS, default="json")
+    parser.add_argument("--dup-rate", type=float, default=0.0, help="Anteil wiederholter Zyklen (0..1)")
+    parser.add_argument("--mqtt-host", default="127.0.0.1")
+    parser.add_argument("--mqtt-port", type=int, default=1884)
+    parser.add_argument("--no-broker", action="store_true", help="Broker nicht selbst starten")
+    parser.add_argument("--influx-port", type=int, default=8098)
+    parser.add_argument("--influx-fail-rate", type=float, default=0.0, help="Anteil Writes mit HTTP 503")
+    parser.add_argument("--influx-latency", type=float, default=0.0, help="Antwortzeit in ms")
+    parser.add_argument("--metrics-port", type=int, default=9115, help="erster /health-Port der Instanzen")
+    args = parser.parse_args()
+
+    tenants = [{"name": f"t{i}", "devices": [f"loadtest-t{i}-*"], "org": f"org{i}",
+                "bucket": "brunnen_messdaten", "token": f"token-{i}"} for i in range(args.tenants)]
+    sink = InfluxSink({(t["org"], t["bucket"]): t["token"] for t in tenants},
+                      args.influx_fail_rate, args.influx_latency / 1000.0)
+    sink.serve(args.influx_port)
+
+    procs = []
+    if not args.no_broker:
+        procs.append(subprocess.Popen([sys.executable, os.path.join(BASE_DIR, "scripts", "mqtt_test_broker.py"),
+                                       "--host", args.mqtt_host, "--port", str(args.mqtt_port),
+                                       "--quiet", "--report", "3600"], stdout=subprocess.DEVNULL))
+        time.sleep(0.5)
+    cfg_dir = tempfile.mkdtemp(prefix="fleet_loadtest_")
+    ports = []
+    for k in range(args.instances):
+        port = args.metrics_port + k
+        cfg = {"mqtt": {"host": args.mqtt_host, "port": args.mqtt_port, "client_id": f"fleet-ingest-{k}"},
+               "influx": {"url": f"http://127.0.0.1:{args.influx_port}"},
+               "tenants": tenants, "metrics_port": port}
+        path = os.path.join(cfg_dir, f"fleet_ingest_{k}.json")
+        with open(path, "w") as f:
+            json.dump(cfg, f, indent=2)
+        procs.append(subprocess.Popen([sys.executable, os.path.join(BASE_DIR, "fleet_ingest.py"), "--config", path],
+                                      cwd=BASE_DIR))
+        ports.append(port)
+    deadline = time.monotonic() + 15
+    while ports and not all(_health(p).get("mqtt_connected") for p in ports) and time.monotonic() < deadline:
+        time.sleep(0.2)
+
+    devices = [Device(f"loadtest-t{n % args.tenants}-d{n:04d}", args) for n in range(args.devices)]
+    time.sleep(1.0)
+    print(f"▶ {args.devices} Geräte, {args.tenants} Mandanten, {args.instances} Ingest-Instanz(en), "
+          f"Modus {args.mode}{'/' + args.encoding if args.mode == 'batch' else ''}, {args.duration:g} s")
+
+    # Geräte gleichmäßig über das Intervall verteilen
+    t_start = time.monotonic()
+    offsets = [args.interval * n / max(1, args.devices) for n in range(args.devices)]
+    next_at = [t_start + o for o in offsets]
+    while time.monotonic() - t_start < args.duration:
+        now = time.monotonic()
+        for i, dev in enumerate(devices):
+            if now >= next_at[i]:
+                dev.tick()
+                next_at[i] += args.interval
+        time.sleep(0.01)
+    elapsed = time.monotonic() - t_start
+
+    expected = sum(d.points for d in devices)
+    deadline = time.monotonic() + 30
+    while len(sink.keys) < expected and time.monotonic() < deadline:
+        time.sleep(0.5)
+    health = [_health(p) for p in ports]
+
+    for dev in devices:
+        dev.close()
+    for p in reversed(procs):
+        p.terminate()
+    for p in procs:
+        try:
+            p.wait(15)
+        except subprocess.TimeoutExpired:
+            p.kill()
+
+    messages = sum(d.messages for d in devices)
+    written = sum(sink.lines.values())
+    print(f"\nVeröffentlicht: {messages} Nachrichten ({messages / elapsed:.0f}/s), {expected} eindeutige Punkte")
+    print(f"InfluxDB:       {written} Zeilen in {sink.batches} Writes "
+          f"(Ø {written / max(1, sink.batches):.0f} pro Write), {sink.failed} Writes mit 503")
+    print(f"                {len(sink.keys)} eindeutig ({len(sink.keys) / max(1, expected):.1%}), "
+          f"{sink.duplicates} doppelt geschrieben")
+    print(f"Verzögerung:    p50 {_pct(sink.delays, 0.5):.1f} s, p95 {_pct(sink.delays, 0.95):.1f} s "
+          f"(Sekundenauflösung)")
+    for (org, bucket), n in sorted(sink.lines.items()):
+        print(f"  {org}/{bucket}: {n}")
+    for port, h in zip(ports, health):
+        print(f"  Instanz :{port} {json.dumps(h)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+mqtt_payload_bench.py – Nutzlastgröße und Durchsatz der MQTT-Modi vergleichen.
+
+Erzeugt typische Messzyklen (4 Pegelkanäle, BMP280, 2 Wasserzähler), kodiert
+sie im Kanalmodus und in den Batch-Kodierungen json/zlib/struct (mqtt_codec.py)
+und gibt pro Zyklus aus: Nachrichten, Nutzlast-Bytes, Bytes auf der Leitung
+(MQTT-Header, Topic, Paket-ID und PUBACK bei QoS 1; ohne TCP/TLS), Volumen pro
+Tag beim gewählten Messintervall sowie kodierte Zyklen pro Sekunde. Jede
+Batch-Kodierung wird zurückgelesen und mit dem Original verglichen.
+
+Beispiel:
+    python3 scripts/mqtt_payload_bench.py --cycles 5000 --interval 5 --qos 1
+"""
+
+import argparse
+import json
+import math
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import mqtt_codec  # noqa: E402
+
+DEVICE_ID = "pi-brunnen-nord"
+LOCATION = "Brunnenfeld Nord"
+PREFIX = "brunnen"
+
+
+def make_cycle(i: int, start: datetime) -> list:
+    ts = (start + timedelta(seconds=5 * i)).isoformat()
+    data = []
+    for n, ch in enumerate(("A0", "A1", "A2", "A3")):
+        level = 12.0 + n + random.uniform(-0.05, 0.05)
+        data.append({
+            "channel": ch, "timestamp": ts, "name": f"Brunnen {ch}", "type": "LEVEL", "unit": "m",
+            "current_mA": round(4 + level, 4), "level_m": level, "value": level,
+            "wasser_oberflaeche_m": 3.2, "messwert_NN": 101.7 - level, "pegel_diff": -0.35,
+        })
+    data.append({"channel": "BMP280", "timestamp": ts, "name": "Barometer", "type": "PRESSURE",
+                 "unit": "hPa", "value": 1013.2 + random.uniform(-1, 1), "current_mA": None,
+                 "temperature_C": 18.4 + random.uniform(-0.2, 0.2)})
+    for r in (1, 2):
+        impulses = 120000 + 3 * i + r
+        data.append({"channel": f"REED{r}", "timestamp": ts, "name": f"Wasserzähler {r}", "type": "COUNTER",
+                     "unit": "L", "impulse_total": impulses, "value": impulses * 1.0, "current_mA": None})
+    return data
+
+
+def channel_messages(all_data: list) -> list:
+    """Nachbildung des Kanalmodus in wasserstand_logger.build_mqtt_messages()."""
+    messages = []
+    for entry in all_data:
+        payload = {"device_id": DEVICE_ID, "location": LOCATION, "timestamp": entry.get("timestamp"),
+                   "channel": entry["channel"], "name": entry.get("name", ""), "type": entry.get("type", ""),
+                   "unit": entry.get("unit", ""), "value": entry.get("value"),
+                   "current_mA": entry.get("current_mA")}
+        if entry["type"] == "LEVEL":
+            payload.update(level_m=entry["level_m"], wasser_oberflaeche_m=entry["wasser_oberflaeche_m"],
+                           messwert_NN=entry["messwert_NN"],
+                           pegel_diff=entry["pegel_diff"])
+        elif entry["type"] == "PRESSURE":
+            payload["temperature_C"] = entry["temperature_C"]
+        elif entry["type"] == "COUNTER":
+            payload["impulse_total"] = entry["impulse_total"]
+        messages.append((f"{PREFIX}/{DEVICE_ID}/sensor/{entry['channel']}", json.dumps(payload)))
+    return messages
+
+
+def wire_bytes(topic: str, payload, qos: int) -> int:
+    """PUBLISH (Fixed Header, Topic, Paket-ID) + PUBACK/PUBREC-Kette."""
+    body = 2 + len(topic.encode()) + len(payload if isinstance(payload, bytes) else payload.encode())
+    if qos:
+        body += 2
+    length_bytes = 1 if body < 128 else 2 if body < 16384 else 3
+    acks = {0: 0, 1: 4, 2: 12}[qos]
+    return 1 + length_bytes + body + acks
+
+
+def _close(a, b) -> bool:
+    if a is None or b is None:
+        return a is b
+    return math.isclose(float(a), float(b), rel_tol=1e-6, abs_tol=1e-4)
+
+
+def verify(cycle: list, decoded: list):
+    by_channel = {d["channel"]: d for d in decoded}
+    for entry in cycle:
+        got = by_channel[entry["channel"]]
+        for field in mqtt_codec.TYPE_FIELDS.get(entry["type"], mqtt_codec.DEFAULT_FIELDS):
+            if not _close(entry.get(field[0]), got.get(field[0])):
+                raise AssertionError(f"{entry['channel']}.{field[0]}: {entry.get(field[0])} != {got.get(field[0])}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Größe/Durchsatz der MQTT-Nutzlast-Modi")
+    parser.add_argument("--cycles", type=int, default=2000, help="Anzahl simulierter Messzyklen")
+    parser.add_argument("--interval", type=float, default=5.0, help="Messintervall in Sekunden (für MB/Tag)")
+    parser.add_argument("--qos", type=int, choices=(0, 1, 2), default=1)
+    args = parser.parse_args()
+
+    random.seed(42)
+    start = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    cycles = [make_cycle(i, start) for i in range(args.cycles)]
+    per_day = 86400.0 / args.interval
+
+    results = []
+    t0 = time.perf_counter()
+    msgs = [channel_messages(c) for c in cycles]
+    elapsed = time.perf_counter() - t0
+    results.append(("channel", msgs, elapsed))
+
+    for encoding in mqtt_codec.ENCODINGS:
+        enc = mqtt_codec.BatchEncoder(DEVICE_ID, LOCATION)
+        topic = f"{PREFIX}/{DEVICE_ID}/batch"
+        t0 = time.perf_counter()
+        msgs = []
+        for c in cycles:
+            enc.update_schema(c)
+            msgs.append([(topic, enc.encode(c, encoding))])
+        elapsed = time.perf_counter() - t0
+        for c, m in zip(cycles[:200], msgs):
+            verify(c, mqtt_codec.decode(m[0][1], enc.schema, encoding))
+        results.append((f"batch/{encoding}", msgs, elapsed))
+        schema_bytes = len(enc.schema_payload())
+
+    base = None
+    print(f"{args.cycles} Zyklen, QoS {args.qos}, Intervall {args.interval:g} s "
+          f"(Schema einmalig {schema_bytes} Bytes, retained)\n")
+    print(f"{'Modus':<14}{'Nachr.':>7}{'Nutzlast':>10}{'Leitung':>10}{'Anteil':>8}{'MB/Tag':>9}{'Zyklen/s':>11}")
+    for name, msgs, elapsed in results:
+        n = len(msgs)
+        payload = sum(len(p if isinstance(p, bytes) else p.encode()) for m in msgs for _, p in m) / n
+        wire = sum(wire_bytes(t, p, args.qos) for m in msgs for t, p in m) / n
+        base = base or wire
+        print(f"{name:<14}{len(msgs[0]):>7}{payload:>10.0f}{wire:>10.0f}{wire / base:>8.0%}"
+              f"{wire * per_day / 1e6:>9.2f}{n / elapsed:>11.0f}")
+    print("\nRücklesen der Batch-Kodierungen: OK")
+
+
+if __name__ == "__main__":
+    main()
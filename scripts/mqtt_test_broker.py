@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+mqtt_test_broker.py – Minimaler MQTT-3.1.1-Broker zum Testen der MQTT-Pufferung.
+
+Nimmt Verbindungen an, bestätigt PUBLISH mit QoS 0/1/2, leitet an Abonnenten
+weiter (Wildcards + und #, Shared Subscriptions $share/<gruppe>/… reihum,
+retained Nachrichten beim Abonnieren) und zählt pro Topic empfangene Nachrichten,
+Duplikate (DUP-Flag bzw. bereits gesehener Zeitstempel) und Zeitstempel
+außer der Reihe. Mit --outage lässt sich
+ein Broker-Ausfall simulieren: nach N Nachrichten werden alle Verbindungen
+getrennt und für S Sekunden keine neuen angenommen. --ack-delay verzögert die
+Bestätigungen, um das In-Flight-Fenster des Loggers zu prüfen.
+
+Beispiel:
+    python3 scripts/mqtt_test_broker.py --port 1884 --outage 200:60 --ack-delay 50
+
+Logger-Konfiguration dazu:
+    MQTT_ENABLED=true, MQTT_HOST=127.0.0.1, MQTT_PORT=1884, MQTT_TLS=false
+"""
+
+import argparse
+import json
+import socketserver
+import struct
+import threading
+import time
+
+_lock = threading.Lock()
+_clients = set()            # offene Handler
+_subscriptions = {}         # handler -> [filter, ...]
+_stats = {"received": 0, "unique": 0, "dup": 0, "out_of_order": 0, "connects": 0}
+_last_ts = {}               # topic -> letzter Zeitstempel im Payload
+_seen = set()               # (topic, zeitstempel) bereits empfangen
+_retained = {}              # topic -> payload
+_share_rr = {}              # (gruppe, filter) -> Zähler für die Reihum-Verteilung
+_outage = {"after": 0, "duration": 0.0, "until": 0.0, "count": 0}
+_options = {"ack_delay": 0.0, "quiet": False}
+
+
+def _topic_matches(flt: str, topic: str) -> bool:
+    f_parts, t_parts = flt.split("/"), topic.split("/")
+    for i, part in enumerate(f_parts):
+        if part == "#":
+            return True
+        if i >= len(t_parts) or (part != "+" and part != t_parts[i]):
+            return False
+    return len(f_parts) == len(t_parts)
+
+
+def _split_share(flt: str) -> tuple:
+    """"$share/g/a/+" → ("g", "a/+"); normale Filter → (None, filter)."""
+    if flt.startswith("$share/"):
+        parts = flt.split("/", 2)
+        if len(parts) == 3:
+            return parts[1], parts[2]
+    return None, flt
+
+
+def _route(topic: str) -> list:
+    """Empfänger: alle normalen Abos plus je Share-Gruppe ein Mitglied (reihum). Aufruf unter _lock."""
+    targets, groups = set(), {}
+    for h, flts in _subscriptions.items():
+        for f in flts:
+            group, flt = _split_share(f)
+            if not _topic_matches(flt, topic):
+                continue
+            if group is None:
+                targets.add(h)
+            else:
+                groups.setdefault((group, flt), []).append(h)
+    for key, members in groups.items():
+        n = _share_rr.get(key, 0)
+        _share_rr[key] = n + 1
+        targets.add(members[n % len(members)])
+    return list(targets)
+
+
+def _encode_length(n: int) -> bytes:
+    out = bytearray()
+    while True:
+        byte, n = n % 128, n // 128
+        out.append(byte | (0x80 if n else 0))
+        if not n:
+            return bytes(out)
+
+
+def _packet(ptype: int, flags: int, body: bytes = b"") -> bytes:
+    return bytes([(ptype << 4) | flags]) + _encode_length(len(body)) + body
+
+
+def _utf8(data: bytes, pos: int) -> tuple:
+    (n,) = struct.unpack_from("!H", data, pos)
+    return data[pos + 2:pos + 2 + n].decode("utf-8", errors="replace"), pos + 2 + n
+
+
+class MqttHandler(socketserver.BaseRequestHandler):
+    def _read_exact(self, n: int) -> bytes:
+        buf = b""
+        while len(buf) < n:
+            chunk = self.request.recv(n - len(buf))
+            if not chunk:
+                raise ConnectionError
+            buf += chunk
+        return buf
+
+    def _read_packet(self) -> tuple:
+        header = self._read_exact(1)[0]
+        length, mult = 0, 1
+        while True:
+            byte = self._read_exact(1)[0]
+            length += (byte & 0x7F) * mult
+            if not byte & 0x80:
+                break
+            mult *= 128
+        return header >> 4, header & 0x0F, self._read_exact(length) if length else b""
+
+    def _send(self, data: bytes):
+        with self._send_lock:
+            self.request.sendall(data)
+
+    def _ack(self, ptype: int, mid: int):
+        if _options["ack_delay"]:
+            time.sleep(_options["ack_delay"])
+        self._send(_packet(ptype, 0x02 if ptype == 6 else 0, struct.pack("!H", mid)))
+
+    def handle(self):
+        self._send_lock = threading.Lock()
+        if time.monotonic() < _outage["until"]:
+            return    # Ausfall: Verbindung sofort schließen
+        try:
+            ptype, _, body = self._read_packet()
+            if ptype != 1:
+                return
+            _, pos = _utf8(body, 0)              # Protokollname
+            client_id, _ = _utf8(body, pos + 4)  # Level, Flags, Keepalive überspringen
+            self._send(_packet(2, 0, b"\x00\x00"))
+            with _lock:
+                _clients.add(self)
+                _stats["connects"] += 1
+            print(f"[broker] verbunden: {client_id or '-'} {self.client_address[0]}", flush=True)
+            while True:
+                ptype, flags, body = self._read_packet()
+                if ptype == 3:
+                    self._on_publish(flags, body)
+                elif ptype == 6:                         # PUBREL → PUBCOMP
+                    self._ack(7, struct.unpack_from("!H", body)[0])
+                elif ptype == 8:
+                    self._on_subscribe(body)
+                elif ptype == 10:                        # UNSUBSCRIBE → UNSUBACK
+                    self._send(_packet(11, 0, body[:2]))
+                elif ptype == 12:                        # PINGREQ → PINGRESP
+                    self._send(_packet(13, 0))
+                elif ptype == 14:                        # DISCONNECT
+                    return
+        except (ConnectionError, OSError, struct.error):
+            pass
+        finally:
+            with _lock:
+                _clients.discard(self)
+                _subscriptions.pop(self, None)
+
+    def _on_publish(self, flags: int, body: bytes):
+        qos, dup, retain = (flags >> 1) & 0x03, bool(flags & 0x08), bool(flags & 0x01)
+        topic, pos = _utf8(body, 0)
+        mid = None
+        if qos:
+            (mid,) = struct.unpack_from("!H", body, pos)
+            pos += 2
+        payload = body[pos:]
+        with _lock:
+            _stats["received"] += 1
+            try:
+                ts = json.loads(payload).get("timestamp")
+            except (ValueError, AttributeError):
+                ts = None
+            if ts and (topic, ts) not in _seen:
+                _seen.add((topic, ts))
+                _stats["unique"] += 1
+                # Reihenfolge nur für neue Nachrichten prüfen (Duplikate sind naturgemäß älter)
+                if ts < _last_ts.get(topic, ""):
+                    _stats["out_of_order"] += 1
+                else:
+                    _last_ts[topic] = ts
+            elif dup or ts:
+                _stats["dup"] += 1
+            if retain:
+                if payload:
+                    _retained[topic] = payload
+                else:
+                    _retained.pop(topic, None)
+            targets = _route(topic)
+        if not _options["quiet"]:
+            text = payload[:120].decode("utf-8", errors="replace")
+            print(f"[broker] {topic} qos={qos}{' dup' if dup else ''} {text}", flush=True)
+        if qos == 1:
+            self._ack(4, mid)
+        elif qos == 2:
+            self._ack(5, mid)
+        for h in targets:
+            h._forward(topic, payload)
+        _check_outage()
+
+    def _forward(self, topic: str, payload: bytes, retain: bool = False):
+        try:
+            self._send(_packet(3, 0x01 if retain else 0,
+                               struct.pack("!H", len(topic.encode())) + topic.encode() + payload))
+        except OSError:
+            pass
+
+    def _on_subscribe(self, body: bytes):
+        (mid,) = struct.unpack_from("!H", body, 0)
+        pos, granted, filters = 2, bytearray(), []
+        while pos < len(body):
+            flt, pos = _utf8(body, pos)
+            filters.append(flt)
+            granted.append(0)    # Weiterleitung immer mit QoS 0
+            pos += 1
+        with _lock:
+            _subscriptions.setdefault(self, []).extend(filters)
+            # Retained nur für normale Abos (wie bei Shared Subscriptions in MQTT 5 üblich)
+            retained = [(t, p) for t, p in _retained.items()
+                        if any(_split_share(f)[0] is None and _topic_matches(f, t) for f in filters)]
+        self._send(_packet(9, 0, struct.pack("!H", mid) + bytes(granted)))
+        for topic, payload in retained:
+            self._forward(topic, payload, retain=True)
+
+
+def _check_outage():
+    """Nach --outage N Nachrichten alle Verbindungen trennen und S Sekunden ablehnen."""
+    with _lock:
+        if not _outage["after"]:
+            return
+        _outage["count"] += 1
+        if _outage["count"] < _outage["after"]:
+            return
+        _outage["count"] = 0
+        _outage["until"] = time.monotonic() + _outage["duration"]
+        victims = list(_clients)
+    print(f"[broker] ✖ simulierter Ausfall für {_outage['duration']:.0f} s", flush=True)
+    for h in victims:
+        try:
+            h.request.shutdown(2)
+        except OSError:
+            pass
+
+
+def _report(interval: float):
+    while True:
+        time.sleep(interval)
+        with _lock:
+            s = dict(_stats)
+        print(f"[broker] empfangen={s['received']} eindeutig={s['unique']} duplikate={s['dup']} "
+              f"außer_reihe={s['out_of_order']} verbindungen={s['connects']}", flush=True)
+
+
+class _ThreadingTCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Minimaler MQTT-Broker für Puffer-/Replay-Tests")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=1884)
+    parser.add_argument("--outage", default="",
+                        help="N:S – nach N Nachrichten Ausfall von S Sekunden (wiederholt)")
+    parser.add_argument("--ack-delay", type=float, default=0.0, help="Verzögerung der Bestätigungen in ms")
+    parser.add_argument("--report", type=float, default=10.0, help="Zählerausgabe alle S Sekunden")
+    parser.add_argument("--quiet", action="store_true", help="Nachrichten nicht einzeln ausgeben")
+    args = parser.parse_args()
+    if args.outage:
+        after, duration = args.outage.split(":", 1)
+        _outage["after"], _outage["duration"] = int(after), float(duration)
+    _options["ack_delay"] = args.ack_delay / 1000.0
+    _options["quiet"] = args.quiet
+
+    server = _ThreadingTCPServer((args.host, args.port), MqttHandler)
+    threading.Thread(target=_report, args=(args.report,), daemon=True).start()
+    print(f"MQTT-Testbroker: {args.host}:{args.port}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
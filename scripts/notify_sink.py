@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+notify_sink.py – Lokaler Empfänger zum Testen der Alarm-Outbox.
+
+Startet einen HTTP-Webhook-Empfänger und einen minimalen SMTP-Server,
+die alle eingehenden Meldungen auf stdout ausgeben. Mit --fail N werden
+die ersten N Zustellungen je Kanal abgelehnt, um Retry/Backoff und
+Dead-Letter-Verhalten zu prüfen.
+
+Beispiel:
+    python3 scripts/notify_sink.py --http-port 8099 --smtp-port 2525 --fail 2
+
+Logger-Konfiguration dazu:
+    NOTIFY_WEBHOOK_EN=true, NOTIFY_WEBHOOK_URL=http://127.0.0.1:8099/hook
+    SMTP_HOST=127.0.0.1, SMTP_PORT=2525, SMTP_TLS=false, SMTP_TO=test@localhost
+"""
+
+import argparse
+import json
+import socketserver
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+_fail_left = {"http": 0, "smtp": 0}
+_lock = threading.Lock()
+
+
+def _should_fail(kind: str) -> bool:
+    with _lock:
+        if _fail_left[kind] > 0:
+            _fail_left[kind] -= 1
+            return True
+    return False
+
+
+class WebhookHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0) or 0))
+        if _should_fail("http"):
+            print(f"[webhook] ✖ abgelehnt (simulierter Ausfall): {self.path}", flush=True)
+            self.send_response(503)
+            self.end_headers()
+            return
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            payload = body.decode(errors="replace")
+        print(f"[webhook] {self.path} auth={self.headers.get('Authorization', '-')}\n"
+              f"{json.dumps(payload, indent=2, ensure_ascii=False)}", flush=True)
+        self.send_response(204)
+        self.end_headers()
+
+    def log_message(self, fmt, *args):
+        pass
+
+
+class SmtpHandler(socketserver.StreamRequestHandler):
+    """Minimaler SMTP-Dialog (EHLO/HELO, MAIL, RCPT, DATA, RSET, NOOP, QUIT) ohne TLS/AUTH."""
+
+    def _reply(self, line: str):
+        self.wfile.write((line + "\r\n").encode())
+
+    def handle(self):
+        self._reply("220 notify-sink ESMTP")
+        mail_from, rcpts = "", []
+        while True:
+            raw = self.rfile.readline()
+            if not raw:
+                return
+            line = raw.decode(errors="replace").rstrip("\r\n")
+            cmd = line[:4].upper()
+            if cmd in ("EHLO", "HELO"):
+                self._reply("250 notify-sink")
+            elif cmd == "MAIL":
+                mail_from, rcpts = line[10:].strip(), []
+                self._reply("250 OK")
+            elif cmd == "RCPT":
+                rcpts.append(line[8:].strip())
+                self._reply("250 OK")
+            elif cmd == "DATA":
+                self._reply("354 End data with <CR><LF>.<CR><LF>")
+                lines = []
+                while True:
+                    data = self.rfile.readline().decode(errors="replace").rstrip("\r\n")
+                    if data == ".":
+                        break
+                    lines.append(data[1:] if data.startswith("..") else data)
+                if _should_fail("smtp"):
+                    print("[smtp] ✖ abgelehnt (simulierter Ausfall)", flush=True)
+                    self._reply("451 Temporary failure")
+                else:
+                    print(f"[smtp] {mail_from} -> {', '.join(rcpts)}\n" + "\n".join(lines), flush=True)
+                    self._reply("250 OK")
+            elif cmd in ("RSET", "NOOP"):
+                self._reply("250 OK")
+            elif cmd == "QUIT":
+                self._reply("221 Bye")
+                return
+            else:
+                self._reply("502 Command not implemented")
+
+
+class _ThreadingTCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Lokaler Webhook-/SMTP-Empfänger für Alarmtests")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--http-port", type=int, default=8099)
+    parser.add_argument("--smtp-port", type=int, default=2525)
+    parser.add_argument("--fail", type=int, default=0,
+                        help="Die ersten N Zustellungen je Kanal ablehnen")
+    args = parser.parse_args()
+    _fail_left["http"] = _fail_left["smtp"] = args.fail
+
+    smtp = _ThreadingTCPServer((args.host, args.smtp_port), SmtpHandler)
+    threading.Thread(target=smtp.serve_forever, daemon=True).start()
+    http = ThreadingHTTPServer((args.host, args.http_port), WebhookHandler)
+    print(f"Webhook: http://{args.host}:{args.http_port}/  SMTP: {args.host}:{args.smtp_port}", flush=True)
+    try:
+        http.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        http.server_close()
+        smtp.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -8,7 +8,7 @@
 # ============================================================
 
 BASE_DIR="/opt/brunnen_web"
-SERVICE="brunnen_web.service brunnen_logger.service brunnen_display.service"
+SERVICE="brunnen_outputs.service brunnen_web.service brunnen_logger.service brunnen_display.service"
 USER="brunnen"
 LOG="$BASE_DIR/logs/update.log"
 
@@ -73,6 +73,7 @@ fi
 SYSTEMD_DIR="/etc/systemd/system"
 UNITS=(
   "brunnen_display.service"
+  "brunnen_outputs.service"
 )
 
 for unit in "${UNITS[@]}"; do
@@ -90,8 +91,14 @@ done
 
 run sudo systemctl daemon-reload
 
-# Unit beim Boot aktivieren (idempotent)
-run sudo systemctl enable brunnen_display.service
+# RAM-Verzeichnis für flüchtigen Zustand (tmpfs, /run/brunnen)
+if [ -f "$BASE_DIR/deploy/tmpfiles/brunnen.conf" ]; then
+  run sudo cp "$BASE_DIR/deploy/tmpfiles/brunnen.conf" /etc/tmpfiles.d/brunnen.conf
+  run sudo systemd-tmpfiles --create /etc/tmpfiles.d/brunnen.conf
+fi
+
+# Units beim Boot aktivieren (idempotent)
+run sudo systemctl enable brunnen_display.service brunnen_outputs.service
 
 # Display-Service neu starten
 run sudo systemctl restart brunnen_display.service
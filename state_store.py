@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+state_store.py – Flüchtiger Zustand im RAM (tmpfs), gebündelt auf die SD-Karte.
+
+- Flüchtige Dateien (latest_measurement.json, logger_stats.json) liegen nur
+  im State-Verzeichnis (Standard /run/brunnen, tmpfs; überschreibbar mit
+  BRUNNEN_STATE_DIR). Ist es nicht beschreibbar, wird data/ verwendet.
+- PersistentState hält ein JSON-Dokument (z.B. reed_counts.json) aktuell im
+  tmpfs und schreibt es höchstens alle `interval_s` nach data/ – innerhalb
+  eines Schreibbudgets (Bytes pro Stunde, Token-Bucket). Bei SIGTERM und
+  Programmende wird alles Ausstehende sofort geschrieben.
+- Jeder Flash-Schreibvorgang wird gezählt (flash_stats()), dazu liefert
+  process_write_bytes() die tatsächlich vom Prozess geschriebenen Bytes
+  (/proc/self/io) – damit lässt sich das Budget im Betrieb überprüfen.
+"""
+
+import atexit
+import json
+import logging
+import os
+import signal
+import threading
+import time
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = os.path.join(BASE_DIR, "data")
+STATE_DIR = os.environ.get("BRUNNEN_STATE_DIR", "/run/brunnen")
+
+DEFAULT_BUDGET_BYTES_H = 512 * 1024
+DEFAULT_INTERVAL_S = 300.0
+FLUSH_CHECK_S = 10.0
+
+_state_dir = None
+_lock = threading.Lock()
+_documents = []
+_flusher = None
+_budget = None
+_stats = {"flash_writes": 0, "flash_bytes": 0, "flash_deferred": 0}
+
+
+# ============================================================
+# 📁 VERZEICHNIS
+# ============================================================
+def state_dir() -> str:
+    """tmpfs-Verzeichnis (einmal ermittelt); Fallback data/."""
+    global _state_dir
+    if _state_dir is None:
+        try:
+            os.makedirs(STATE_DIR, exist_ok=True)
+            probe = os.path.join(STATE_DIR, f".probe_{os.getpid()}")
+            with open(probe, "w") as f:
+                f.write("")
+            os.remove(probe)
+            _state_dir = STATE_DIR
+        except OSError as e:
+            logging.warning(f"State-Verzeichnis {STATE_DIR} nicht nutzbar ({e}) – verwende {DATA_DIR}")
+            os.makedirs(DATA_DIR, exist_ok=True)
+            _state_dir = DATA_DIR
+    return _state_dir
+
+
+def volatile_path(name: str) -> str:
+    return os.path.join(state_dir(), name)
+
+
+def _write_atomic(path: str, payload: bytes):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(payload)
+    os.replace(tmp, path)
+
+
+def write_volatile(name: str, data, indent=None):
+    """Schreibt JSON atomar ins tmpfs (keine SD-Karten-Schreibzugriffe)."""
+    _write_atomic(volatile_path(name), json.dumps(data, indent=indent).encode())
+
+
+def read_json(name: str, flash_path: str = None, default=None):
+    """Liest die neuere Fassung aus tmpfs bzw. flash_path."""
+    candidates = [volatile_path(name)] + ([flash_path] if flash_path else [])
+    best, best_mtime = None, -1.0
+    for path in candidates:
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            continue
+        if mtime > best_mtime:
+            best, best_mtime = path, mtime
+    if best is None:
+        return default
+    try:
+        with open(best) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return default
+
+
+# ============================================================
+# 💾 GEBÜNDELTES PERSISTIEREN
+# ============================================================
+class WriteBudget:
+    """Token-Bucket über Bytes pro Stunde (Burst = eine Stunde Budget)."""
+
+    def __init__(self, bytes_per_hour: int):
+        self.rate = max(1, int(bytes_per_hour)) / 3600.0
+        self.capacity = max(1, int(bytes_per_hour))
+        self.tokens = float(self.capacity)
+        self._ts = time.monotonic()
+
+    def set_rate(self, bytes_per_hour: int):
+        self.rate = max(1, int(bytes_per_hour)) / 3600.0
+        self.capacity = max(1, int(bytes_per_hour))
+        self.tokens = min(self.tokens, self.capacity)
+
+    def take(self, n: int) -> bool:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._ts) * self.rate)
+        self._ts = now
+        if n > self.tokens:
+            return False
+        self.tokens -= n
+        return True
+
+
+class PersistentState:
+    def __init__(self, name: str, flash_path: str, interval_s: float = DEFAULT_INTERVAL_S):
+        self.name = name
+        self.flash_path = flash_path
+        self.interval_s = interval_s
+        self._payload = None
+        self._dirty = False
+        self._last_flash = time.monotonic()
+        self._doc_lock = threading.Lock()
+        with _lock:
+            _documents.append(self)
+
+    def load(self, default=None):
+        """Neuere Fassung aus tmpfs (Dienst-Neustart) oder Flash (nach Reboot)."""
+        return read_json(self.name, self.flash_path, default)
+
+    def update(self, data):
+        """Sofort ins tmpfs, Flash folgt gebündelt."""
+        payload = json.dumps(data).encode()
+        with self._doc_lock:
+            if payload == self._payload:
+                return
+            _write_atomic(volatile_path(self.name), payload)
+            self._payload = payload
+            self._dirty = True
+
+    def flush(self, force: bool = False) -> bool:
+        with self._doc_lock:
+            if not self._dirty or self._payload is None:
+                return False
+            if not force and time.monotonic() - self._last_flash < self.interval_s:
+                return False
+            size = len(self._payload)
+            if not force and not _get_budget().take(size):
+                _stats["flash_deferred"] += 1
+                return False
+            try:
+                _write_atomic(self.flash_path, self._payload)
+            except OSError as e:
+                logging.warning(f"State: {self.flash_path} nicht schreibbar: {e}")
+                return False
+            self._dirty = False
+            self._last_flash = time.monotonic()
+        _stats["flash_writes"] += 1
+        _stats["flash_bytes"] += size
+        return True
+
+
+def _get_budget() -> WriteBudget:
+    global _budget
+    if _budget is None:
+        _budget = WriteBudget(DEFAULT_BUDGET_BYTES_H)
+    return _budget
+
+
+def configure(budget_bytes_per_hour: int = None, interval_s: float = None):
+    """Budget und Intervall zur Laufzeit ändern (z.B. nach Config-Reload)."""
+    if budget_bytes_per_hour:
+        _get_budget().set_rate(budget_bytes_per_hour)
+    if interval_s:
+        with _lock:
+            for doc in _documents:
+                doc.interval_s = float(interval_s)
+
+
+def flush_all(force: bool = False):
+    with _lock:
+        docs = list(_documents)
+    for doc in docs:
+        try:
+            doc.flush(force)
+        except Exception as e:
+            logging.warning(f"State: Flush von {doc.name} fehlgeschlagen: {e}")
+
+
+def _flush_loop():
+    while True:
+        time.sleep(FLUSH_CHECK_S)
+        flush_all()
+
+
+def start():
+    """Hintergrund-Flusher starten und Flush bei SIGTERM/Programmende einrichten."""
+    global _flusher
+    if _flusher:
+        return
+    _flusher = threading.Thread(target=_flush_loop, daemon=True, name="state-flush")
+    _flusher.start()
+    atexit.register(flush_all, True)
+
+    previous = signal.getsignal(signal.SIGTERM)
+
+    def _on_sigterm(signum, frame):
+        flush_all(force=True)
+        if callable(previous):
+            previous(signum, frame)
+        else:
+            raise SystemExit(0)
+
+    try:
+        signal.signal(signal.SIGTERM, _on_sigterm)
+    except ValueError:
+        pass    # nicht im Hauptthread – atexit genügt
+
+
+# ============================================================
+# 📊 MESSUNG
+# ============================================================
+def flash_stats() -> dict:
+    return dict(_stats)
+
+
+def process_write_bytes():
+    """Vom Prozess tatsächlich auf Blockgeräte geschriebene Bytes (Linux, sonst None)."""
+    try:
+        with open("/proc/self/io") as f:
+            for line in f:
+                if line.startswith("write_bytes:"):
+                    return int(line.split()[1])
+    except (OSError, ValueError):
+        pass
+    return None
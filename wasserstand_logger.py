@@ -10,6 +10,18 @@ import logging
 import board
 import reed_contact
 import alarm as alarm_module
+import alarm_store as alarm_store_module
+import outbox as outbox_module
+import output_events
+import output_client
+import interlock as interlock_module
+import cycle_stats
+import log_pipeline
+import state_store
+import queue_retention
+import backlog_drain
+import mqtt_buffer as mqtt_buffer_module
+import mqtt_codec
 import busio
 import ssl as _ssl
 
@@ -41,6 +53,8 @@ LOG_LEVELS = {
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 CONFIG_PATH = os.path.join(BASE_DIR, "config", "config.json")
 DB_PATH = os.path.join(BASE_DIR, "data", "offline_cache.db")
+ALARM_RULES_PATH = os.path.join(BASE_DIR, "config", "alarm_rules.json")
+INTERLOCKS_PATH = os.path.join(BASE_DIR, "config", "interlocks.json")
 LOGFILE = os.path.join(BASE_DIR, "logs", "wasserstand.log")
 
 DEFAULT_CONFIG = {
@@ -67,10 +81,28 @@ DEFAULT_CONFIG = {
     "MQTT_TLS_CA_CERT": "",
     "MQTT_TOPIC_PREFIX": "brunnen",
     "MQTT_QOS": 1,
+    "MQTT_MAX_INFLIGHT": 20,          # gleichzeitig unbestätigte Nachrichten (paho)
+    "MQTT_REPLAY_MSGS_PER_S": 50,     # Nachsenden nach Broker-Ausfall
+    "MQTT_BUFFER_MAX_CYCLES": 17280,  # Puffer-Obergrenze in Messzyklen (1 Tag bei 5 s)
+    "MQTT_PAYLOAD_MODE": "channel",   # channel / batch / both (siehe mqtt_codec.py)
+    "MQTT_BATCH_ENCODING": "json",    # json / zlib / struct
     "LOG_LEVEL": "ERROR",
     "BMP280_ENABLED": True,
     "BMP280_ADDRESS": 0x76,
     "NAME_BMP280": "Barometer",
+    # SD-Karte schonen: gebündeltes Persistieren aus dem tmpfs
+    "FLASH_WRITE_BUDGET_KB_H": 512,
+    "STATE_PERSIST_INTERVAL_S": 300,
+    # Offline-Queue begrenzen (0 = keine Grenze), alte Daten verdichten statt verwerfen
+    "QUEUE_MAX_ROWS": 1000000,
+    "QUEUE_MAX_MB": 256,
+    "QUEUE_MAX_AGE_DAYS": 60,
+    "QUEUE_DOWNSAMPLE": True,
+    "QUEUE_DOWNSAMPLE_AFTER_H": 24,
+    "QUEUE_DOWNSAMPLE_INTERVAL_S": 300,
+    # Nachsenden des Rückstands (Hintergrund): Punkte/s-Grenze und Ziel-Schreiblatenz
+    "INFLUX_BACKLOG_MAX_PPS": 2000,
+    "INFLUX_BACKLOG_TARGET_LATENCY_S": 2.0,
 }
 
 # Kanal-spezifische Defaults generieren
@@ -110,19 +142,13 @@ DEFAULT_CONFIG.setdefault("INITIAL_WASSERTIEFE_A3", 15.0)
 DEFAULT_CONFIG.setdefault("MESSWERT_NN_A3", 0.0)
 DEFAULT_CONFIG.setdefault("SHUNT_OHMS_A3", 150.0)
 
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s [%(levelname)s] %(message)s",
-    handlers=[logging.FileHandler(LOGFILE), logging.StreamHandler()]
-)
+# Asynchron: Messschleife legt nur in eine Queue, ein Thread schreibt gepuffert + rotiert
+log_pipeline.setup(LOGFILE, logging.INFO)
 
 
 def apply_logging_level(level_name: str):
     level = LOG_LEVELS.get(str(level_name).upper(), logging.ERROR)
-    root_logger = logging.getLogger()
-    root_logger.setLevel(level)
-    for handler in root_logger.handlers:
-        handler.setLevel(level)
+    log_pipeline.set_level(level)
     return level
 
 # ============================================================
@@ -163,9 +189,53 @@ def load_config():
     return cfg
 
 
+def load_alarm_rules() -> list:
+    """Lädt optionale Ausdrucks-Alarmregeln aus config/alarm_rules.json."""
+    if not os.path.exists(ALARM_RULES_PATH):
+        return []
+    try:
+        with open(ALARM_RULES_PATH, "r") as f:
+            rules = json.load(f)
+        return rules if isinstance(rules, list) else []
+    except Exception as e:
+        logging.error(f"Alarmregeln konnten nicht gelesen werden: {e}")
+        return []
+
+
+def load_interlocks() -> list:
+    """Lädt optionale Ausgangs-Verriegelungen aus config/interlocks.json."""
+    if not os.path.exists(INTERLOCKS_PATH):
+        return []
+    try:
+        with open(INTERLOCKS_PATH, "r") as f:
+            rules = json.load(f)
+        return rules if isinstance(rules, list) else []
+    except Exception as e:
+        logging.error(f"Verriegelungen konnten nicht gelesen werden: {e}")
+        return []
+
+
+def _file_mtime(path: str) -> float:
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return 0.0
+
+
 config = load_config()
 apply_logging_level(config.get("LOG_LEVEL", "ERROR"))
 last_config_mtime = os.path.getmtime(CONFIG_PATH)
+last_alarm_rules_mtime = _file_mtime(ALARM_RULES_PATH)
+last_interlocks_mtime = _file_mtime(INTERLOCKS_PATH)
+
+# Flüchtiger Zustand im tmpfs, Flash-Schreibbudget aus der Config
+state_store.configure(int(config.get("FLASH_WRITE_BUDGET_KB_H", 512)) * 1024,
+                      float(config.get("STATE_PERSIST_INTERVAL_S", 300)))
+state_store.start()
+
+# Alarmregeln einmalig kompilieren (erneut nur bei Config-Reload)
+alarm_engine = alarm_module.AlarmEngine(alarm_module.compile_rules(config, load_alarm_rules()))
+interlock_engine = interlock_module.InterlockEngine(interlock_module.compile_interlocks(load_interlocks()))
 
 # Geräteidentifikation
 DEVICE_ID        = config.get("DEVICE_ID", socket.gethostname())
@@ -188,12 +258,14 @@ INFLUX_BUCKET    = config.get("INFLUX_BUCKET", "")
 _mqtt_client    = None
 _mqtt_connected = False
 _mqtt_cfg_key   = None   # Tuple zum Erkennen von Config-Änderungen
+# Batch-Modus: Schema (retained) + eine kompakte Nachricht pro Zyklus
+mqtt_encoder = mqtt_codec.BatchEncoder(config.get("DEVICE_ID", socket.gethostname()), config.get("LOCATION", ""))
 
 # ============================================================
 # 🔁 KONFIG NEU LADEN BEI ÄNDERUNG
 # ============================================================
 def reload_config_if_changed():
-    global config, last_config_mtime
+    global config, last_config_mtime, last_alarm_rules_mtime, last_interlocks_mtime
     global DEVICE_ID, LOCATION
     global STARTABSTICH, INITIAL_WASSERTIEFE, SHUNT_OHMS
     global WERT_4mA, WERT_20mA, MESSWERT_NN, MESSINTERVAL
@@ -202,7 +274,10 @@ def reload_config_if_changed():
 
     try:
         current_mtime = os.path.getmtime(CONFIG_PATH)
-        if current_mtime != last_config_mtime:
+        rules_mtime = _file_mtime(ALARM_RULES_PATH)
+        interlocks_mtime = _file_mtime(INTERLOCKS_PATH)
+        if (current_mtime != last_config_mtime or rules_mtime != last_alarm_rules_mtime
+                or interlocks_mtime != last_interlocks_mtime):
             logging.info("🔄 Neue Konfiguration erkannt — lade neu...")
             config = load_config()
             DEVICE_ID          = config.get("DEVICE_ID", DEVICE_ID)
@@ -219,8 +294,18 @@ def reload_config_if_changed():
             INFLUX_ORG         = config.get("INFLUX_ORG", INFLUX_ORG)
             INFLUX_BUCKET      = config.get("INFLUX_BUCKET", INFLUX_BUCKET)
             last_config_mtime  = current_mtime
+            last_alarm_rules_mtime = rules_mtime
+            last_interlocks_mtime = interlocks_mtime
             apply_logging_level(config.get("LOG_LEVEL", "ERROR"))
+            state_store.configure(int(config.get("FLASH_WRITE_BUDGET_KB_H", 512)) * 1024,
+                                  float(config.get("STATE_PERSIST_INTERVAL_S", 300)))
+            alarm_engine.replace_rules(alarm_module.compile_rules(config, load_alarm_rules()))
+            alarm_store.clear_missing(r.key for r in alarm_engine.rules)
+            for rule in interlock_engine.replace_rules(
+                    interlock_module.compile_interlocks(load_interlocks())):
+                _release_interlock(rule)   # entfernte, noch aktive Verriegelung freigeben
             setup_bmp280(config)
+            mqtt_encoder.reset(config.get("DEVICE_ID", socket.gethostname()), config.get("LOCATION", ""))
 
             # MQTT-Client neu verbinden wenn sich MQTT-Config geändert hat
             new_mqtt_key = _get_mqtt_cfg_key(config)
@@ -233,6 +318,76 @@ def reload_config_if_changed():
     except Exception as e:
         logging.error(f"Fehler beim Neuladen der Config: {e}")
 
+# ============================================================
+# 🔒 VERRIEGELUNGEN (Ausgänge über den Ausgangsdienst)
+# ============================================================
+_INTERLOCK_TIMEOUT_S = 1.0    # Zyklus nie länger als nötig blockieren
+_interlock_service_ok = True
+_interlocks_adopted = False   # Sperren des Ausgangsdienstes nach dem Start übernommen?
+
+
+def _interlock_call(fn, *args, **kwargs) -> bool:
+    global _interlock_service_ok
+    try:
+        fn(*args, timeout=_INTERLOCK_TIMEOUT_S, **kwargs)
+    except output_client.OutputServiceError as e:
+        if _interlock_service_ok:
+            logging.error(f"❌ Verriegelung: Ausgangsdienst nicht erreichbar: {e}")
+        _interlock_service_ok = False
+        return False
+    if not _interlock_service_ok:
+        logging.info("✅ Verriegelung: Ausgangsdienst wieder erreichbar")
+    _interlock_service_ok = True
+    return True
+
+
+def _release_interlock(rule):
+    restore = (not rule.state) if rule.restore else None
+    _interlock_call(output_client.unlock, rule.output, rule.lock_key, restore=restore)
+
+
+def _adopt_interlocks() -> bool:
+    """
+    Übernimmt nach dem Start die im Ausgangsdienst noch gehaltenen Sperren:
+    bekannte Regeln gelten als aktiv (die Freigabe wird später gesendet),
+    Sperren entfernter Regeln werden aufgehoben. Der Ausgangsdienst kennt
+    keine Ablaufzeit – ohne Abgleich blieben sie sonst für immer bestehen.
+    """
+    global _interlock_service_ok
+    try:
+        held = output_client.get_lock_keys(timeout=_INTERLOCK_TIMEOUT_S)
+    except output_client.OutputServiceError as e:
+        if _interlock_service_ok:
+            logging.error(f"❌ Verriegelung: Ausgangsdienst nicht erreichbar: {e}")
+        _interlock_service_ok = False
+        return False
+    for output, lock_key in interlock_engine.adopt(held):
+        logging.warning(f"🔓 Verwaiste Verriegelung {lock_key} an Ausgang {output + 1} aufgehoben")
+        _interlock_call(output_client.unlock, output, lock_key)
+    for rule in interlock_engine.active():
+        logging.info(f"🔒 Verriegelung übernommen: {rule.describe()}")
+    return True
+
+
+def apply_interlocks(values: dict):
+    """
+    Wertet die Verriegelungen direkt nach dem ADC-Scan aus. Aktive Verriegelungen
+    werden jeden Zyklus bestätigt (idempotent) – so greifen sie auch nach einem
+    Neustart des Ausgangsdienstes sofort wieder.
+    """
+    global _interlocks_adopted
+    if not _interlocks_adopted:
+        _interlocks_adopted = _adopt_interlocks()
+    for rule, event in interlock_engine.evaluate(values):
+        if event == "engaged":
+            logging.warning(f"🔒 Verriegelung aktiv: {rule.describe()} – Wert {rule.last_value:.3f}")
+        else:
+            logging.warning(f"🔓 Verriegelung aufgehoben: {rule.name} – Wert {rule.last_value:.3f}")
+            _release_interlock(rule)
+    for rule in interlock_engine.active():
+        _interlock_call(output_client.lock, rule.output, rule.state, rule.lock_key, rule.name)
+
+
 # ============================================================
 # 📡 MQTT FUNKTIONEN
 # ============================================================
@@ -273,12 +428,17 @@ def setup_mqtt_client(cfg: dict):
     host      = cfg.get("MQTT_HOST", "").strip()
     port      = int(cfg.get("MQTT_PORT", 1883))
     status_topic = f"{prefix}/{device_id}/status"
+    schema_topic = f"{prefix}/{device_id}/batch/schema"
 
     if not host:
         logging.warning("⚠️  MQTT_HOST nicht konfiguriert – MQTT deaktiviert.")
         return
 
-    client = _mqtt.Client(client_id=device_id, clean_session=True)
+    if hasattr(_mqtt, "CallbackAPIVersion"):    # paho-mqtt >= 2.0
+        client = _mqtt.Client(_mqtt.CallbackAPIVersion.VERSION1, client_id=device_id, clean_session=True)
+    else:
+        client = _mqtt.Client(client_id=device_id, clean_session=True)
+    client.max_inflight_messages_set(max(1, int(cfg.get("MQTT_MAX_INFLIGHT", 20))))
 
     # Last Will & Testament – Broker publisht "offline" wenn Verbindung abbricht
     client.will_set(status_topic, payload="offline", qos=1, retain=True)
@@ -297,6 +457,8 @@ def setup_mqtt_client(cfg: dict):
         if rc == 0:
             _mqtt_connected = True
             c.publish(status_topic, payload="online", qos=1, retain=True)
+            if mqtt_encoder.schema:   # retained Schema erneuern (Broker evtl. ohne Persistenz)
+                c.publish(schema_topic, payload=mqtt_encoder.schema_payload(), qos=1, retain=True)
             logging.info(f"✅ MQTT verbunden: {host}:{port}")
         else:
             _mqtt_connected = False
@@ -308,29 +470,50 @@ def setup_mqtt_client(cfg: dict):
         if rc != 0:
             logging.warning(f"⚠️  MQTT Verbindung getrennt (rc={rc}) – reconnect läuft…")
 
+    def _on_publish(c, userdata, mid):
+        mqtt_buffer.on_publish(mid)
+
     client.on_connect    = _on_connect
     client.on_disconnect = _on_disconnect
+    client.on_publish    = _on_publish
     client.reconnect_delay_set(min_delay=5, max_delay=60)
 
     try:
-        client.connect(host, port, keepalive=60)
+        # connect_async: ist der Broker beim Start nicht erreichbar, versucht es
+        # der paho-Thread weiter – die Messwerte landen solange im MQTT-Puffer
+        client.connect_async(host, port, keepalive=60)
         client.loop_start()   # Hintergrund-Thread für MQTT-Keepalive + Reconnect
         _mqtt_client  = client
         _mqtt_cfg_key = _get_mqtt_cfg_key(cfg)
+        mqtt_buffer.attach()
     except Exception as e:
         logging.error(f"❌ MQTT Verbindungsaufbau fehlgeschlagen: {e}")
         _mqtt_client = None
 
 
-def publish_to_mqtt(cfg: dict, all_data: list):
-    """Publisht alle Messwerte eines Zyklus an den MQTT-Broker."""
-    global _mqtt_client, _mqtt_connected
-    if not _mqtt_client or not _mqtt_connected:
-        return
-
+def build_mqtt_messages(cfg: dict, all_data: list) -> list:
+    """
+    [(topic, payload[, retain])] für einen Zyklus – je nach MQTT_PAYLOAD_MODE
+    eine JSON-Nachricht pro Kanal, eine Batch-Nachricht oder beides.
+    """
+    messages = []
     device_id = cfg.get("DEVICE_ID", socket.gethostname())
     prefix    = cfg.get("MQTT_TOPIC_PREFIX", "brunnen").rstrip("/")
-    qos       = int(cfg.get("MQTT_QOS", 1))
+    mode      = str(cfg.get("MQTT_PAYLOAD_MODE", "channel")).lower()
+    if mode not in mqtt_codec.MODES:
+        mode = "channel"
+
+    if mode in ("batch", "both") and all_data:
+        encoding = str(cfg.get("MQTT_BATCH_ENCODING", "json")).lower()
+        if encoding not in mqtt_codec.ENCODINGS:
+            encoding = "json"
+        batch_topic = f"{prefix}/{device_id}/batch"
+        if mqtt_encoder.update_schema(all_data):
+            # Im Puffer vor dem Batch – beim Nachsenden kommt das Schema in Reihenfolge an
+            messages.append((f"{batch_topic}/schema", mqtt_encoder.schema_payload(), True))
+        messages.append((batch_topic, mqtt_encoder.encode(all_data, encoding)))
+    if mode == "batch":
+        return messages
 
     for entry in all_data:
         channel = entry.get("channel", "unknown")
@@ -352,6 +535,7 @@ def publish_to_mqtt(cfg: dict, all_data: list):
         sensor_type = entry.get("type", "")
         if sensor_type == "LEVEL":
             payload["level_m"]      = entry.get("level_m")
+            payload["wasser_oberflaeche_m"] = entry.get("wasser_oberflaeche_m")
             payload["messwert_NN"]  = entry.get("messwert_NN")
             payload["pegel_diff"]   = entry.get("pegel_diff")
         elif sensor_type == "PRESSURE":
@@ -359,10 +543,49 @@ def publish_to_mqtt(cfg: dict, all_data: list):
         elif sensor_type == "COUNTER":
             payload["impulse_total"] = entry.get("impulse_total")
 
-        try:
-            _mqtt_client.publish(topic, json.dumps(payload), qos=qos)
-        except Exception as e:
-            logging.warning(f"⚠️  MQTT Publish Fehler ({topic}): {e}")
+        messages.append((topic, json.dumps(payload)))
+    return messages
+
+
+def publish_to_mqtt(cfg: dict, all_data: list):
+    """
+    Hängt den Zyklus an den MQTT-Puffer an und veröffentlicht – bei Verbindung –
+    alles ab dem Cursor in Reihenfolge (nach einem Ausfall gebremst).
+    """
+    try:
+        mqtt_buffer.pump(
+            _mqtt_client, _mqtt_connected, build_mqtt_messages(cfg, all_data),
+            qos=int(cfg.get("MQTT_QOS", 1)),
+            replay_per_s=float(cfg.get("MQTT_REPLAY_MSGS_PER_S", 50)),
+            max_inflight=int(cfg.get("MQTT_MAX_INFLIGHT", 20)),
+        )
+    except sqlite3.Error as e:
+        logging.error(f"❌ MQTT-Puffer nicht beschreibbar: {e}")
+        stats.incr("mqtt_failed")
+    except Exception as e:
+        logging.warning(f"⚠️  MQTT Publish Fehler: {e}")
+        stats.incr("mqtt_failed")
+
+
+def deliver_mqtt_alarm(cfg: dict, message: dict) -> tuple:
+    """Outbox-Kanal "mqtt": Alarm auf {prefix}/{device_id}/alarm publishen (QoS 1)."""
+    client = _mqtt_client
+    if not client or not _mqtt_connected:
+        return False, "MQTT nicht verbunden"
+    device_id = cfg.get("DEVICE_ID", socket.gethostname())
+    prefix    = cfg.get("MQTT_TOPIC_PREFIX", "brunnen").rstrip("/")
+    payload = {
+        "device_id": device_id,
+        "location":  cfg.get("LOCATION", ""),
+        "subject":   message["subject"],
+        "body":      message["body"],
+        **message.get("meta", {}),
+    }
+    info = client.publish(f"{prefix}/{device_id}/alarm", json.dumps(payload), qos=1)
+    info.wait_for_publish(timeout=10)
+    if not info.is_published():
+        return False, "Keine Bestätigung vom Broker (Timeout)"
+    return True, ""
 
 
 # ============================================================
@@ -372,6 +595,16 @@ os.makedirs(os.path.join(BASE_DIR, "data"), exist_ok=True)
 conn = sqlite3.connect(DB_PATH, check_same_thread=False)
 cur = conn.cursor()
 
+# auto_vacuum=INCREMENTAL (vor dem Anlegen der Tabellen; bestehende DB wird später umgestellt)
+_auto_vacuum_ok = queue_retention.ensure_incremental_vacuum(conn)
+
+# WAL + synchronous=NORMAL: ein fsync pro Checkpoint statt pro Commit
+cur.execute("PRAGMA journal_mode=WAL")
+cur.execute("PRAGMA synchronous=NORMAL")
+
+# Laufzeit- und Zählerstatistik pro Zyklus (→ logger_stats.json im tmpfs)
+stats = cycle_stats.CycleStats(state_store.volatile_path("logger_stats.json"))
+
 # Neu: robuste Offline-Queue
 cur.execute("""
 CREATE TABLE IF NOT EXISTS offline_queue (
@@ -380,6 +613,27 @@ CREATE TABLE IF NOT EXISTS offline_queue (
 )
 """)
 conn.commit()
+# Verdichtete Altdaten (queue_retention.py), werden vor offline_queue gesendet
+queue_retention.ensure_schema(conn)
+
+# Persistenter Alarmzustand (überlebt Neustarts, Cooldown bleibt erhalten)
+alarm_store = alarm_store_module.AlarmStore(DB_PATH)
+alarm_store.restore_rules(alarm_engine.rules)
+alarm_store.clear_missing(r.key for r in alarm_engine.rules)
+
+# MQTT-Puffer mit eigenem Cursor: Zyklen überstehen Broker-Ausfälle und Neustarts
+mqtt_buffer = mqtt_buffer_module.MqttBuffer(
+    DB_PATH, stats=stats, max_cycles=int(config.get("MQTT_BUFFER_MAX_CYCLES", 17280)))
+
+# Dauerhafte Benachrichtigungs-Outbox: eigene Parallelität und Backoff pro Kanal
+notification_outbox = outbox_module.Outbox(DB_PATH)
+notification_outbox.register_channel("email", alarm_module.deliver_email,
+                                     concurrency=1, max_attempts=10, backoff_s=60)
+notification_outbox.register_channel("webhook", alarm_module.deliver_webhook,
+                                     concurrency=2, max_attempts=20, backoff_s=30)
+notification_outbox.register_channel("mqtt", deliver_mqtt_alarm,
+                                     concurrency=1, max_attempts=50, backoff_s=15, backoff_max_s=600)
+notification_outbox.start(lambda: config)
 
 # ============================================================
 # 🧠 SENSOR SETUP (mehrere Kanäle)
@@ -481,26 +735,28 @@ reed_contact.init(REED_COUNT_FILE)
 # ============================================================
 # 📨 OFFLINE-QUEUE HELFER
 # ============================================================
-def queue_insert(entry: dict):
-    cur.execute("INSERT INTO offline_queue (payload) VALUES (?)", (json.dumps(entry),))
-    conn.commit()
+_pending_inserts = []
 
-def queue_fetch_batch(limit=500):
-    rows = cur.execute(
-        "SELECT id, payload FROM offline_queue ORDER BY id ASC LIMIT ?",
-        (limit,)
-    ).fetchall()
-    ids, items = [], []
-    for rid, payload in rows:
-        try:
-            items.append(json.loads(payload))
-            ids.append(rid)
-        except Exception as e:
-            logging.warning(f"Korrumpierter Queue-Eintrag id={rid} wird gelöscht: {e}")
-            cur.execute("DELETE FROM offline_queue WHERE id=?", (rid,))
-    if rows:
+
+def queue_insert(entry: dict):
+    """Merkt den Punkt vor; queue_commit() schreibt alle eines Zyklus in einer Transaktion."""
+    _pending_inserts.append(entry)
+    stats.incr("points_queued")
+
+
+def queue_commit() -> list:
+    """Schreibt die Punkte des Zyklus (eine Transaktion) und gibt [(id, entry)] zurück."""
+    if not _pending_inserts:
+        return []
+    rows = []
+    with stats.stage("queue_insert"):
+        for entry in _pending_inserts:
+            cur.execute("INSERT INTO offline_queue (payload) VALUES (?)", (json.dumps(entry),))
+            rows.append((cur.lastrowid, entry))
         conn.commit()
-    return ids, items
+    _pending_inserts.clear()
+    return rows
+
 
 def queue_delete_ids(ids):
     if not ids:
@@ -509,6 +765,40 @@ def queue_delete_ids(ids):
     cur.execute(q, ids)
     conn.commit()
 
+
+RETENTION_INTERVAL_S = 60.0
+_retention_last = 0.0
+
+
+def queue_maintenance(cfg: dict):
+    """Alte Daten verdichten (pro Zyklus ein Block), Grenzen und auto_vacuum minütlich prüfen."""
+    global _retention_last, _auto_vacuum_ok
+    policy = queue_retention.RetentionPolicy(cfg)
+    try:
+        # Verdichten nur, solange nichts abfließt, und nie während ein Block unterwegs ist
+        # (queue_lock) – sonst würden dieselben Zeilen doppelt gesendet
+        n_in = n_out = 0
+        if not backlog.uplink_ok and backlog.queue_lock.acquire(blocking=False):
+            try:
+                n_in, n_out = queue_retention.downsample_step(conn, policy)
+            finally:
+                backlog.queue_lock.release()
+        if n_in:
+            stats.incr("points_downsampled", n_in)
+            stats.incr("downsampled_written", n_out)
+            logging.info(f"📉 Offline-Queue: {n_in} alte Einträge zu {n_out} verdichtet")
+        if time.monotonic() - _retention_last < RETENTION_INTERVAL_S:
+            return
+        _retention_last = time.monotonic()
+        for reason, n in queue_retention.enforce_limits(conn, policy).items():
+            if n:
+                stats.incr(f"retention_dropped_{reason}", n)
+                logging.warning(f"✂️ Offline-Queue: {n} älteste Einträge verworfen (Grenze: {reason})")
+        if not _auto_vacuum_ok:
+            _auto_vacuum_ok = queue_retention.ensure_incremental_vacuum(conn)
+    except sqlite3.Error as e:
+        logging.error(f"❌ Queue-Pflege fehlgeschlagen: {e}")
+
 # ============================================================
 # 📤 INFLUX HELPERS
 # ============================================================
@@ -534,6 +824,11 @@ def send_to_influx(data_list):
             for entry in data_list:
                 try:
                     sensor_type = str(entry.get("type", "LEVEL")).upper()
+                    if sensor_type == "OUTPUT":
+                        # Vom Ausgangsdienst gepufferte Schaltereignisse (digital_output)
+                        points.append(output_events.to_point(
+                            entry, cfg.get("DEVICE_ID", DEVICE_ID), cfg.get("LOCATION", LOCATION)))
+                        continue
                     unit        = entry.get("unit", "")
                     sensor_name = cfg.get(f"NAME_{entry.get('channel','A0')}", entry.get("name", entry.get("channel","A0")))
                     # Fallback: wenn "value" None ist, Level-Messwert verwenden
@@ -544,6 +839,7 @@ def send_to_influx(data_list):
                         value = float(value_raw)
                     except Exception:
                         logging.warning(f"⚠️ Überspringe Punkt {entry.get('channel')}: kein numerischer Wert ({value_raw})")
+                        stats.incr("points_dropped")
                         continue
 
                     measurement = "barometer" if sensor_type == "PRESSURE" else "wasserstand"
@@ -601,34 +897,52 @@ def send_to_influx(data_list):
 
                 except Exception as e:
                     logging.error(f"❌ Punktfehler ({entry.get('channel')}): {e}")
+                    stats.incr("points_dropped")
 
             if not points:
-                return False
+                return True    # nichts Sendbares (alle verworfen und gezählt) – Einträge gelten als erledigt
 
             write_api.write(bucket=influx_bucket, org=influx_org, record=points)
+            stats.incr("influx_writes")
             logging.info(f"📤 {len(points)} Messpunkte an InfluxDB gesendet.")
             return True
 
     except Exception as e:
         logging.error(f"❌ Fehler beim Senden an InfluxDB: {e}")
+        stats.incr("influx_failures")
         return False
 
-def flush_queue_to_influx(max_total=5000, batch_size=500):
-    """Älteste Queue-Daten in Batches an Influx senden."""
-    remaining = max_total
-    all_ok = True
-    while remaining > 0:
-        ids, batch = queue_fetch_batch(min(batch_size, remaining))
-        if not ids:
-            break
-        ok = send_to_influx(batch)
-        if ok:
-            queue_delete_ids(ids)
-            remaining -= len(ids)
-        else:
-            all_ok = False
-            break
-    return all_ok
+def send_live(rows: list) -> bool:
+    """
+    Vorrangspur: Punkte des aktuellen Zyklus sofort senden, damit nach einem
+    Wiederverbinden zuerst aktuelle Werte ankommen. Bei Fehler bleiben sie in
+    der Queue und gehen mit dem Rückstand (backlog_drain) hinaus.
+    """
+    if not rows:
+        return True
+    backlog.live_floor = rows[0][0]
+    ok = send_to_influx([entry for _, entry in rows])
+    if ok:
+        try:
+            queue_delete_ids([rid for rid, _ in rows])
+        except sqlite3.Error as e:
+            logging.warning(f"Gesendete Live-Punkte nicht löschbar (werden erneut gesendet): {e}")
+        stats.incr("points_flushed", len(rows))
+        stats.incr("points_live", len(rows))
+    backlog.note_live_result(ok)
+    return ok
+
+
+def _backlog_settings() -> tuple:
+    cfg = config
+    return (bool(cfg.get("INFLUX_ENABLED", True)),
+            float(cfg.get("INFLUX_BACKLOG_MAX_PPS", 2000) or 0),
+            float(cfg.get("INFLUX_BACKLOG_TARGET_LATENCY_S", 2.0) or 2.0))
+
+
+# Rückstand parallel im Hintergrund nachsenden (eigene SQLite-Verbindung)
+backlog = backlog_drain.BacklogDrainer(DB_PATH, send_to_influx, _backlog_settings, stats=stats)
+backlog.start()
 
 # ============================================================
 # 🧮 HAUPTSCHLEIFE
@@ -639,14 +953,46 @@ logging.info("🌊 Starte Mehrkanal-Messung mit Offline-Puffer...")
 if config.get("MQTT_ENABLED") and config.get("MQTT_HOST") and _PAHO_AVAILABLE:
     setup_mqtt_client(config)
 
-_alarm_last_sent = {}    # Rate-Limiting: {alarm_key: timestamp}
-_alarm_fail_counts = {}  # Fehlerzähler pro Kanal
+# Rate-Limiting Sensorausfall {alarm_key: timestamp} und Fehlerzähler pro Kanal –
+# beide aus dem Alarmspeicher wiederhergestellt, damit ein Neustart nichts zurücksetzt
+_alarm_last_sent = alarm_store.last_sent_map()
+_alarm_fail_counts = alarm_store.fail_counts()
+
+
+def _track_sensor_fail(ch_name: str, sensor_name: str, prev_sent):
+    """Persistiert Fehlerzähler, Ausfall-Alarm und Versandzeit nach einem Kanalfehler."""
+    count = _alarm_fail_counts.get(ch_name, 0)
+    key = f"{ch_name}_fail"
+    # Zähler nur bis zur Alarmschwelle schreiben – danach ändert sich am Zustand nichts
+    if count <= alarm_module.SENSOR_FAIL_THRESHOLD:
+        alarm_store.set_fail_count(ch_name, count)
+    if count == alarm_module.SENSOR_FAIL_THRESHOLD:
+        alarm_store.record_event(key, "raised", sensor_name,
+                                 message=f"Sensorausfall: {count} Fehler in Folge")
+    if _alarm_last_sent.get(key) != prev_sent:
+        alarm_store.set_last_sent(key, _alarm_last_sent[key])
+
+
+def _track_sensor_ok(ch_name: str, sensor_name: str):
+    """Setzt den Fehlerzähler zurück und hebt einen aktiven Ausfall-Alarm auf."""
+    prev = _alarm_fail_counts.get(ch_name, 0)
+    alarm_module.reset_sensor_fail(_alarm_fail_counts, ch_name)
+    if prev:
+        alarm_store.set_fail_count(ch_name, 0)
+        if prev >= alarm_module.SENSOR_FAIL_THRESHOLD:
+            alarm_store.record_event(f"{ch_name}_fail", "cleared", sensor_name,
+                                     message="Sensor liefert wieder Messwerte")
+
 
 try:
     while True:
+        cycle_t0 = time.perf_counter()
+        stats.lap()
         reload_config_if_changed()
+        stats.lap("config")
         cfg = config.copy()
         all_data = []
+        alarm_values = {}        # Kanal -> Messwert für die Alarm-Engine
         influx_enabled = cfg.get("INFLUX_ENABLED", True)
         mqtt_enabled   = cfg.get("MQTT_ENABLED", False)
 
@@ -718,17 +1064,26 @@ try:
                     queue_insert(ch_data)
                 all_data.append(ch_data)
 
-                # Alarm-Schwellwerte prüfen
-                alarm_module.check_and_send(cfg, ch_name, level_m if level_m is not None else value,
-                                            sensor_name, unit, _alarm_last_sent)
-                alarm_module.reset_sensor_fail(_alarm_fail_counts, ch_name)
+                alarm_values[ch_name] = level_m if level_m is not None else value
+                _track_sensor_ok(ch_name, sensor_name)
 
             except Exception as e:
                 logging.error(f"❌ Fehler bei Kanal {ch_name}: {e}")
+                fail_name = cfg.get(f"NAME_{ch_name}", ch_name)
+                prev_sent = _alarm_last_sent.get(f"{ch_name}_fail")
                 _alarm_fail_counts, _alarm_last_sent = alarm_module.check_sensor_fail(
-                    cfg, ch_name, cfg.get(f"NAME_{ch_name}", ch_name),
-                    _alarm_fail_counts, _alarm_last_sent
+                    cfg, ch_name, fail_name, _alarm_fail_counts, _alarm_last_sent,
+                    outbox=notification_outbox
                 )
+                _track_sensor_fail(ch_name, fail_name, prev_sent)
+                stats.incr("sensor_errors")
+        stats.lap("adc")
+
+        # 🔒 Verriegelungen sofort nach dem ADC-Scan (vor BMP280, Reed und Netzwerk)
+        if interlock_engine.rules or not _interlocks_adopted:
+            apply_interlocks(alarm_values)
+            stats.lap("interlocks")
+        stats.gauge("interlocks_active", len(interlock_engine.active()))
 
         # BMP280 Barometer einlesen (optional)
         bmp_entry = read_bmp280(config)
@@ -736,6 +1091,8 @@ try:
             if influx_enabled:
                 queue_insert(bmp_entry)
             all_data.append(bmp_entry)
+            alarm_values["BMP280"] = bmp_entry["value"]
+        stats.lap("bmp280")
 
         # Reedkontakt-Zähler einlesen
         try:
@@ -764,37 +1121,106 @@ try:
                 if influx_enabled:
                     queue_insert(reed_entry)
                 all_data.append(reed_entry)
+                alarm_values[f"REED{i}"] = liter_total
         except Exception as e:
             logging.error(f"❌ Fehler beim Lesen der Reedkontakte: {e}")
-
-        # Für Web-GUI letzte Messungen sichern (atomar: temp-Datei → rename)
-        latest_file = os.path.join(BASE_DIR, "data", "latest_measurement.json")
-        tmp_file = latest_file + ".tmp"
+        stats.lap("reed")
+
+        # 🔔 Alarmregeln auswerten (einmal pro Zyklus, auch kanalübergreifend)
+        for rule, event in alarm_engine.evaluate(alarm_values):
+            logging.warning(f"🔔 Alarm {rule.key}: {event}")
+            alarm_store.record_event(rule.key, event, rule.name, rule.last_value,
+                                     rule.message(event)[0])
+            if (alarm_module.notify_rule_event(cfg, rule, event, outbox=notification_outbox)
+                    and event == "raised"):
+                alarm_store.set_last_sent(rule.key, rule.last_sent)
+        stats.lap("alarms")
+
+        # Gepufferte Punkte des Zyklus in einer Transaktion in die Offline-Queue
+        live_rows = []
+        try:
+            live_rows = queue_commit()
+        except sqlite3.Error as e:
+            logging.error(f"❌ Offline-Queue nicht beschreibbar: {e}")
+            conn.rollback()
+            stats.incr("points_dropped", len(_pending_inserts))
+            _pending_inserts.clear()
+
+        # Für Web-GUI letzte Messungen sichern (tmpfs, atomar: temp-Datei → rename)
         try:
-            with open(tmp_file, "w") as f:
-                json.dump(all_data, f, indent=2)
-            os.replace(tmp_file, latest_file)
+            state_store.write_volatile("latest_measurement.json", all_data, indent=2)
         except Exception as e:
             logging.warning(f"Konnte latest_measurement.json nicht schreiben: {e}")
+        stats.lap("snapshot")
 
-        # 🔄 Queue flushen → InfluxDB (nur wenn INFLUX_ENABLED)
+        # 🔄 Aktuellen Zyklus sofort → InfluxDB (Rückstand sendet backlog_drain im Hintergrund)
         if influx_enabled:
-            if flush_queue_to_influx(max_total=5000, batch_size=500):
-                logging.info("✅ Alle gepufferten Messpunkte erfolgreich an InfluxDB gesendet.")
-            else:
+            if not send_live(live_rows):
                 logging.info("📦 Offline: Werte bleiben in der Queue und werden später nachgesendet.")
+            stats.lap("flush")
 
-        # 📡 MQTT publishen (nur wenn MQTT_ENABLED und verbunden)
+        # 🧹 Offline-Queue begrenzen (läuft auch bei deaktiviertem InfluxDB – Altbestand)
+        queue_maintenance(cfg)
+        stats.lap("retention")
+
+        # 📡 MQTT: Zyklus puffern, bei Verbindung veröffentlichen (inkl. Rückstand)
         if mqtt_enabled and _PAHO_AVAILABLE and _mqtt_client:
+            mqtt_buffer.max_cycles = int(cfg.get("MQTT_BUFFER_MAX_CYCLES", 17280))
             publish_to_mqtt(cfg, all_data)
+            for key, value in mqtt_buffer.status().items():
+                stats.gauge(f"mqtt_{key}", value)
+            stats.lap("mqtt")
+
+        # 📊 Zyklusstatistik schreiben (für Systemstatus und /metrics)
+        stats.observe("cycle", (time.perf_counter() - cycle_t0) * 1000.0)
+        stats.gauge("mqtt_connected", bool(_mqtt_connected))
+        stats.gauge("log_records_dropped", log_pipeline.dropped())
+        stats.update_counters(state_store.flash_stats())
+        stats.gauge("process_write_bytes", state_store.process_write_bytes())
+        try:
+            policy = queue_retention.RetentionPolicy(cfg)
+            qs = queue_retention.queue_status(conn)
+            usage = queue_retention.db_usage(conn)
+            stats.gauge("queue_depth", qs["depth"])
+            stats.gauge("queue_downsampled", qs["downsampled"])
+            stats.gauge("queue_oldest_ts", qs["oldest_ts"])
+            stats.gauge("queue_file_bytes", usage["file_bytes"])
+            stats.gauge("queue_used_bytes", usage["used_bytes"])
+            stats.gauge("queue_free_bytes", usage["free_bytes"])
+            stats.gauge("queue_incremental_vacuum", usage["incremental"])
+            stats.gauge("queue_limit_rows", policy.max_rows)
+            stats.gauge("queue_limit_bytes", policy.max_bytes)
+            stats.gauge("queue_limit_age_s", policy.max_age_s)
+            for key, value in backlog.status(qs["depth"]).items():
+                stats.gauge(f"backlog_{key}", value)
+            stats.end_cycle()
+        except Exception as e:
+            logging.warning(f"Konnte logger_stats.json nicht schreiben: {e}")
 
-        time.sleep(float(cfg.get("MESSINTERVAL", MESSINTERVAL)))
+        # 🧹 Leerlauf: freie Seiten der Queue-DB schrittweise zurückgeben (höchstens halbe Pause)
+        interval = float(cfg.get("MESSINTERVAL", MESSINTERVAL))
+        sleep_until = time.monotonic() + interval
+        if _auto_vacuum_ok:
+            try:
+                stats.incr("vacuum_pages", queue_retention.idle_vacuum(conn, time.monotonic() + interval / 2))
+            except sqlite3.Error as e:
+                logging.warning(f"incremental_vacuum fehlgeschlagen: {e}")
+        time.sleep(max(0.0, sleep_until - time.monotonic()))
 
 except KeyboardInterrupt:
     logging.info("🛑 Messung manuell beendet.")
 except Exception as e:
     logging.error(f"❌ Unerwarteter Fehler: {e}")
 finally:
+    backlog.stop()
+    notification_outbox.close()
     _teardown_mqtt_client()
+    mqtt_buffer.close()
     reed_contact.shutdown()
+    alarm_store.close()
+    try:
+        queue_commit()    # noch nicht geschriebene Punkte des letzten Zyklus
+    except sqlite3.Error as e:
+        logging.error(f"❌ Offline-Queue beim Beenden nicht beschreibbar: {e}")
     conn.close()
+    log_pipeline.shutdown()
@@ -1,20 +1,31 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-import os, json, socket, subprocess, functools, time, zipfile, io, re
+import os, json, socket, subprocess, functools, time, zipfile, io, re, uuid, hashlib
 from pathlib import Path
-from threading import Thread
+from threading import Lock, local
 from urllib.parse import urlparse, urljoin
-from flask import Flask, render_template, request, jsonify, redirect, url_for, session, abort, flash, Response, stream_with_context
+from flask import Flask, render_template, request, jsonify, redirect, url_for, session, abort, flash, Response, stream_with_context, g, make_response
 import requests
 from xml.etree import ElementTree as ET
-import mosfet_control
+import output_client
+import output_scheduler
 import alarm as alarm_module
-from datetime import datetime
+import alarm_store
+import outbox
+import cycle_stats
+import metrics
+import log_tail
+import state_store
+import queue_retention
+import http_cache
+import jobs
+import db_backup
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 CONFIG_PATH = os.path.join(BASE_DIR, "config", "config.json")
 LOG_DIR = os.path.join(BASE_DIR, "logs")
+DB_PATH = os.path.join(BASE_DIR, "data", "offline_cache.db")
 SCHEDULE_FILE = os.path.join(BASE_DIR, "config", "output_schedule.json")
 NAMES_FILE = os.path.join(BASE_DIR, "config", "output_names.json")
 TYPES_FILE = os.path.join(BASE_DIR, "config", "output_types.json")
@@ -41,6 +52,10 @@ DEFAULT_CONFIG = {
     "NEXTCLOUD_USER": "",
     "NEXTCLOUD_PASSWORD": "",
     "NEXTCLOUD_PATH": "Brunnen/Backups",
+    # Auto-Backup nach Konfig-Änderungen erst nach so vielen Sekunden Ruhe (eine Sicherung pro Serie)
+    "BACKUP_DEBOUNCE_S": 30,
+    # Datenbank-Schnappschüsse (offline_cache.db) auf der Nextcloud behalten
+    "DB_BACKUP_KEEP": 7,
     # MQTT Broker
     "MQTT_ENABLED": False,
     "MQTT_HOST": "",
@@ -51,6 +66,11 @@ DEFAULT_CONFIG = {
     "MQTT_TLS_CA_CERT": "",
     "MQTT_TOPIC_PREFIX": "brunnen",
     "MQTT_QOS": 1,
+    "MQTT_MAX_INFLIGHT": 20,          # gleichzeitig unbestätigte Nachrichten (paho)
+    "MQTT_REPLAY_MSGS_PER_S": 50,     # Nachsenden nach Broker-Ausfall
+    "MQTT_BUFFER_MAX_CYCLES": 17280,  # Puffer-Obergrenze in Messzyklen (1 Tag bei 5 s)
+    "MQTT_PAYLOAD_MODE": "channel",   # channel / batch / both (siehe mqtt_codec.py)
+    "MQTT_BATCH_ENCODING": "json",    # json / zlib / struct
     # InfluxDB explizit ein-/ausschalten
     "INFLUX_ENABLED": True,
     # SMTP / Email-Alarmierung
@@ -70,11 +90,41 @@ DEFAULT_CONFIG = {
     "ALARM_A2_MAX_EN": False, "ALARM_A2_MAX": 0.0,
     "ALARM_A3_MIN_EN": False, "ALARM_A3_MIN": 0.0,
     "ALARM_A3_MAX_EN": False, "ALARM_A3_MAX": 0.0,
+    # Hysterese, Haltezeit [s] und Änderungsrate [Einheit/h] pro Kanal
+    "ALARM_A0_HYST": 0.0, "ALARM_A0_HOLD_S": 120.0, "ALARM_A0_RATE_EN": False, "ALARM_A0_RATE": -0.5,
+    "ALARM_A1_HYST": 0.0, "ALARM_A1_HOLD_S": 120.0, "ALARM_A1_RATE_EN": False, "ALARM_A1_RATE": -0.5,
+    "ALARM_A2_HYST": 0.0, "ALARM_A2_HOLD_S": 120.0, "ALARM_A2_RATE_EN": False, "ALARM_A2_RATE": -0.5,
+    "ALARM_A3_HYST": 0.0, "ALARM_A3_HOLD_S": 120.0, "ALARM_A3_RATE_EN": False, "ALARM_A3_RATE": -0.5,
+    "ALARM_RATE_WINDOW_S": 600,
+    "ALARM_CLEAR_NOTIFY_EN": True,
     "ALARM_SENSOR_FAIL_EN": False,
+    # Weitere Zustellkanäle (Outbox)
+    "NOTIFY_WEBHOOK_EN": False,
+    "NOTIFY_WEBHOOK_URL": "",
+    "NOTIFY_WEBHOOK_TOKEN": "",
+    "NOTIFY_MQTT_EN": False,
     "ALARM_OUTPUT_CHANGES_EN": False,
     "BMP280_ENABLED": True,
     "BMP280_ADDRESS": 0x76,
     "NAME_BMP280": "Barometer",
+    # Prometheus /metrics (ohne Login, nur für diese Adressen/Netze, z.B. VPN)
+    "METRICS_ENABLED": True,
+    "METRICS_ALLOW": "127.0.0.1, ::1, 10.8.0.0/24",
+    # Maschinenzugriff (z.B. fleet_status.py): "Authorization: Bearer <API_TOKEN>" für lesende /api/-Aufrufe
+    "API_TOKEN": "",
+    # SD-Karte schonen: gebündeltes Persistieren aus dem tmpfs
+    "FLASH_WRITE_BUDGET_KB_H": 512,
+    "STATE_PERSIST_INTERVAL_S": 300,
+    # Offline-Queue begrenzen (0 = keine Grenze), alte Daten verdichten statt verwerfen
+    "QUEUE_MAX_ROWS": 1000000,
+    "QUEUE_MAX_MB": 256,
+    "QUEUE_MAX_AGE_DAYS": 60,
+    "QUEUE_DOWNSAMPLE": True,
+    "QUEUE_DOWNSAMPLE_AFTER_H": 24,
+    "QUEUE_DOWNSAMPLE_INTERVAL_S": 300,
+    # Nachsenden des Rückstands (Hintergrund): Punkte/s-Grenze und Ziel-Schreiblatenz
+    "INFLUX_BACKLOG_MAX_PPS": 2000,
+    "INFLUX_BACKLOG_TARGET_LATENCY_S": 2.0,
 }
 
 # Kanal-spezifische Defaults generieren
@@ -121,6 +171,97 @@ app = Flask(__name__, template_folder="templates", static_folder="static")
 import secrets as _secrets
 app.config["SECRET_KEY"] = os.environ.get("WEBAPP_SECRET", _secrets.token_hex(32))
 
+# Request-Latenzen pro Worker (für /metrics)
+_request_metrics = metrics.RequestMetrics(state_store.volatile_path("web_metrics"))
+
+@app.before_request
+def _metrics_start():
+    g._t0 = time.perf_counter()
+
+@app.after_request
+def _metrics_observe(response):
+    t0 = g.get("_t0")
+    if t0 is not None:
+        route = request.url_rule.rule if request.url_rule else "<unbekannt>"
+        _request_metrics.observe(route, request.method, response.status_code, time.perf_counter() - t0)
+    return response
+
+# Bedingte Abrufe (ETag/304) und Kompression – siehe http_cache.py
+_body_cache = http_cache.BodyCache()
+STATIC_MAX_AGE_S = 365 * 86400            # statische Dateien mit ?v=<version> ändern sich nie
+app.config["SEND_FILE_MAX_AGE_DEFAULT"] = 86400
+
+@app.url_defaults
+def _static_version(endpoint, values):
+    """url_for('static', ...) hängt eine Dateiversion an – neue Datei, neue URL."""
+    if endpoint == "static" and "filename" in values and "v" not in values:
+        path = os.path.join(app.static_folder, values["filename"])
+        values["v"] = http_cache.make_etag(http_cache.file_version(path))[:8]
+
+def versioned(version_fn):
+    """Antwort hängt nur von version_fn() ab (z.B. mtime der Quelldateien): passender ETag → 304
+    ohne Aufruf der View, gleiche Version → Antwort aus dem Cache statt neu lesen und serialisieren."""
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapped(*args, **kwargs):
+            version = version_fn()
+            key = request.endpoint + "?" + request.query_string.decode("latin-1")
+            g._cache_key, g._cache_version = key, version
+            g._etag = http_cache.make_etag(key, version)
+            if any(request.if_none_match.contains(t) for t in http_cache.variants(g._etag)):
+                return Response(status=304)
+            cached = _body_cache.get(key, version)
+            if cached is not None:
+                return Response(cached[0], mimetype=cached[1])
+            resp = make_response(view(*args, **kwargs))
+            if resp.status_code == 200 and not resp.is_streamed:
+                _body_cache.put(key, version, resp.get_data(), resp.mimetype)
+            return resp
+        return wrapped
+    return decorator
+
+@app.after_request
+def _http_cache(response):
+    """ETag, 304 und gzip/brotli für GET-Antworten (JSON, Seiten); statische Dateien lange cachen."""
+    if request.method not in ("GET", "HEAD"):
+        return response
+    if request.endpoint == "static":
+        if request.args.get("v"):
+            response.headers["Cache-Control"] = f"public, max-age={STATIC_MAX_AGE_S}, immutable"
+        return response
+    if response.status_code not in (200, 304) or response.direct_passthrough or response.is_streamed \
+            or response.headers.get("Content-Encoding"):
+        return response
+    if response.status_code == 200 and response.mimetype not in http_cache.COMPRESSIBLE:
+        return response
+
+    body = response.get_data() if response.status_code == 200 else b""
+    tag = g.get("_etag") or http_cache.make_etag(body)
+    cache_control = response.headers.get("Cache-Control") or "private, no-cache"
+    matched = next((t for t in http_cache.variants(tag) if request.if_none_match.contains(t)), None)
+    if matched:
+        not_modified = Response(status=304)
+        not_modified.set_etag(matched)
+        not_modified.headers["Cache-Control"] = cache_control
+        not_modified.vary.add("Accept-Encoding")
+        return not_modified
+    if response.status_code != 200:
+        return response
+
+    encoding = http_cache.negotiate(request.accept_encodings) if len(body) >= http_cache.MIN_COMPRESS_BYTES else None
+    if encoding:
+        if g.get("_cache_key"):
+            data = _body_cache.compressed(g._cache_key, g._cache_version, body, encoding)
+        else:
+            data = http_cache.compress(body, encoding)
+        response.set_data(data)
+        response.headers["Content-Encoding"] = encoding
+        tag += http_cache.SUFFIXES[encoding]
+    response.set_etag(tag)
+    response.headers["Cache-Control"] = cache_control
+    response.vary.add("Accept-Encoding")
+    return response
+
 @app.context_processor
 def inject_globals():
     cfg = load_config()
@@ -217,8 +358,31 @@ def save_config(cfg: dict):
     _write_json_atomic(CONFIG_PATH, cfg)
 
 # ===== Nextcloud / WebDAV Backup =====
-_BACKUP_FILES = ["config.json", "output_schedule.json", "output_names.json"]
+_BACKUP_FILES = ["config.json", "output_schedule.json", "output_names.json", "alarm_rules.json",
+                 "interlocks.json"]
 _MAX_BACKUPS = 100
+_BACKUP_STATE_FILE = os.path.join(BASE_DIR, "data", "backup_state.json")
+
+# Ein Keep-Alive-Verbindungspool für alle WebDAV-Aufrufe, darüber eine Session pro Thread
+# (requests.Session ist nicht thread-sicher, Backup-Jobs laufen parallel);
+# bestätigte Ordner pro Prozess merken (kein MKCOL je Upload)
+_webdav_adapter = None
+_webdav_lock = Lock()
+_webdav_local = local()
+_webdav_folders_ok = set()
+
+def _webdav():
+    global _webdav_adapter
+    session = getattr(_webdav_local, "session", None)
+    if session is None:
+        with _webdav_lock:
+            if _webdav_adapter is None:
+                _webdav_adapter = requests.adapters.HTTPAdapter(pool_connections=2, pool_maxsize=4)
+        session = requests.Session()
+        session.mount("https://", _webdav_adapter)
+        session.mount("http://", _webdav_adapter)
+        _webdav_local.session = session
+    return session
 
 def _webdav_url(cfg, filename=""):
     base = cfg.get("NEXTCLOUD_URL", "").rstrip("/")
@@ -242,9 +406,10 @@ def _ensure_webdav_folders(cfg) -> tuple:
     for i in range(1, len(parts) + 1):
         partial = "/".join(parts[:i])
         url = f"{base}/remote.php/dav/files/{user}/{partial}"
-        r = requests.request("MKCOL", url, auth=auth, timeout=15)
+        r = _webdav().request("MKCOL", url, auth=auth, timeout=15)
         if r.status_code not in (201, 405):  # 201=erstellt, 405=existiert bereits
             return False, f"Ordner '{partial}' konnte nicht angelegt werden (HTTP {r.status_code})"
+    _webdav_folders_ok.add(_webdav_url(cfg))
     return True, "OK"
 
 def _backup_prefix(cfg) -> str:
@@ -253,38 +418,76 @@ def _backup_prefix(cfg) -> str:
     safe = "".join(c if c.isalnum() or c in "-_." else "_" for c in device_id)
     return safe
 
-def create_backup_zip() -> bytes:
-    buf = io.BytesIO()
+def _read_backup_files() -> list:
+    """[(name, inhalt)] der vorhandenen Config-Dateien – einmal gelesen für ZIP und Hash."""
     config_dir = os.path.join(BASE_DIR, "config")
+    files = []
+    for fname in _BACKUP_FILES:
+        fpath = os.path.join(config_dir, fname)
+        if os.path.exists(fpath):
+            with open(fpath, "rb") as f:
+                files.append((fname, f.read()))
+    return files
+
+def create_backup_zip(files: list = None) -> bytes:
+    buf = io.BytesIO()
     with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as zf:
-        for fname in _BACKUP_FILES:
-            fpath = os.path.join(config_dir, fname)
-            if os.path.exists(fpath):
-                zf.write(fpath, fname)
+        for fname, content in (files if files is not None else _read_backup_files()):
+            zf.writestr(fname, content)
     buf.seek(0)
     return buf.read()
 
-def backup_to_nextcloud(cfg) -> tuple:
-    """Lädt alle Config-Dateien als ZIP auf Nextcloud hoch. Gibt (ok, message) zurück."""
+def _backup_hash(cfg, files: list) -> str:
+    """Inhalt der Dateien + Ziel – gleicher Hash → nichts Neues zu sichern (ZIP-Zeitstempel zählen nicht)."""
+    h = hashlib.sha256(_webdav_url(cfg).encode())
+    for fname, content in files:
+        h.update(fname.encode() + b"\0" + content + b"\0")
+    return h.hexdigest()
+
+def _load_backup_state() -> dict:
     try:
-        auth = _webdav_auth(cfg)
+        with open(_BACKUP_STATE_FILE) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
 
-        # Ordner rekursiv anlegen (behebt HTTP 409 bei mehrstufigen Pfaden)
-        ok, msg = _ensure_webdav_folders(cfg)
-        if not ok:
-            return False, msg
+def backup_to_nextcloud(cfg, skip_unchanged: bool = False) -> tuple:
+    """Lädt alle Config-Dateien als ZIP auf Nextcloud hoch. Gibt (ok, message) zurück.
+    skip_unchanged: nichts hochladen, wenn der Inhalt dem letzten Upload entspricht (Auto-Backup)."""
+    try:
+        auth = _webdav_auth(cfg)
+        files = _read_backup_files()
+        digest = _backup_hash(cfg, files)
+        state = _load_backup_state()
+        if skip_unchanged and state.get("hash") == digest:
+            return True, f"unverändert seit {state.get('file', 'dem letzten Backup')} – übersprungen"
+
+        # Ordner rekursiv anlegen (behebt HTTP 409 bei mehrstufigen Pfaden) – einmal pro Prozess
+        if _webdav_url(cfg) not in _webdav_folders_ok:
+            ok, msg = _ensure_webdav_folders(cfg)
+            if not ok:
+                return False, msg
 
         # ZIP mit DEVICE_ID-Präfix erstellen und hochladen
-        zip_bytes = create_backup_zip()
+        zip_bytes = create_backup_zip(files)
         prefix = _backup_prefix(cfg)
         ts = time.strftime("%Y-%m-%d_%H-%M-%S")
         filename = f"{prefix}_backup_{ts}.zip"
         put_url = _webdav_url(cfg, filename)
 
-        r = requests.put(put_url, data=zip_bytes, auth=auth,
-                         headers={"Content-Type": "application/zip"}, timeout=30)
+        r = _webdav().put(put_url, data=zip_bytes, auth=auth,
+                          headers={"Content-Type": "application/zip"}, timeout=30)
+        if r.status_code in (404, 409):
+            # Ordner inzwischen gelöscht → neu anlegen und einmal wiederholen
+            _webdav_folders_ok.discard(_webdav_url(cfg))
+            ok, msg = _ensure_webdav_folders(cfg)
+            if not ok:
+                return False, msg
+            r = _webdav().put(put_url, data=zip_bytes, auth=auth,
+                              headers={"Content-Type": "application/zip"}, timeout=30)
         if r.status_code not in (200, 201, 204):
             return False, f"Upload fehlgeschlagen (HTTP {r.status_code})"
+        _write_json_atomic(_BACKUP_STATE_FILE, {"hash": digest, "file": filename, "ts": time.time()})
 
         # Alte Backups bereinigen (max. _MAX_BACKUPS)
         _cleanup_old_backups(cfg)
@@ -298,42 +501,57 @@ def backup_to_nextcloud(cfg) -> tuple:
         return False, str(e)
 
 def list_backups_from_nextcloud(cfg) -> list:
-    """Gibt die Backups des aktuellen Geräts zurück (gefiltert nach DEVICE_ID-Präfix)."""
+    """Gibt die Backups des aktuellen Geräts zurück (gefiltert nach DEVICE_ID-Präfix).
+    Wirft RuntimeError, wenn die Liste nicht abgerufen werden kann – ein Fehler ist keine leere Liste."""
+    auth = _webdav_auth(cfg)
+    folder_url = _webdav_url(cfg) + "/"
+    headers = {"Depth": "1", "Content-Type": "application/xml"}
+    body = '<?xml version="1.0"?><d:propfind xmlns:d="DAV:"><d:prop><d:displayname/><d:getlastmodified/><d:getcontentlength/></d:prop></d:propfind>'
+    try:
+        r = _webdav().request("PROPFIND", folder_url, headers=headers, data=body, auth=auth, timeout=15)
+    except requests.exceptions.ConnectionError:
+        raise RuntimeError("Verbindung fehlgeschlagen – Server nicht erreichbar.")
+    except requests.exceptions.Timeout:
+        raise RuntimeError("Zeitüberschreitung beim Abruf der Backup-Liste.")
+    if r.status_code == 404:
+        return []    # Ordner noch nicht angelegt → noch kein Backup
+    if r.status_code != 207:
+        raise RuntimeError(f"Backup-Liste fehlgeschlagen (HTTP {r.status_code})")
+    ns = {"d": "DAV:"}
     try:
-        auth = _webdav_auth(cfg)
-        folder_url = _webdav_url(cfg) + "/"
-        headers = {"Depth": "1", "Content-Type": "application/xml"}
-        body = '<?xml version="1.0"?><d:propfind xmlns:d="DAV:"><d:prop><d:displayname/><d:getlastmodified/><d:getcontentlength/></d:prop></d:propfind>'
-        r = requests.request("PROPFIND", folder_url, headers=headers, data=body, auth=auth, timeout=15)
-        if r.status_code != 207:
-            return []
-        ns = {"d": "DAV:"}
         tree = ET.fromstring(r.text)
-        prefix = _backup_prefix(cfg)
-        results = []
-        for resp in tree.findall("d:response", ns):
-            href = resp.findtext("d:href", namespaces=ns) or ""
-            name = href.split("/")[-1]
-            if not name.endswith(".zip") or not name.startswith(prefix):
-                continue
-            props = resp.find("d:propstat/d:prop", ns) or resp
-            date = props.findtext("d:getlastmodified", namespaces=ns) or ""
-            size = props.findtext("d:getcontentlength", namespaces=ns) or "0"
-            results.append({"name": name, "date": date, "size": int(size)})
-        results.sort(key=lambda x: x["name"], reverse=True)
-        return results
-    except Exception:
-        return []
+    except ET.ParseError as e:
+        raise RuntimeError(f"Ungültige WebDAV-Antwort: {e}")
+    prefix = _backup_prefix(cfg)
+    results = []
+    for resp in tree.findall("d:response", ns):
+        href = resp.findtext("d:href", namespaces=ns) or ""
+        name = href.split("/")[-1]
+        if not name.endswith(".zip") or not name.startswith(prefix):
+            continue
+        props = resp.find("d:propstat/d:prop", ns) or resp
+        date = props.findtext("d:getlastmodified", namespaces=ns) or ""
+        size = props.findtext("d:getcontentlength", namespaces=ns) or "0"
+        results.append({"name": name, "date": date, "size": int(size)})
+    results.sort(key=lambda x: x["name"], reverse=True)
+    return results
+
+def _backup_list_key(cfg) -> str:
+    """Job-/Cache-Schlüssel der Backup-Liste: gilt nur für dieses Ziel (URL, Benutzer, Pfad) und Gerät."""
+    return f"backup_list:{_webdav_url(cfg)}:{_backup_prefix(cfg)}"
 
 def _cleanup_old_backups(cfg):
     """Löscht die ältesten Backups dieses Geräts wenn mehr als _MAX_BACKUPS vorhanden sind."""
-    backups = list_backups_from_nextcloud(cfg)
+    try:
+        backups = list_backups_from_nextcloud(cfg)
+    except RuntimeError:
+        return    # Aufräumen ist optional, der Upload war erfolgreich
     if len(backups) <= _MAX_BACKUPS:
         return
     auth = _webdav_auth(cfg)
     for old in backups[_MAX_BACKUPS:]:
         try:
-            requests.delete(_webdav_url(cfg, old["name"]), auth=auth, timeout=10)
+            _webdav().delete(_webdav_url(cfg, old["name"]), auth=auth, timeout=10)
         except Exception:
             pass
 
@@ -345,7 +563,7 @@ def restore_from_nextcloud(cfg, filename) -> tuple:
     try:
         auth = _webdav_auth(cfg)
         get_url = _webdav_url(cfg, filename)
-        r = requests.get(get_url, auth=auth, timeout=30)
+        r = _webdav().get(get_url, auth=auth, timeout=30)
         if r.status_code != 200:
             return False, f"Download fehlgeschlagen (HTTP {r.status_code})"
 
@@ -364,43 +582,13 @@ def restore_from_nextcloud(cfg, filename) -> tuple:
     except Exception as e:
         return False, str(e)
 
-def _auto_backup(cfg):
-    """Wird im Hintergrund-Thread nach jeder Konfig-Änderung aufgerufen."""
+def _auto_backup():
+    """Nach einer Serie von Konfig-Änderungen (Debouncer): ein Backup-Job, nur bei geändertem Inhalt."""
+    cfg = load_config()
     if _nextcloud_configured(cfg):
-        backup_to_nextcloud(cfg)
+        _jobs.submit("backup_auto", _run_backup, cfg, True, key="backup_run")
 
-
-def _log_output_to_influx(channel: int, state: bool, cfg=None):
-    """Schreibt ein Output-Schaltevent nach InfluxDB (Hintergrund-Thread)."""
-    if cfg is None:
-        cfg = load_config()
-    if not cfg.get("INFLUX_URL") or not cfg.get("INFLUX_TOKEN"):
-        return
-    try:
-        from influxdb_client import InfluxDBClient, Point
-        from influxdb_client.client.write_api import SYNCHRONOUS
-        names = load_names()
-        ch_name = names.get(str(channel), f"Kanal {channel + 1}")
-        device_id = cfg.get("DEVICE_ID", socket.gethostname())
-        with InfluxDBClient(url=cfg["INFLUX_URL"], token=cfg["INFLUX_TOKEN"],
-                            org=cfg.get("INFLUX_ORG", "")) as client:
-            write_api = client.write_api(write_options=SYNCHRONOUS)
-            p = (Point("digital_output")
-                 .tag("device_id", device_id)
-                 .tag("location", cfg.get("LOCATION", ""))
-                 .tag("channel", str(channel))
-                 .tag("name", ch_name)
-                 .field("state", 1 if state else 0)
-                 .field("state_text", "EIN" if state else "AUS"))
-            write_api.write(bucket=cfg["INFLUX_BUCKET"], record=p)
-        # Optional: Alarm bei Output-Schaltung
-        if cfg.get("ALARM_OUTPUT_CHANGES_EN") and alarm_module.smtp_configured(cfg):
-            subject = f"[BrunnenWeb] Ausgang {ch_name} {'EIN' if state else 'AUS'}"
-            body = (f"Ausgang {channel + 1} ({ch_name}) wurde geschaltet: "
-                    f"{'EIN' if state else 'AUS'}")
-            alarm_module.send_alarm_email(cfg, subject, body)
-    except Exception as e:
-        app.logger.warning(f"InfluxDB Output-Log Fehler: {e}")
+_auto_backup_debouncer = jobs.Debouncer(_auto_backup)
 
 
 def validate_config(cfg: dict):
@@ -417,6 +605,35 @@ def validate_config(cfg: dict):
             errors.append("BMP280_ADDRESS muss 0x76 oder 0x77 sein.")
     except Exception:
         errors.append("BMP280_ADDRESS ist ungültig.")
+
+    for key in ("QUEUE_MAX_ROWS", "QUEUE_MAX_MB", "QUEUE_MAX_AGE_DAYS", "QUEUE_DOWNSAMPLE_AFTER_H"):
+        try:
+            if float(cfg.get(key, 0) or 0) < 0:
+                errors.append(f"{key} darf nicht negativ sein.")
+        except Exception:
+            errors.append(f"{key} ist ungültig.")
+    try:
+        if float(cfg.get("QUEUE_DOWNSAMPLE_INTERVAL_S", 300)) < 1:
+            errors.append("QUEUE_DOWNSAMPLE_INTERVAL_S muss >= 1 sein.")
+    except Exception:
+        errors.append("QUEUE_DOWNSAMPLE_INTERVAL_S ist ungültig.")
+    try:
+        if float(cfg.get("BACKUP_DEBOUNCE_S", 30)) < 0:
+            errors.append("BACKUP_DEBOUNCE_S darf nicht negativ sein.")
+    except Exception:
+        errors.append("BACKUP_DEBOUNCE_S ist ungültig.")
+    try:
+        if int(cfg.get("DB_BACKUP_KEEP", 7)) < 1:
+            errors.append("DB_BACKUP_KEEP muss >= 1 sein.")
+    except Exception:
+        errors.append("DB_BACKUP_KEEP ist ungültig.")
+    token = str(cfg.get("API_TOKEN", "") or "")
+    if token and len(token) < 16:
+        errors.append("API_TOKEN muss mindestens 16 Zeichen lang sein.")
+    if str(cfg.get("MQTT_PAYLOAD_MODE", "channel")).lower() not in ("channel", "batch", "both"):
+        errors.append("MQTT_PAYLOAD_MODE muss channel, batch oder both sein.")
+    if str(cfg.get("MQTT_BATCH_ENCODING", "json")).lower() not in ("json", "zlib", "struct"):
+        errors.append("MQTT_BATCH_ENCODING muss json, zlib oder struct sein.")
     return errors
 
 def signal_config_update():
@@ -450,7 +667,7 @@ def service_status(name="brunnen.service"):
 
 def tail_file(path, lines=200):
     try:
-        return subprocess.check_output(["tail", "-n", str(lines), path]).decode(errors="ignore")
+        return "\n".join(log_tail.tail(path, lines)[0])
     except Exception as e:
         return f"(Kein Zugriff auf {path} – {e})"
 
@@ -484,10 +701,21 @@ def _is_safe_url(target: str) -> bool:
     test = urlparse(urljoin(request.host_url, target))
     return test.scheme in ("http", "https") and ref.netloc == test.netloc
 
+def _api_token_ok() -> bool:
+    """Bearer-Token statt Session – nur lesende Aufrufe unter /api/."""
+    if request.method != "GET" or not request.path.startswith("/api/"):
+        return False
+    auth = request.headers.get("Authorization", "")
+    if not auth.startswith("Bearer "):
+        return False
+    token = str(load_config().get("API_TOKEN", "") or "")
+    return bool(token) and _secrets.compare_digest(auth[7:].strip().encode(), token.encode())
+
+
 def login_required(view):
     @functools.wraps(view)
     def wrapped(*args, **kwargs):
-        if session.get("auth_ok"):
+        if session.get("auth_ok") or _api_token_ok():
             return view(*args, **kwargs)
         return redirect(url_for("login", next=request.path))
     return wrapped
@@ -519,6 +747,28 @@ def logout():
     session.clear()
     return redirect(url_for("login"))
 
+# ===== Hintergrund-Jobs =====
+# Langsame Subprozess-/Netzwerkarbeit läuft im Pool (jobs.py); der Browser fragt /jobs/<id> ab.
+_jobs = jobs.JobRunner(state_store.volatile_path("jobs"), max_workers=2)
+
+def _job_response(job: dict):
+    """202 mit dem Job; ein fertiges Ergebnis aus dem Cache kommt gleich mit 200."""
+    return jsonify({"success": True, "job": job}), (202 if job["status"] in jobs.ACTIVE else 200)
+
+@app.route("/jobs")
+@login_required
+def jobs_list():
+    return jsonify(_jobs.list())
+
+@app.route("/jobs/<job_id>")
+@login_required
+def job_status(job_id):
+    """Status, Fortschritt und (wenn fertig) Ergebnis eines Jobs."""
+    job = _jobs.get(job_id)
+    if job is None:
+        return jsonify({"success": False, "message": "❌ Job nicht gefunden."}), 404
+    return jsonify(job)
+
 # ===== Pages =====
 @app.route("/")
 @login_required
@@ -576,7 +826,9 @@ def update_config():
                        "REED_1_NAME", "REED_2_NAME",
                        "NEXTCLOUD_URL", "NEXTCLOUD_USER", "NEXTCLOUD_PASSWORD", "NEXTCLOUD_PATH",
                        "SMTP_HOST", "SMTP_USER", "SMTP_PASSWORD", "SMTP_FROM", "SMTP_TO",
+                       "NOTIFY_WEBHOOK_URL", "NOTIFY_WEBHOOK_TOKEN", "API_TOKEN",
                        "MQTT_HOST", "MQTT_USER", "MQTT_PASSWORD", "MQTT_TLS_CA_CERT", "MQTT_TOPIC_PREFIX",
+                       "MQTT_PAYLOAD_MODE", "MQTT_BATCH_ENCODING",
                        "INFLUX_URL", "INFLUX_TOKEN", "INFLUX_ORG", "INFLUX_BUCKET"]
         bool_keys = set(
             [k for k in cfg.keys() if k.endswith("_ENABLED") or k.endswith("_EN") or k.endswith("_TLS")]
@@ -604,7 +856,7 @@ def update_config():
             return jsonify({"success": False, "message": "; ".join(errors)}), 400
 
         save_config(cfg)
-        Thread(target=_auto_backup, args=(cfg,), daemon=True).start()
+        _auto_backup_debouncer.trigger(float(cfg.get("BACKUP_DEBOUNCE_S", 30)))
 
         if signal_config_update():
             return jsonify({"success": True, "message": "✅ Änderungen gespeichert und aktiv im Messsystem."})
@@ -645,44 +897,165 @@ def outputs_types():
 @app.route("/outputs/set/<int:channel>/<int:state>", methods=["POST"])
 @login_required
 def set_output(channel, state):
-    mosfet_control.set_output(channel, bool(state))
-    Thread(target=_log_output_to_influx, args=(channel, bool(state)), daemon=True).start()
+    try:
+        output_client.set_output(channel, bool(state), source="web")
+    except output_client.OutputLockedError as e:
+        return jsonify({"success": False, "message": f"🔒 {e}"}), 409
+    except output_client.OutputServiceError as e:
+        return jsonify({"success": False, "message": f"❌ {e}"}), 503
     return jsonify({"success": True, "message": f"Kanal {channel+1} {'AN' if state else 'AUS'}"})
 
+@app.route("/outputs/set", methods=["POST"])
+@login_required
+def set_outputs_bulk():
+    """
+    Schaltet mehrere Kanäle gleichzeitig (ein group_write im Ausgangsdienst).
+    JSON: {"outputs": {"0": 1, "3": 0}}  oder Formular: ch_0=1&ch_3=0
+    """
+    if request.is_json:
+        raw = (request.get_json(silent=True) or {}).get("outputs") or {}
+    else:
+        raw = {k[3:]: v for k, v in request.form.items() if k.startswith("ch_")}
+    try:
+        changes = {int(k): str(v).strip().lower() in ("1", "true", "on") for k, v in raw.items()}
+    except (TypeError, ValueError, AttributeError):
+        return jsonify({"success": False, "message": "❌ Ungültige Kanalangabe"}), 400
+    if not changes:
+        return jsonify({"success": False, "message": "❌ Keine Kanäle angegeben"}), 400
+    try:
+        state = output_client.set_outputs(changes, source="web")
+    except output_client.OutputLockedError as e:
+        return jsonify({"success": False, "message": f"🔒 {e}"}), 409
+    except output_client.OutputServiceError as e:
+        return jsonify({"success": False, "message": f"❌ {e}"}), 503
+    summary = ", ".join(f"Kanal {i + 1} {'AN' if v else 'AUS'}" for i, v in sorted(changes.items()))
+    return jsonify({"success": True, "message": summary,
+                    "state": [state[i] for i in sorted(state)]})
+
 @app.route("/outputs/state")
 @login_required
 def outputs_state():
-    state_dict = mosfet_control.get_state() or {}
-    # Sicherstellen, dass wir etwas zurückgeben
-    if not state_dict:
-        state_dict = {i: False for i in range(8)}
+    try:
+        state_dict = output_client.get_state()
+    except output_client.OutputServiceError as e:
+        return jsonify({"success": False, "message": f"❌ {e}"}), 503
     ordered = [state_dict.get(i, False) for i in sorted(state_dict.keys())]
     return jsonify(ordered)
 
+
+@app.route("/outputs/locks")
+@login_required
+def outputs_locks():
+    """Aktive Verriegelungen {"<kanal>": [grund, ...]} (gesetzt vom Logger)."""
+    try:
+        return jsonify(output_client.get_locks())
+    except output_client.OutputServiceError as e:
+        return jsonify({"success": False, "message": f"❌ {e}"}), 503
+
+
+# Jeder offene Stream belegt einen Gunicorn-Thread (2 Worker × 4 Threads) – deshalb begrenzt;
+# der Browser verbindet nach `retry` neu, das erste Ereignis ist wieder der Gesamtzustand.
+OUTPUTS_STREAM_MAX_S = 60
+SSE_RETRY_MS = 2000
+
+@app.route("/outputs/stream")
+@login_required
+def outputs_stream():
+    """Leitet Zustandsänderungen des Ausgangsdienstes als SSE an den Browser weiter."""
+    def generate():
+        yield f"retry: {SSE_RETRY_MS}\n\n"
+        started = time.monotonic()
+        events = output_client.subscribe()
+        try:
+            for event in events:
+                if event.get("event") == "ping":
+                    yield ": ping\n\n"
+                else:
+                    yield f"data: {json.dumps(event)}\n\n"
+                if time.monotonic() - started >= OUTPUTS_STREAM_MAX_S:
+                    break           # spätestens mit dem nächsten Ping (15 s)
+        except output_client.OutputServiceError as e:
+            yield f"event: error\ndata: {json.dumps({'message': str(e)})}\n\n"
+        finally:
+            events.close()          # Abo-Socket zum Ausgangsdienst schließen
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+def _notify_schedule_changed():
+    """Weckt den Zeitplan-Thread des Ausgangsdienstes (optional)."""
+    try:
+        output_client.reload_schedule()
+    except output_client.OutputServiceError as e:
+        app.logger.warning(f"Zeitplan-Reload nicht zugestellt: {e}")
+
     
 @app.route("/outputs/schedule", methods=["GET", "POST", "DELETE"])
 @login_required
 def outputs_schedule():
     """GET = Liste aller Zeitpläne, POST = neuen hinzufügen, DELETE = löschen"""
     if request.method == "GET":
-        return jsonify(load_schedule())
+        data = load_schedule()
+        try:
+            next_runs = output_client.schedule_status()["next_runs"]
+        except output_client.OutputServiceError:
+            next_runs = {}
+        for job in data:
+            job["id"] = output_scheduler.job_id(job)
+            job["next_run"] = next_runs.get(job["id"])
+        return jsonify(data)
 
     if request.method == "POST":
+        form = request.form
         job = {
-            "channel": int(request.form["channel"]),
-            "time": request.form["time"],
-            "state": int(request.form["state"]),
+            "id": uuid.uuid4().hex[:8],
+            "channel": int(form["channel"]),
+            "state": int(form["state"]),
         }
+        mode = form.get("mode", "daily")
+        if mode == "cron":
+            job["cron"] = form.get("cron", "").strip()
+        elif mode == "interval":
+            job["every_min"] = form.get("every_min", "")
+            job["from"] = form.get("from") or "00:00"
+            job["until"] = form.get("until") or "23:59"
+        else:
+            job["time"] = form.get("time", "")
+        days = form.getlist("days")
+        if days and mode != "cron" and len(days) < 7:
+            job["days"] = days
+        if form.get("duration_min"):
+            job["duration_min"] = form["duration_min"]
+        if form.get("catch_up") == "0":
+            job["catch_up"] = False
+
+        ok, msg = output_scheduler.validate_job(job)
+        if not ok:
+            return jsonify({"success": False, "message": f"❌ {msg}"}), 400
+        if "every_min" in job:
+            job["every_min"] = int(job["every_min"])
+        if "duration_min" in job:
+            job["duration_min"] = float(job["duration_min"])
         data = load_schedule()
         data.append(job)
         save_schedule(data)
+        _notify_schedule_changed()
         return jsonify({"success": True, "message": "✅ Zeitplan gespeichert"})
 
     if request.method == "DELETE":
+        job_id = request.args.get("id")
         ch = request.args.get("channel")
         t = request.args.get("time")
-        data = [j for j in load_schedule() if not (str(j["channel"]) == ch and j["time"] == t)]
+        if job_id:
+            data = [j for j in load_schedule() if output_scheduler.job_id(j) != job_id]
+        else:
+            data = [j for j in load_schedule() if not (str(j["channel"]) == ch and j.get("time") == t)]
         save_schedule(data)
+        _notify_schedule_changed()
         return jsonify({"success": True, "message": "🗑️ Zeitplan gelöscht"})
 
 
@@ -701,6 +1074,7 @@ def service_action():
 
     valid_services = {
         "logger": "brunnen_logger.service",
+        "outputs": "brunnen_outputs.service",
         "web": "brunnen_web.service"
     }
 
@@ -726,31 +1100,30 @@ def service_action():
                 "message": "🔄 WebApp wird neu gestartet. Bitte warte ein paar Sekunden und lade neu."
             })
 
-        # 🔄 Neustart ausführen
-        result = subprocess.run(
-            ["sudo", "/bin/systemctl", "restart", service_name],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-            check=False
-        )
-        time.sleep(3)
-        st = service_status(service_name)
-
-        if result.returncode == 0:
-            return jsonify({
-                "status": "ok",
-                "message": f"✅ {service_name} erfolgreich neu gestartet ({st})"
-            })
-        else:
-            return jsonify({
-                "status": "error",
-                "message": f"❌ Fehler: {result.stderr.strip() or result.stdout.strip()}"
-            }), 500
+        # 🔄 Neustart als Hintergrund-Job (gleichzeitige Klicks → derselbe Job)
+        return _job_response(_jobs.submit("service_restart", _restart_service, service_name,
+                                          key=f"restart:{service_name}"))
 
     except Exception as e:
         return jsonify({"status": "error", "message": f"❌ Unerwarteter Fehler: {e}"}), 500
 
+def _restart_service(progress, service_name: str) -> dict:
+    progress(10, f"{service_name} wird neu gestartet …")
+    result = subprocess.run(
+        ["sudo", "/bin/systemctl", "restart", service_name],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+        check=False
+    )
+    progress(60, "Warte auf Dienststatus …")
+    time.sleep(3)
+    st = service_status(service_name)
+
+    if result.returncode == 0:
+        return {"status": "ok", "message": f"✅ {service_name} erfolgreich neu gestartet ({st})"}
+    return {"status": "error", "message": f"❌ Fehler: {result.stderr.strip() or result.stdout.strip()}"}
+
 @app.route("/update-system/stream")
 @login_required
 def update_system_stream():
@@ -788,29 +1161,86 @@ def update_system_stream():
     )
 
 
+# wählbare Logs
+LOG_FILES = {
+    "Service": os.path.join(LOG_DIR, "webapp.err.log"),
+    "Logger": os.path.join(LOG_DIR, "logger.err.log"),
+    "Messlog": os.path.join(LOG_DIR, "wasserstand.log"),
+    "Ausgänge": os.path.join(LOG_DIR, "outputs.err.log"),
+}
+LOG_STREAM_POLL_S = 1.0
+LOG_STREAM_MAX_S = 60       # danach neu verbinden (Browser setzt per Last-Event-ID fort)
+                            # – ein offener Stream belegt so lange einen Gunicorn-Thread
+
 @app.route("/logs")
 @login_required
 def logs_page():
-    # wählbare Logs
-    files = {
-        "Service": os.path.join(LOG_DIR, "webapp.err.log"),
-        "Logger": os.path.join(LOG_DIR, "logger.err.log")
-        #"Webapp": os.path.join(LOG_DIR, "webapp.log")
-    }
     cfg = load_config()
     current_level = str(cfg.get("LOG_LEVEL", "ERROR")).upper()
-    chosen = request.args.get("file","Service")
-    path = files.get(chosen, list(files.values())[0])
-    content = tail_file(path, lines=30)
+    chosen = request.args.get("file", "Service")
+    if chosen not in LOG_FILES:
+        chosen = "Service"
+    content = tail_file(LOG_FILES[chosen], lines=30)
     return render_template(
         "logs.html",
-        files=list(files.keys()),
+        files=list(LOG_FILES.keys()),
         chosen=chosen,
         content=content,
         current_level=current_level,
         title="Logs"
     )
 
+@app.route("/logs/stream")
+@login_required
+def logs_stream():
+    """
+    SSE: zuerst die letzten `lines` passenden Zeilen, danach nur neu angehängte.
+    Filter (level, q = Regex) werden serverseitig angewendet; die Event-ID ist
+    der Byte-Cursor, ein Reconnect setzt dort fort.
+    """
+    path = LOG_FILES.get(request.args.get("file", "Service"))
+    if not path:
+        return jsonify({"success": False, "message": "❌ Unbekannte Logdatei."}), 404
+    try:
+        line_filter = log_tail.LineFilter(request.args.get("level", ""), request.args.get("q", ""))
+    except re.error as e:
+        return jsonify({"success": False, "message": f"❌ Ungültiger Suchausdruck: {e}"}), 400
+    lines = min(max(request.args.get("lines", 200, type=int), 1), 2000)
+    resume = log_tail.parse_cursor(request.headers.get("Last-Event-ID", ""))
+
+    def event(payload: dict, cursor) -> str:
+        return f"id: {log_tail.format_cursor(cursor)}\ndata: {json.dumps(payload)}\n\n"
+
+    def generate():
+        yield f"retry: {SSE_RETRY_MS}\n\n"
+        cursor = resume
+        if cursor is None:
+            try:
+                initial, cursor = log_tail.tail(path, lines, line_filter)
+            except OSError as e:
+                yield f"event: error\ndata: {json.dumps({'message': f'Kein Zugriff auf {path}: {e}'})}\n\n"
+                return
+            yield event({"lines": initial, "reset": True}, cursor)
+        started = last_sent = time.monotonic()
+        while time.monotonic() - started < LOG_STREAM_MAX_S:
+            time.sleep(LOG_STREAM_POLL_S)
+            try:
+                new, cursor, rotated = log_tail.follow(path, cursor, line_filter)
+            except OSError:
+                continue    # Datei kurzzeitig weg (Rotation) – beim nächsten Mal erneut
+            if new or rotated:
+                yield event({"lines": new, "rotated": rotated}, cursor)
+                last_sent = time.monotonic()
+            elif time.monotonic() - last_sent >= 15:
+                yield ": ping\n\n"
+                last_sent = time.monotonic()
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.route("/logs/level", methods=["POST"])
 @login_required
 def set_log_level():
@@ -861,8 +1291,8 @@ def db_config_page():
 @app.route("/measurements")
 @login_required
 def measurements_page():
-    # Pfad zur temporären Datei, die der Logger schreiben soll
-    data_file = os.path.join(BASE_DIR, "data", "latest_measurement.json")
+    # Datei im tmpfs, die der Logger jeden Zyklus schreibt
+    data_file = state_store.volatile_path("latest_measurement.json")
     data = {
         "timestamp": "-",
         "voltage_V": 0,
@@ -880,11 +1310,19 @@ def measurements_page():
             data["timestamp"] = f"Fehler beim Lesen: {e}"
     return render_template("measurements.html", data=data, title="Aktuelle Messwerte")
 
+def _measurements_version() -> str:
+    return http_cache.file_version(state_store.volatile_path("latest_measurement.json"))
+
+def _reed_version() -> str:
+    return http_cache.file_version(state_store.volatile_path("reed_counts.json"),
+                                   os.path.join(BASE_DIR, "data", "reed_counts.json"), CONFIG_PATH)
+
 # API-Endpunkt für AJAX-Abfragen
 @app.route("/api/measurements")
 @login_required
+@versioned(_measurements_version)
 def measurements_api():
-    data_file = os.path.join(BASE_DIR, "data", "latest_measurement.json")
+    data_file = state_store.volatile_path("latest_measurement.json")
     if os.path.exists(data_file):
         try:
             with open(data_file, "r") as f:
@@ -896,7 +1334,7 @@ def measurements_api():
 
 
 def load_latest_measurements():
-    data_file = os.path.join(BASE_DIR, "data", "latest_measurement.json")
+    data_file = state_store.volatile_path("latest_measurement.json")
     if not os.path.exists(data_file):
         return []
     try:
@@ -906,13 +1344,45 @@ def load_latest_measurements():
     except Exception:
         return []
 
-def get_bmp280_entry():
-    measurements = load_latest_measurements()
+def _find_bmp280(measurements: list):
     for entry in measurements:
         if entry.get("channel") == "BMP280" or str(entry.get("type","")).upper() == "PRESSURE":
             return entry
     return None
 
+def get_bmp280_entry():
+    return dashboard_snapshot()["barometer"]
+
+
+# Messwerte, Barometer und Zähler aus einem Durchgang – pro Datenversion einmal gelesen und geparst
+_dashboard_cache = {"version": None, "data": None}
+_dashboard_lock = Lock()
+
+def _dashboard_version() -> str:
+    return _measurements_version() + "|" + _reed_version()
+
+def dashboard_snapshot() -> dict:
+    version = _dashboard_version()
+    with _dashboard_lock:
+        if _dashboard_cache["version"] == version:
+            return _dashboard_cache["data"]
+    measurements = load_latest_measurements()
+    data = {
+        "measurements": measurements,
+        "barometer": _find_bmp280(measurements),
+        "reed": _reed_status(load_config()),
+    }
+    with _dashboard_lock:
+        _dashboard_cache.update(version=version, data=data)
+    return data
+
+@app.route("/api/dashboard")
+@login_required
+@versioned(_dashboard_version)
+def dashboard_api():
+    """Messwerte-Seite: alle drei Ansichten in einer Antwort statt drei paralleler Abrufe."""
+    return jsonify(dashboard_snapshot())
+
 
 @app.route("/barometer")
 @login_required
@@ -922,6 +1392,7 @@ def barometer_page():
 
 @app.route("/api/barometer")
 @login_required
+@versioned(_measurements_version)
 def barometer_api():
     entry = get_bmp280_entry()
     if entry:
@@ -937,16 +1408,17 @@ def reed_page():
 
 @app.route("/api/reed")
 @login_required
+@versioned(_reed_version)
 def reed_api():
-    cfg = load_config()
-    counts_file = os.path.join(BASE_DIR, "data", "reed_counts.json")
-    counts = {}
-    if os.path.exists(counts_file):
-        try:
-            with open(counts_file) as f:
-                counts = {int(k): int(v) for k, v in json.load(f).items()}
-        except Exception:
-            pass
+    return jsonify(dashboard_snapshot()["reed"])
+
+def _reed_status(cfg: dict) -> list:
+    # Aktueller Stand aus dem tmpfs, nach einem Reboot die Fassung auf der SD-Karte
+    raw = state_store.read_json("reed_counts.json", os.path.join(BASE_DIR, "data", "reed_counts.json"), {})
+    try:
+        counts = {int(k): int(v) for k, v in raw.items()}
+    except (AttributeError, TypeError, ValueError):
+        counts = {}
     result = []
     for i, gpio in enumerate([25, 27], 1):
         count = counts.get(gpio, 0)
@@ -958,7 +1430,7 @@ def reed_api():
             "liter": round(count * liter_pro_impuls, 2),
             "liter_pro_impuls": liter_pro_impuls,
         })
-    return jsonify(result)
+    return result
 
 @app.route("/reed/reset/<int:gpio>", methods=["POST"])
 @login_required
@@ -971,6 +1443,61 @@ def reed_reset(gpio):
 
 # Systemstatus
 
+@app.route("/api/stats")
+@login_required
+def stats_api():
+    """Zyklus-Laufzeiten und Zähler des Loggers (+ Ereignis-Writer des Ausgangsdienstes)."""
+    data = cycle_stats.load(state_store.volatile_path("logger_stats.json"))
+    if data:
+        interval = float(load_config().get("MESSINTERVAL", 5))
+        data["age_s"] = round(time.time() - data.get("updated", 0), 1)
+        data["stale"] = data["age_s"] > max(3 * interval, 30)
+        data["queue_health"] = queue_retention.health(data.get("gauges", {}))
+    try:
+        data["outputs"] = output_client.request("stats", timeout=1.0).get("events", {})
+    except output_client.OutputServiceError:
+        data["outputs"] = None
+    return jsonify(data)
+
+
+def _metrics_client_ip() -> str:
+    """Hinter nginx (Verbindung von 127.0.0.1) zählt X-Real-IP, sonst die Peer-Adresse."""
+    peer = request.remote_addr or ""
+    if peer in ("127.0.0.1", "::1"):
+        return request.headers.get("X-Real-IP", peer).strip()
+    return peer
+
+
+@app.route("/metrics")
+def metrics_endpoint():
+    """Prometheus/OpenMetrics – ohne Login, aber nur aus METRICS_ALLOW erreichbar."""
+    cfg = load_config()
+    if not cfg.get("METRICS_ENABLED", True):
+        abort(404)
+    if not metrics.ip_allowed(_metrics_client_ip(), metrics.parse_networks(cfg.get("METRICS_ALLOW", ""))):
+        abort(403)
+
+    logger_stats = cycle_stats.load(state_store.volatile_path("logger_stats.json"))
+    if logger_stats:
+        interval = float(cfg.get("MESSINTERVAL", 5))
+        logger_stats["stale"] = time.time() - logger_stats.get("updated", 0) > max(3 * interval, 30)
+    try:
+        resp = output_client.request("get_state", timeout=1.0)
+        outputs = {"state": resp.get("state", []), "locks": resp.get("locks", {}),
+                   "events": output_client.request("stats", timeout=1.0).get("events", {})}
+    except output_client.OutputServiceError:
+        outputs = None
+    store = alarm_store.AlarmStore(DB_PATH)
+    try:
+        alarms = store.list_states()
+    finally:
+        store.close()
+
+    body = metrics.render(cfg.get("DEVICE_ID", socket.gethostname()), logger_stats, outputs,
+                          alarms, _reed_status(cfg), _request_metrics.collect())
+    return Response(body, content_type="application/openmetrics-text; version=1.0.0; charset=utf-8")
+
+
 @app.route("/systemstatus")
 @login_required
 def systemstatus_page():
@@ -1110,8 +1637,13 @@ def wifi_configure():
 @app.route("/wifi/scan")
 @login_required
 def wifi_scan():
+    """Startet einen WLAN-Scan als Job; ein Ergebnis jünger als 20 s wird wiederverwendet."""
+    return _job_response(_jobs.submit("wifi_scan", _scan_wifi, cache_s=20))
+
+def _scan_wifi(progress) -> dict:
     """Scannt WLAN-Netzwerke via nmcli und gibt die Liste zurück."""
     networks = []
+    progress(10, "Suche Netzwerke …")
     try:
         subprocess.run(
             ["sudo", "-n", "nmcli", "device", "wifi", "rescan"],
@@ -1121,6 +1653,7 @@ def wifi_scan():
     except Exception:
         pass  # Rescan optional – Fehler ignorieren
 
+    progress(70, "Lese Ergebnis …")
     try:
         result = subprocess.check_output(
             ["nmcli", "-t", "-f", "SSID,SIGNAL", "dev", "wifi"],
@@ -1137,9 +1670,9 @@ def wifi_scan():
                 seen.add(ssid)
                 networks.append({"ssid": ssid, "signal": signal_part.strip()})
     except Exception as e:
-        return jsonify({"error": str(e), "networks": []})
+        return {"error": str(e), "networks": []}
 
-    return jsonify({"networks": networks})
+    return {"networks": networks}
 
 
 
@@ -1165,8 +1698,8 @@ def backup_test():
     try:
         auth = _webdav_auth(cfg)
         folder_url = _webdav_url(cfg) + "/"
-        r = requests.request("PROPFIND", folder_url, auth=auth,
-                             headers={"Depth": "0"}, timeout=10)
+        r = _webdav().request("PROPFIND", folder_url, auth=auth,
+                              headers={"Depth": "0"}, timeout=10)
         if r.status_code in (207, 404):
             return jsonify({"success": True, "message": "✅ Verbindung erfolgreich."})
         if r.status_code == 401:
@@ -1185,10 +1718,30 @@ def backup_run():
     cfg = load_config()
     if not _nextcloud_configured(cfg):
         return jsonify({"success": False, "message": "❌ Nextcloud nicht konfiguriert."})
-    ok, msg = backup_to_nextcloud(cfg)
+    return _job_response(_jobs.submit("backup_run", _run_backup, cfg))
+
+def _run_backup(progress, cfg: dict, skip_unchanged: bool = False) -> dict:
+    progress(10, "Backup wird hochgeladen …")
+    ok, msg = backup_to_nextcloud(cfg, skip_unchanged)
+    _jobs.invalidate(_backup_list_key(cfg))
     if ok:
-        return jsonify({"success": True, "message": f"✅ Backup erstellt: {msg}"})
-    return jsonify({"success": False, "message": f"❌ {msg}"}), 500
+        return {"success": True, "message": f"✅ Backup erstellt: {msg}"}
+    return {"success": False, "message": f"❌ {msg}"}
+
+@app.route("/backup/db", methods=["POST"])
+@login_required
+def backup_db():
+    cfg = load_config()
+    if not _nextcloud_configured(cfg):
+        return jsonify({"success": False, "message": "❌ Nextcloud nicht konfiguriert."})
+    return _job_response(_jobs.submit("backup_db", _run_db_backup, cfg))
+
+def _run_db_backup(progress, cfg: dict) -> dict:
+    # Schnappschuss im WAL-Modus blockiert den Logger nicht; Abbrüche setzt der nächste Lauf fort
+    ok, msg = db_backup.run(cfg, DB_PATH, session=_webdav(), progress=progress)
+    if ok:
+        return {"success": True, "message": f"✅ Datenbank gesichert: {msg}"}
+    return {"success": False, "message": f"❌ {msg}"}
 
 @app.route("/backup/list")
 @login_required
@@ -1196,8 +1749,9 @@ def backup_list():
     cfg = load_config()
     if not _nextcloud_configured(cfg):
         return jsonify([])
-    backups = list_backups_from_nextcloud(cfg)
-    return jsonify(backups)
+    # Liste bleibt gecacht, bis ein Backup hochgeladen wurde (_run_backup invalidiert)
+    return _job_response(_jobs.submit("backup_list", lambda progress: list_backups_from_nextcloud(cfg),
+                                      key=_backup_list_key(cfg), cache_s=600))
 
 @app.route("/backup/restore", methods=["POST"])
 @login_required
@@ -1228,6 +1782,10 @@ def alerts_page():
             "min_val": cfg.get(f"ALARM_{ch}_MIN", 0.0),
             "max_en": cfg.get(f"ALARM_{ch}_MAX_EN", False),
             "max_val": cfg.get(f"ALARM_{ch}_MAX", 0.0),
+            "hyst": cfg.get(f"ALARM_{ch}_HYST", 0.0),
+            "hold_s": cfg.get(f"ALARM_{ch}_HOLD_S", alarm_module.DEFAULT_HOLD_S),
+            "rate_en": cfg.get(f"ALARM_{ch}_RATE_EN", False),
+            "rate_val": cfg.get(f"ALARM_{ch}_RATE", -0.5),
         })
     smtp_cfg = {k: cfg.get(k, v) for k, v in {
         "SMTP_HOST": "", "SMTP_PORT": 587, "SMTP_USER": "",
@@ -1236,8 +1794,65 @@ def alerts_page():
     return render_template("alerts.html", smtp_cfg=smtp_cfg, channels=channels,
                            alarm_sensor_fail=cfg.get("ALARM_SENSOR_FAIL_EN", False),
                            alarm_output=cfg.get("ALARM_OUTPUT_CHANGES_EN", False),
+                           alarm_clear_notify=cfg.get("ALARM_CLEAR_NOTIFY_EN", True),
+                           notify_cfg={k: cfg.get(k, v) for k, v in {
+                               "NOTIFY_WEBHOOK_EN": False, "NOTIFY_WEBHOOK_URL": "",
+                               "NOTIFY_WEBHOOK_TOKEN": "", "NOTIFY_MQTT_EN": False}.items()},
+                           rate_window_s=cfg.get("ALARM_RATE_WINDOW_S", 600),
                            title="Alarme")
 
+@app.route("/api/alarms")
+@login_required
+def alarms_api():
+    """Aktive Alarme aus dem persistenten Alarmspeicher (kein Log-Scan)."""
+    store = alarm_store.AlarmStore(DB_PATH)
+    try:
+        return jsonify(store.list_active())
+    finally:
+        store.close()
+
+@app.route("/api/alarms/events")
+@login_required
+def alarm_events_api():
+    limit = min(max(request.args.get("limit", 100, type=int), 1), 1000)
+    store = alarm_store.AlarmStore(DB_PATH)
+    try:
+        return jsonify(store.list_events(limit))
+    finally:
+        store.close()
+
+@app.route("/api/alarms/<path:key>/ack", methods=["POST"])
+@login_required
+def alarm_ack(key):
+    store = alarm_store.AlarmStore(DB_PATH)
+    try:
+        ok = store.acknowledge(key)
+    finally:
+        store.close()
+    if ok:
+        return jsonify({"success": True, "message": "✅ Alarm quittiert."})
+    return jsonify({"success": False, "message": "❌ Alarm ist nicht aktiv oder bereits quittiert."}), 404
+
+@app.route("/api/alarms/outbox")
+@login_required
+def alarm_outbox_api():
+    """Zustellstatus der Outbox pro Kanal inkl. Dead-Letter-Einträgen."""
+    box = outbox.Outbox(DB_PATH)
+    try:
+        return jsonify({"channels": box.stats(), "dead": box.dead_letters()})
+    finally:
+        box.close()
+
+@app.route("/api/alarms/outbox/retry", methods=["POST"])
+@login_required
+def alarm_outbox_retry():
+    box = outbox.Outbox(DB_PATH)
+    try:
+        n = box.retry_dead()
+    finally:
+        box.close()
+    return jsonify({"success": True, "message": f"🔁 {n} Meldung(en) erneut eingeplant."})
+
 @app.route("/alerts/test", methods=["POST"])
 @login_required
 def alerts_test():
@@ -1254,6 +1869,91 @@ def alerts_test():
     return jsonify({"success": False, "message": f"❌ {msg}"}), 500
 
 
+# ===== Maschinen-API (v1) =====
+# Für Integrationen (SCADA, Leitstand): zustandslos per Bearer-Token, ein Abruf pro Intervall.
+# ETag/304 und Kompression übernimmt _http_cache() wie für alle GET-Antworten.
+
+def api_token_required(view):
+    """Wie login_required, aber ohne Umleitung: 401 + WWW-Authenticate für Maschinen-Clients."""
+    @functools.wraps(view)
+    def wrapped(*args, **kwargs):
+        if _api_token_ok() or session.get("auth_ok"):
+            return view(*args, **kwargs)
+        resp = jsonify({"success": False, "message": "❌ Token fehlt oder ist ungültig."})
+        resp.status_code = 401
+        resp.headers["WWW-Authenticate"] = 'Bearer realm="brunnen"'
+        return resp
+    return wrapped
+
+_snapshot_store = None
+_snapshot_store_lock = Lock()
+
+def _snapshot_alarm_store() -> alarm_store.AlarmStore:
+    """Eine lesende Verbindung pro Worker statt zwei neuer Verbindungen pro Abruf."""
+    global _snapshot_store
+    with _snapshot_store_lock:
+        if _snapshot_store is None:
+            _snapshot_store = alarm_store.AlarmStore(DB_PATH)
+        return _snapshot_store
+
+def _logger_stale(cfg: dict, updated: float) -> bool:
+    return time.time() - updated > max(3 * float(cfg.get("MESSINTERVAL", 5)), 30)
+
+def _api_snapshot_version() -> str:
+    """Version aus den Quellen des Snapshots: Dateien (mtime), Alarmspeicher und Ausgangszustand.
+    Die Antwort des Ausgangsdienstes wird für die View in g abgelegt (ein Socket-Aufruf pro Abruf)."""
+    stats_path = state_store.volatile_path("logger_stats.json")
+    try:
+        resp = output_client.request("get_state", timeout=1.0)
+        outputs = json.dumps([resp.get("state"), resp.get("locks")], sort_keys=True)
+    except output_client.OutputServiceError:
+        resp, outputs = None, "-"
+    g._output_state = resp
+    try:
+        stale = _logger_stale(load_config(), os.stat(stats_path).st_mtime)
+    except OSError:
+        stale = None
+    return "|".join([_dashboard_version(), http_cache.file_version(stats_path, NAMES_FILE),
+                     str(stale), _snapshot_alarm_store().version(), outputs])
+
+def _api_snapshot(cfg: dict, output_state) -> dict:
+    """Gesamtzustand: Messwerte, Zähler, Ausgänge, Alarme. Ohne Abrufzeit, damit der ETag nur
+    wechselt, wenn sich die Daten ändern."""
+    logger_stats = cycle_stats.load(state_store.volatile_path("logger_stats.json"))
+    logger = None
+    if logger_stats:
+        updated = logger_stats.get("updated", 0)
+        logger = {"updated": updated,
+                  "stale": _logger_stale(cfg, updated),
+                  "queue_depth": logger_stats.get("gauges", {}).get("queue_depth")}
+    outputs = None
+    if output_state is not None:
+        names = load_names()
+        outputs = [{"channel": i, "name": names.get(str(i), f"Kanal {i+1}"), "state": bool(v),
+                    "locks": output_state.get("locks", {}).get(str(i), [])}
+                   for i, v in enumerate(output_state.get("state", []))]
+    store = _snapshot_alarm_store()
+    alarms = {"active": store.list_active(), "states": store.list_states()}
+    dashboard = dashboard_snapshot()
+    return {
+        "api_version": 1,
+        "device_id": cfg.get("DEVICE_ID", socket.gethostname()),
+        "location": cfg.get("LOCATION", ""),
+        "measurements": dashboard["measurements"],
+        "counters": dashboard["reed"],
+        "outputs": outputs,
+        "alarms": alarms,
+        "logger": logger,
+    }
+
+@app.route("/api/v1/snapshot")
+@api_token_required
+@versioned(_api_snapshot_version)
+def api_v1_snapshot():
+    """Alle Sensoren, Zähler, Ausgänge und Alarmzustände in einer Antwort."""
+    return jsonify(_api_snapshot(load_config(), g.get("_output_state")))
+
+
 # ─── Certificate Management ────────────────────────────────────────────────
 
 def _get_cert_info() -> dict:
@@ -1303,9 +2003,13 @@ def certificates_page():
 @app.route("/certificates/generate", methods=["POST"])
 @login_required
 def certificates_generate():
+    cn = request.form.get("cn", "").strip() or "brunnen"
+    return _job_response(_jobs.submit("cert_generate", _generate_certificate, cn))
+
+def _generate_certificate(progress, cn: str) -> dict:
     try:
         os.makedirs(CERT_DIR, exist_ok=True)
-        cn = request.form.get("cn", "").strip() or "brunnen"
+        progress(10, "Erzeuge Schlüssel und Zertifikat …")
         subprocess.check_call(
             ["openssl", "req", "-x509", "-nodes", "-days", "3650",
              "-newkey", "rsa:2048",
@@ -1316,10 +2020,11 @@ def certificates_generate():
         )
         os.chmod(KEY_FILE, 0o640)
         os.chmod(CERT_FILE, 0o644)
+        progress(80, "Lade nginx neu …")
         _reload_nginx()
-        return jsonify({"success": True, "message": "Selbstsigniertes Zertifikat erfolgreich erstellt."})
+        return {"success": True, "message": "Selbstsigniertes Zertifikat erfolgreich erstellt."}
     except Exception as e:
-        return jsonify({"success": False, "message": str(e)}), 500
+        return {"success": False, "message": str(e)}
 
 
 @app.route("/certificates/upload", methods=["POST"])
@@ -1381,31 +2086,6 @@ def certificates_upload():
         return jsonify({"success": False, "message": str(e)}), 500
 
 
-def scheduler_loop():
-    last_fired = set()  # {"HH:MM:ch:state"} — prevents double-firing within same minute
-    while True:
-        try:
-            now = datetime.now().strftime("%H:%M")
-            schedule = load_schedule()
-            fired_this_minute = set()
-            for job in schedule:
-                key = f"{job['time']}:{job['channel']}:{job['state']}"
-                if job["time"] == now and key not in last_fired:
-                    fired_this_minute.add(key)
-                    try:
-                        mosfet_control.set_output(job["channel"], job["state"])
-                        Thread(target=_log_output_to_influx,
-                               args=(job["channel"], bool(job["state"])), daemon=True).start()
-                    except Exception as e:
-                        app.logger.error(f"Scheduler: Fehler bei Kanal {job.get('channel')}: {e}")
-            last_fired = fired_this_minute
-        except Exception as e:
-            app.logger.error(f"Scheduler-Loop Fehler: {e}")
-        time.sleep(30)
-
-Thread(target=scheduler_loop, daemon=True).start()
-
-
 # Start
 if __name__ == "__main__":
     # läuft auf 127.0.0.1:8080